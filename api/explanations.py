@@ -0,0 +1,200 @@
+"""
+Per-prediction feature contributions (TreeSHAP)
+
+tree_shap computes exact path-dependent SHAP values for the numpy
+TreeEnsemble, the same quantity as XGBoost's predict(pred_contribs=True):
+one contribution per feature in log-odds (margin) space plus a bias
+column, summing to the model's margin for each row. A row's values for a
+tree depend only on which way it goes at each of the tree's splits, so
+rows are first grouped by that branch pattern and the recursion (every
+node once, all patterns processed together as arrays) runs per distinct
+pattern, not per row.
+
+The API input space is a closed grid, so each model version explains the
+whole grid once (when the model is loaded, unless EXPLAIN_WARMUP=0 defers
+it to the first explained request; other processes serving the version
+load the result from the grid cache) and every explained response is then
+a lookup; see Explainer. One-hot columns are summed into the column they
+encode, so a scenario's explanation names road_type or speed_limit rather
+than road_type_6.
+"""
+import threading
+
+import numpy as np
+
+# Contributions returned per prediction, largest magnitude first
+TOP_CONTRIBUTIONS = 5
+
+
+def _extend(path, zero, one, feature):
+    """Path with one more split: (features, zero fractions, one fractions, weights)"""
+    features, zeros, ones, weights = path
+    depth = len(features)
+    weights = [w.copy() for w in weights]
+    weights.append(np.full_like(one, 1.0 if depth == 0 else 0.0))
+    for i in range(depth - 1, -1, -1):
+        weights[i + 1] += one * weights[i] * ((i + 1) / (depth + 1))
+        weights[i] = zero * weights[i] * ((depth - i) / (depth + 1))
+    return features + [feature], zeros + [zero], ones + [one], weights
+
+
+def _unwind(path, index):
+    """Path with the split at index removed"""
+    features, zeros, ones, weights = path
+    one, zero = ones[index], zeros[index]
+    depth = len(features) - 1
+    hot = one != 0
+    safe_one = np.where(hot, one, 1.0)
+    weights = [w.copy() for w in weights]
+    next_one = weights[depth]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(depth - 1, -1, -1):
+            from_hot = next_one * (depth + 1) / ((i + 1) * safe_one)
+            from_cold = weights[i] * (depth + 1) / (zero * (depth - i))
+            next_one = np.where(hot, weights[i] - from_hot * zero * ((depth - i) / (depth + 1)), next_one)
+            weights[i] = np.where(hot, from_hot, from_cold)
+    keep = [i for i in range(depth + 1) if i != index]
+    return [features[i] for i in keep], [zeros[i] for i in keep], [ones[i] for i in keep], weights[:depth]
+
+
+def _unwound_sum(path, index):
+    """Sum of the path weights with the split at index unwound"""
+    _, zeros, ones, weights = path
+    one, zero = ones[index], zeros[index]
+    depth = len(weights) - 1
+    hot = one != 0
+    safe_one = np.where(hot, one, 1.0)
+    next_one = weights[depth]
+    total = np.zeros_like(next_one)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(depth - 1, -1, -1):
+            from_hot = next_one * (depth + 1) / ((i + 1) * safe_one)
+            from_cold = (weights[i] / zero) / ((depth - i) / (depth + 1))
+            total += np.where(hot, from_hot, from_cold)
+            next_one = np.where(hot, weights[i] - from_hot * zero * ((depth - i) / (depth + 1)), next_one)
+    return total
+
+
+def _branches(tree, X):
+    """(n_rows, n_nodes) flags of whether each row goes left at each split (False at leaves)"""
+    left, _, split_index, split_condition, default_left, _ = tree
+    x = X[:, split_index]
+    go_left = np.where(np.isnan(x), default_left, x < split_condition)
+    return go_left & (left >= 0)
+
+
+def _tree_shap(tree, X, phi):
+    """Add one tree's SHAP values for the rows of X to phi (n_rows, n_features)"""
+    left, right, split_index, split_condition, _, cover = tree
+    # One representative row per branch pattern; its values are shared by the group
+    branches = _branches(tree, X)
+    _, first, inverse = np.unique(np.packbits(branches, axis=1), axis=0, return_index=True, return_inverse=True)
+    branches = branches[first]
+    unique_phi = np.zeros((len(first), phi.shape[1]))
+
+    def recurse(node, path, zero, one, feature):
+        path = _extend(path, zero, one, feature)
+        features, zeros, ones, _ = path
+        if left[node] < 0:
+            # Leaf: credit every split feature on the path
+            for i in range(1, len(features)):
+                weight = _unwound_sum(path, i)
+                unique_phi[:, features[i]] += weight * (ones[i] - zeros[i]) * split_condition[node]
+            return
+        split = split_index[node]
+        go_left = branches[:, node]
+        incoming_zero, incoming_one = 1.0, np.ones(len(first))
+        if split in features:
+            # A repeated feature replaces its earlier split on the path
+            k = features.index(split)
+            incoming_zero, incoming_one = zeros[k], ones[k]
+            path = _unwind(path, k)
+        recurse(left[node], path, incoming_zero * cover[left[node]] / cover[node], incoming_one * go_left, split)
+        recurse(right[node], path, incoming_zero * cover[right[node]] / cover[node], incoming_one * ~go_left, split)
+
+    recurse(0, ([], [], [], []), 1.0, np.ones(len(first)), -1)
+    phi += unique_phi[inverse.ravel()]
+
+
+def _expected_value(tree):
+    """Cover-weighted mean leaf value of a tree (its output with no features known)"""
+    left, _, _, split_condition, _, cover = tree
+    leaves = left < 0
+    return float((split_condition[leaves] * cover[leaves]).sum() / cover[0])
+
+
+def tree_shap(trees, base_margin, X):
+    """
+    SHAP values of a tree ensemble as (n_rows, n_features + 1), the last
+    column being the bias; trees are (left, right, split_index,
+    split_condition, default_left, cover) node arrays per tree
+    """
+    X = np.asarray(X, dtype=np.float32)
+    phi = np.zeros((len(X), X.shape[1] + 1))
+    for tree in trees:
+        _tree_shap(tree, X, phi[:, :-1])
+    phi[:, -1] = float(base_margin) + sum(_expected_value(tree) for tree in trees)
+    return phi
+
+
+def model_contributions(model, X):
+    """Feature contributions plus bias for an XGBClassifier or TreeEnsemble"""
+    if hasattr(model, 'get_booster'):
+        import xgboost as xgb
+        return model.get_booster().predict(xgb.DMatrix(X), pred_contribs=True)
+    return model.predict_contributions(X)
+
+
+def feature_groups(feature_names, categorical_cols):
+    """(group names, (n_features, n_groups) 0/1 matrix) mapping one-hot columns to their source column"""
+    names, columns = [], []
+    for feature in feature_names:
+        source = next((col for col in categorical_cols if feature.startswith(col + '_')), feature)
+        if source not in names:
+            names.append(source)
+        columns.append(names.index(source))
+    groups = np.zeros((len(feature_names), len(names)))
+    groups[np.arange(len(feature_names)), columns] = 1.0
+    return names, groups
+
+
+class Explainer:
+    """
+    Contributions for every cell of the API input grid, computed once per model
+    grid_features(): the encoded grid in grid order (called on first use)
+    contributions: previously computed contributions of the same model, if any
+    """
+
+    def __init__(self, model, feature_pipeline, grid_features, contributions=None):
+        self.model = model
+        self.group_names, self._groups = feature_groups(feature_pipeline.feature_names,
+                                                        feature_pipeline.categorical_cols)
+        self._grid_features = grid_features
+        self._contributions = contributions
+        self._lock = threading.Lock()
+
+    @property
+    def contributions(self):
+        """(n_cells, n_groups + 1) contributions per source column plus the bias, in log-odds"""
+        if self._contributions is None:
+            with self._lock:
+                if self._contributions is None:
+                    phi = np.asarray(model_contributions(self.model, self._grid_features()), dtype=np.float64)
+                    self._contributions = np.column_stack([phi[:, :-1] @ self._groups, phi[:, -1]])
+        return self._contributions
+
+    def explain(self, cells, top=TOP_CONTRIBUTIONS):
+        """Explanation payloads for grid cell indices, decoded once per distinct cell"""
+        contributions = self.contributions
+        decoded = {}
+        for cell in np.unique(cells).tolist():
+            row = contributions[cell]
+            order = np.argsort(-np.abs(row[:-1]), kind='stable')[:top]
+            decoded[cell] = {
+                "base_value": round(float(row[-1]), 6),
+                "contributions": [
+                    {"feature": self.group_names[i], "value": round(float(row[i]), 6)}
+                    for i in order if row[i] != 0
+                ],
+            }
+        return [decoded[cell] for cell in np.asarray(cells).tolist()]
@@ -0,0 +1,257 @@
+"""
+Versioned model registry with background hot-swapping
+
+The API serves a default model (MODEL_PATH, else best_model.* in the
+project root) plus every versioned artifact in MODEL_REGISTRY_DIR
+(default models/): best_model_vNNN.joblib from incremental.py, or its
+.meta.json export. Each artifact is loaded into a ServedModel, checked
+against the API's feature contract (pipeline columns, feature names,
+model input width, label classes) and warmed up on the whole input grid
+before it is published. Publishing replaces one immutable snapshot, so a
+request keeps the model it resolved until it finishes while new requests
+get the new one: no restart, no dropped requests and no first-call cost
+on the request path. A rejected artifact is logged and the previous
+model keeps serving.
+
+A watcher thread polls every MODEL_REGISTRY_POLL_SECONDS (default 30,
+0 disables) for new, changed or removed artifacts. It is started lazily
+by the first request in each process, so it also runs in gunicorn
+workers forked from a preloaded master. Requests pin a version with the
+X-Model-Version header or the model_version query parameter (3, v3 or v003).
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from api.model_store import default_model_path, load_artifact
+from api.telemetry import MODEL_INFO, MODEL_LOAD_ERRORS, MODEL_LOAD_SECONDS, MODEL_SWAPS
+from features import CATEGORICAL_COLS, NUMERIC_COLS
+
+POLL_SECONDS = 30
+# Versioned artifacts written by incremental.py (and their native exports)
+VERSION_PATTERN = re.compile(r'^(best_model_v(\d+))(\.meta\.json|\.joblib)$')
+# predict_proba()[:, 1] is the high-risk probability when High is label class 0
+HIGH_RISK_CLASS = 'High'
+
+logger = logging.getLogger(__name__)
+
+RegistrySnapshot = namedtuple('RegistrySnapshot', ['default', 'versions'])
+
+
+def parse_version(value):
+    """Version number from a pin such as 3, '3', 'v3' or 'v003'; None if it is not one"""
+    text = str(value).strip().lower()
+    text = text[1:] if text.startswith('v') else text
+    return int(text) if text.isdigit() else None
+
+
+class ServedModel:
+    """A loaded artifact and the serving state derived from it"""
+
+    def __init__(self, path, artifact, default_threshold):
+        self.path = path
+        self.version = int(artifact['version'])
+        self.model = artifact['model']
+        self.feature_pipeline = artifact['feature_pipeline']
+        self.feature_names = self.feature_pipeline.feature_names
+        self.calibrator = artifact['calibrator']
+        self.fingerprint = artifact['fingerprint']
+        # Calibrated artifacts carry the high-risk threshold fitted with their calibration
+        self.high_risk_threshold = default_threshold
+        if self.calibrator is not None and self.calibrator.threshold is not None:
+            self.high_risk_threshold = self.calibrator.threshold
+        # Set by the registry's prepare callback: the scored input grid, its explainer, and the table in table mode
+        self.grid_probabilities = None
+        self.explainer = None
+        self.prediction_table = None
+        self.loaded_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'path': os.path.relpath(self.path),
+            'fingerprint': self.fingerprint,
+            'n_features': len(self.feature_names),
+            'calibration': self.calibrator.method if self.calibrator is not None else None,
+            'high_risk_threshold': self.high_risk_threshold,
+            'prediction_table': self.prediction_table is not None,
+            'loaded_at': self.loaded_at,
+        }
+
+
+def _model_n_features(model):
+    """Input width of an XGBClassifier or TreeEnsemble"""
+    if hasattr(model, 'get_booster'):
+        return model.get_booster().num_features()
+    return model.n_features
+
+
+def validate_artifact(artifact):
+    """Raise ValueError unless the artifact can be fed the API's scenario encoding"""
+    pipeline = artifact['feature_pipeline']
+    if pipeline.categorical_cols != CATEGORICAL_COLS or pipeline.numeric_cols != NUMERIC_COLS:
+        raise ValueError("feature pipeline columns differ from the API's scenario encoding")
+    if artifact['feature_names'] is not None and artifact['feature_names'] != pipeline.feature_names:
+        raise ValueError("feature_names do not match the feature pipeline's column layout")
+    n_features = _model_n_features(artifact['model'])
+    if n_features != len(pipeline.feature_names):
+        raise ValueError(f"model expects {n_features} features but the pipeline encodes {len(pipeline.feature_names)}")
+    classes = artifact['label_classes']
+    if classes is not None and (not classes or classes[0] != HIGH_RISK_CLASS):
+        raise ValueError(f"label class 0 is {classes[0] if classes else None!r}, expected {HIGH_RISK_CLASS!r}")
+
+
+class ModelRegistry:
+    """
+    Served models by version plus the default one, refreshed in the background
+    prepare(served) runs on every freshly loaded model before it is
+    published (warm-up, prediction table); raising rejects the model
+    """
+
+    def __init__(self, model_path=None, root='.', directory=None, poll_seconds=POLL_SECONDS,
+                 prepare=None, default_threshold=0.5):
+        # A fixed MODEL_PATH, or None to follow default_model_path(root) as artifacts are re-exported
+        self.model_path = model_path
+        self.root = root
+        self.directory = directory
+        self.poll_seconds = poll_seconds
+        self.prepare = prepare
+        self.default_threshold = default_threshold
+        self.snapshot = RegistrySnapshot(None, {})
+        # {path: (stat signature, message)} of rejected artifacts, retried once the file changes
+        self.errors = {}
+        # {path: (stat signature, ServedModel)}
+        self._loaded = {}
+        self._refresh_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._watcher_pid = None
+
+    def default_path(self):
+        return self.model_path or default_model_path(self.root)
+
+    def artifact_paths(self):
+        """{version: path} of the versioned artifacts in the registry directory"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return {}
+        names = {}
+        for filename in os.listdir(self.directory):
+            match = VERSION_PATTERN.match(filename)
+            if match:
+                names[int(match.group(2))] = match.group(1)
+        # Prefer the native export unless the pickle changed since it was made
+        return {version: default_model_path(self.directory, name) for version, name in names.items()}
+
+    def _load(self, path):
+        """ServedModel for path, reused while the file is unchanged; None if it cannot be served"""
+        try:
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            signature = None
+            if self.errors.get(path, (False,))[0] is not None:
+                logger.error("Model artifact %s is unavailable: %s", path, e)
+                MODEL_LOAD_ERRORS.inc(path)
+            self.errors[path] = (None, str(e))
+            return None
+        loaded = self._loaded.get(path)
+        if loaded is not None and loaded[0] == signature:
+            return loaded[1]
+        if path in self.errors and self.errors[path][0] == signature:
+            return None
+
+        start = time.perf_counter()
+        try:
+            artifact = load_artifact(path)
+            validate_artifact(artifact)
+            served = ServedModel(path, artifact, self.default_threshold)
+            if self.prepare is not None:
+                self.prepare(served)
+        except Exception as e:
+            logger.error("Rejected model artifact %s: %s", path, e)
+            MODEL_LOAD_ERRORS.inc(path)
+            self.errors[path] = (signature, str(e))
+            return None
+        MODEL_LOAD_SECONDS.set(time.perf_counter() - start)
+        self.errors.pop(path, None)
+        self._loaded[path] = (signature, served)
+        logger.info("Loaded model version %d from %s (%d features)", served.version, path, len(served.feature_names))
+        return served
+
+    def refresh(self):
+        """Load new or changed artifacts and publish them; returns True when the served models changed"""
+        with self._refresh_lock:
+            previous = self.snapshot
+            # A default that fails to load keeps the previous one serving
+            default_path, paths = self.default_path(), self.artifact_paths()
+            self.errors = {path: error for path, error in self.errors.items()
+                           if path == default_path or path in paths.values()}
+            default = self._load(default_path) or previous.default
+            versions = {}
+            for version, path in sorted(paths.items()):
+                served = self._load(path) or previous.versions.get(version)
+                if served is not None:
+                    versions[version] = served
+            if default is not None:
+                versions.setdefault(default.version, default)
+
+            live = {served.path for served in versions.values()}
+            self._loaded = {path: loaded for path, loaded in self._loaded.items() if path in live}
+            if default is previous.default and versions == previous.versions:
+                return False
+
+            # The only write readers see: one reference to an immutable snapshot
+            self.snapshot = RegistrySnapshot(default, versions)
+            MODEL_SWAPS.inc()
+            MODEL_INFO.replace({
+                (str(served.version), os.path.basename(served.path), served.fingerprint,
+                 str(served is default).lower()): 1
+                for served in versions.values()
+            })
+            logger.info("Serving model version %s by default; versions available: %s",
+                        default.version if default is not None else None, sorted(versions))
+            return True
+
+    def resolve(self, version=None):
+        """
+        The ServedModel pinned by version, or the default one when version is None or empty
+        Returns None when no model is loaded; raises KeyError for an unknown version
+        """
+        snapshot = self.snapshot
+        if version is None or version == '':
+            return snapshot.default
+        number = parse_version(version)
+        if number not in snapshot.versions:
+            raise KeyError(version)
+        return snapshot.versions[number]
+
+    def start(self):
+        """Start the watcher thread in this process (again after a fork); no-op when polling is off"""
+        if self.poll_seconds <= 0 or self._watcher_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+            threading.Thread(target=self._watch, name='model-registry', daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Model registry refresh failed")
+
+    def describe(self):
+        """Default version, every served version and rejected artifacts, for GET /api/models"""
+        snapshot = self.snapshot
+        return {
+            'default': snapshot.default.version if snapshot.default is not None else None,
+            'versions': [served.describe() for _, served in sorted(snapshot.versions.items())],
+            'rejected': {os.path.relpath(path): message for path, (_, message) in self.errors.items()},
+            'poll_seconds': self.poll_seconds,
+        }
@@ -0,0 +1,303 @@
+"""
+Native-format model artifacts for the API
+
+best_model.joblib pickles an XGBClassifier together with the fitted
+FeaturePipeline, so loading it imports xgboost, sklearn and pandas and
+unpickles everything in every worker. export_model splits it into
+- <name>.xgb.json: the booster in XGBoost's native JSON format
+- <name>.meta.json: feature pipeline state (feature names, one-hot
+  categories, fill values, scaler statistics), the probability
+  calibration knots, label classes and the booster's SHA-256
+The API evaluates the booster with TreeEnsemble, a small numpy tree
+walker, so serving needs neither xgboost nor a pickle.
+
+Export the shipped model with:
+    python -m api.model_store best_model.joblib
+"""
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+from api.explanations import tree_shap
+from calibration import ProbabilityCalibrator
+from features import FEATURE_SPEC_VERSION, FeaturePipeline
+from fingerprints import file_fingerprint
+
+MODEL_FORMAT_VERSION = 1
+BOOSTER_SUFFIX = '.xgb.json'
+META_SUFFIX = '.meta.json'
+# Rows evaluated per block, bounding the (trees x rows) temporaries
+BLOCK_ROWS = 4096
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_float(text):
+    """XGBoost stores scalars as strings, newer versions as '[5E-1]'"""
+    return float(str(text).strip('[]'))
+
+
+class TreeEnsemble:
+    """
+    Binary logistic XGBoost (gbtree) booster evaluated with numpy
+    All trees share flat node arrays; every row walks every tree one level
+    per step, so a batch costs max_depth vectorized steps. Leaves point to
+    themselves, so rows that reach a leaf early simply stay there.
+    """
+
+    def __init__(self, left, right, split_index, split_condition, default_left, base_margin, n_features=None,
+                 cover=None):
+        n_trees, max_nodes = left.shape
+        node_ids = np.arange(n_trees * max_nodes, dtype=np.intp).reshape(left.shape)
+        offsets = node_ids[:, :1]
+        leaf = left < 0
+        self.n_trees = n_trees
+        self.max_depth = self._max_depth(left, right)
+        self.roots = offsets.ravel()
+        # children[2 * node] is the left child, children[2 * node + 1] the right one
+        self.children = np.stack([
+            np.where(leaf, node_ids, left + offsets), np.where(leaf, node_ids, right + offsets)
+        ], axis=-1).ravel()
+        self.split_index = np.where(leaf, 0, split_index).astype(np.intp).ravel()
+        self.threshold = np.where(leaf, np.inf, split_condition).astype(np.float32).ravel()
+        self.default_right = (~default_left & ~leaf).ravel()
+        # Leaf nodes hold their output value in split_condition, like XGBoost's JSON
+        self.leaf_value = np.where(leaf, split_condition, 0).astype(np.float32).ravel()
+        self.base_margin = np.float32(base_margin)
+        # Input width the booster was trained on
+        self.n_features = n_features if n_features is not None else int(self.split_index.max()) + 1
+        # Per-tree node arrays with the hessian cover of each node, for predict_contributions
+        self.trees = None
+        if cover is not None:
+            self.trees = [
+                (left[i], right[i], split_index[i], split_condition[i], default_left[i], cover[i])
+                for i in range(n_trees)
+            ]
+
+    @staticmethod
+    def _max_depth(left, right):
+        """Number of splits on the longest root-to-leaf path over all trees"""
+        trees = np.arange(left.shape[0])
+        nodes = np.zeros(left.shape[0], dtype=np.intp)
+        depth = 0
+        while True:
+            split = left[trees, nodes] >= 0
+            if not split.any():
+                return depth
+            trees, nodes = trees[split], nodes[split]
+            trees, nodes = np.concatenate([trees, trees]), np.concatenate([left[trees, nodes], right[trees, nodes]])
+            depth += 1
+
+    @classmethod
+    def from_json(cls, model):
+        """Build from a parsed XGBoost JSON model (Booster.save_model('*.json'))"""
+        learner = model['learner']
+        objective = learner['objective']['name']
+        booster = learner['gradient_booster']
+        if objective != 'binary:logistic' or booster['name'] != 'gbtree':
+            raise ValueError(f"Unsupported booster: {booster['name']} with {objective}")
+        trees = booster['model']['trees']
+        if any(any(tree['split_type']) for tree in trees):
+            raise ValueError("Categorical splits are not supported")
+
+        max_nodes = max(len(tree['left_children']) for tree in trees)
+        shape = (len(trees), max_nodes)
+        left = np.full(shape, -1, dtype=np.intp)
+        right = np.full(shape, -1, dtype=np.intp)
+        split_index = np.zeros(shape, dtype=np.intp)
+        split_condition = np.zeros(shape, dtype=np.float32)
+        default_left = np.ones(shape, dtype=bool)
+        cover = np.ones(shape, dtype=np.float64)
+        for i, tree in enumerate(trees):
+            n = len(tree['left_children'])
+            left[i, :n] = tree['left_children']
+            right[i, :n] = tree['right_children']
+            split_index[i, :n] = tree['split_indices']
+            split_condition[i, :n] = tree['split_conditions']
+            default_left[i, :n] = tree['default_left']
+            cover[i, :n] = tree['sum_hessian']
+
+        base_score = _parse_float(learner['learner_model_param']['base_score'])
+        base_margin = np.log(base_score / (1 - base_score))
+        n_features = int(learner['learner_model_param'].get('num_feature', 0)) or None
+        return cls(left, right, split_index, split_condition, default_left, base_margin, n_features, cover)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_json(json.load(f))
+
+    def _margin_block(self, X):
+        n_rows, n_features = X.shape
+        values = X.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.intp) * n_features)[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_trees)).copy()
+        has_missing = np.isnan(values).any()
+        for _ in range(self.max_depth):
+            x = values.take(row_offsets + self.split_index.take(nodes))
+            go_right = x >= self.threshold.take(nodes)
+            if has_missing:
+                go_right = np.where(np.isnan(x), self.default_right.take(nodes), go_right)
+            nodes = self.children.take(2 * nodes + go_right)
+        return self.leaf_value.take(nodes).sum(axis=1, dtype=np.float32) + self.base_margin
+
+    def predict_margin(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if len(X) <= BLOCK_ROWS:
+            return self._margin_block(X)
+        return np.concatenate([
+            self._margin_block(X[start:start + BLOCK_ROWS]) for start in range(0, len(X), BLOCK_ROWS)
+        ])
+
+    def predict_proba(self, X):
+        """Class probabilities as (n_rows, 2), like XGBClassifier.predict_proba"""
+        positive = 1.0 / (1.0 + np.exp(-self.predict_margin(X)))
+        return np.column_stack([1.0 - positive, positive]).astype(np.float32)
+
+    def predict_contributions(self, X):
+        """SHAP values plus a bias column, like Booster.predict(pred_contribs=True)"""
+        if self.trees is None:
+            raise ValueError("Booster has no node covers; re-export it to explain predictions")
+        return tree_shap(self.trees, self.base_margin, X).astype(np.float32)
+
+
+def default_model_path(root, name='best_model'):
+    """
+    The exported native artifact in root, or the joblib pickle when there is
+    no export or the pickle has changed since it was exported
+    """
+    meta_path = os.path.join(root, name + META_SUFFIX)
+    artifact_path = os.path.join(root, name + '.joblib')
+    if not os.path.exists(meta_path):
+        return artifact_path
+    if os.path.exists(artifact_path):
+        with open(meta_path) as f:
+            source_sha256 = json.load(f).get('source_sha256')
+        if source_sha256 != file_fingerprint(artifact_path):
+            logger.warning("%s changed since it was exported; loading it instead of %s. "
+                           "Re-export with: python -m api.model_store %s", artifact_path, meta_path, artifact_path)
+            return artifact_path
+    return meta_path
+
+
+def load_artifact(path):
+    """
+    Load a native .meta.json or a .joblib artifact into a dict with model,
+    feature_pipeline, calibrator, fingerprint, version, feature_names and
+    label_classes (None when the artifact does not record them)
+    calibrator is None for artifacts trained before calibration was added
+    The fingerprint changes whenever the model or the feature code does
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model file not found at {path}")
+
+    if path.endswith(META_SUFFIX):
+        with open(path) as f:
+            meta = json.load(f)
+        if meta.get('format_version') != MODEL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported model format in {path}")
+        booster_path = os.path.join(os.path.dirname(path), meta['booster'])
+        if file_fingerprint(booster_path) != meta['booster_sha256']:
+            raise ValueError(f"{booster_path} does not match {path}")
+        model = TreeEnsemble.load(booster_path)
+        feature_pipeline = FeaturePipeline.from_dict(meta['feature_pipeline'])
+        if not feature_pipeline.is_scaled:
+            logger.warning("Model artifact has no stored scaling statistics; "
+                           "numeric features are used unscaled. Retrain to store them.")
+        calibration = meta.get('calibration')
+        # The metadata carries the booster hash, so it identifies the whole artifact
+        fingerprint = file_fingerprint(path)
+        version = meta.get('version', 1)
+        feature_names = meta.get('feature_names')
+        label_classes = meta.get('label_classes')
+    else:
+        import joblib
+        from features import load_feature_pipeline
+
+        model_artifacts = joblib.load(path)
+        if not isinstance(model_artifacts, dict) or 'model' not in model_artifacts:
+            raise ValueError("Invalid model file format")
+        model = model_artifacts['model']
+        feature_pipeline = load_feature_pipeline(model_artifacts)
+        calibration = model_artifacts.get('calibration')
+        fingerprint = file_fingerprint(path)
+        version = model_artifacts.get('version', 1)
+        feature_names = model_artifacts.get('feature_names')
+        label_encoder = model_artifacts.get('label_encoder')
+        label_classes = [str(c) for c in label_encoder.classes_] if label_encoder is not None else None
+
+    return {
+        'model': model,
+        'feature_pipeline': feature_pipeline,
+        'calibrator': ProbabilityCalibrator.from_dict(calibration) if calibration else None,
+        'fingerprint': f"{fingerprint}:features-v{FEATURE_SPEC_VERSION}",
+        'version': version,
+        'feature_names': [str(name) for name in feature_names] if feature_names is not None else None,
+        'label_classes': label_classes,
+    }
+
+
+def load_model(path):
+    """Load (model, feature_pipeline, calibrator, fingerprint) from a native .meta.json or a .joblib artifact"""
+    artifact = load_artifact(path)
+    return artifact['model'], artifact['feature_pipeline'], artifact['calibrator'], artifact['fingerprint']
+
+
+def export_model(artifact_path, output_dir=None, sample_rows=1000):
+    """
+    Split a joblib artifact into a native booster and a metadata file
+    Checks that TreeEnsemble reproduces the model's probabilities before writing
+    Returns the metadata path
+    """
+    import joblib
+    from features import load_feature_pipeline
+
+    model_artifacts = joblib.load(artifact_path)
+    model = model_artifacts['model']
+    feature_pipeline = load_feature_pipeline(model_artifacts)
+    booster = model.get_booster()
+
+    output_dir = output_dir or os.path.dirname(os.path.abspath(artifact_path))
+    name = os.path.splitext(os.path.basename(artifact_path))[0]
+    booster_path = os.path.join(output_dir, name + BOOSTER_SUFFIX)
+    meta_path = os.path.join(output_dir, name + META_SUFFIX)
+
+    ensemble = TreeEnsemble.from_json(json.loads(booster.save_raw('json')))
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(sample_rows, len(feature_pipeline.feature_names))).astype(np.float32)
+    # One-hot slots are 0/1, or 1/NaN for pipelines trained on sparse matrices
+    one_hot = X[:, :-len(feature_pipeline.numeric_cols)]
+    X[:, :-len(feature_pipeline.numeric_cols)] = np.where(one_hot > 0, 1, feature_pipeline.encoder.one_hot_fill)
+    error = np.abs(ensemble.predict_proba(X)[:, 1] - model.predict_proba(X)[:, 1]).max()
+    if error > 1e-5:
+        raise ValueError(f"Native evaluation differs from the model by {error:.2e}")
+
+    # Write to temporary names and rename; save_model picks the format from the .json extension
+    tmp_booster_path = booster_path[:-len('.json')] + '.tmp.json'
+    booster.save_model(tmp_booster_path)
+    os.replace(tmp_booster_path, booster_path)
+    label_encoder = model_artifacts.get('label_encoder')
+    meta = {
+        'format_version': MODEL_FORMAT_VERSION,
+        'feature_spec_version': FEATURE_SPEC_VERSION,
+        'source': os.path.basename(artifact_path),
+        'source_sha256': file_fingerprint(artifact_path),
+        'version': model_artifacts.get('version', 1),
+        'booster': os.path.basename(booster_path),
+        'booster_sha256': file_fingerprint(booster_path),
+        'feature_pipeline': feature_pipeline.to_dict(),
+        'calibration': model_artifacts.get('calibration'),
+        'label_classes': [str(c) for c in label_encoder.classes_] if label_encoder is not None else None,
+    }
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_path + '.tmp', meta_path)
+    return meta_path
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'best_model.joblib'
+    print(f"Exported {source} to {export_model(source)}")
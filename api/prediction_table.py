@@ -0,0 +1,166 @@
+"""
+Precomputed prediction table for the closed /api/predict input space
+
+Every field in INPUT_VALIDATORS has a fixed list of options, so the whole
+input space is a small grid (4 road types x 4 weathers x 6 speed limits x
+4 times of day x 4 junction types). The table stores the scored result of
+every grid cell in flat arrays indexed by the encoded inputs, so a request
+becomes a dictionary lookup with no pandas or model call.
+
+Build it ahead of time with:
+    python -m api.prediction_table
+"""
+import itertools
+import json
+import os
+
+import numpy as np
+
+TABLE_FORMAT_VERSION = 1
+
+
+def grid_records(options):
+    """List every combination of the given {field: options} as scenario dicts, in table order"""
+    fields = list(options)
+    return [dict(zip(fields, values)) for values in itertools.product(*options.values())]
+
+
+def _intern(items):
+    """Deduplicate a list of lists, returning (ids, unique tuples)"""
+    unique = {}
+    ids = np.empty(len(items), dtype=np.int16)
+    for i, item in enumerate(items):
+        ids[i] = unique.setdefault(tuple(item), len(unique))
+    return ids, list(unique)
+
+
+class PredictionTable:
+    """Scored results for every cell of the input grid, keyed by encoded inputs"""
+
+    def __init__(self, options, fingerprint, raw_probability, adjusted_probability,
+                 final_probability, high_risk, factor_ids, factor_sets,
+                 recommendation_ids, recommendation_sets):
+        self.options = {field: list(values) for field, values in options.items()}
+        self.fingerprint = fingerprint
+        self.raw_probability = raw_probability
+        self.adjusted_probability = adjusted_probability
+        self.final_probability = final_probability
+        self.high_risk = high_risk
+        self.factor_ids = factor_ids
+        self.factor_sets = factor_sets
+        self.recommendation_ids = recommendation_ids
+        self.recommendation_sets = recommendation_sets
+
+        # Mixed-radix strides: index = sum(position of value in options * stride)
+        shape = [len(values) for values in self.options.values()]
+        strides = np.cumprod([1] + shape[::-1][:-1])[::-1]
+        self._positions = [
+            (field, {value: pos * int(stride) for pos, value in enumerate(values)})
+            for (field, values), stride in zip(self.options.items(), strides)
+        ]
+
+    def __len__(self):
+        return len(self.final_probability)
+
+    @classmethod
+    def from_predictions(cls, options, fingerprint, raw_probability,
+                         adjusted_probability, final_probability, predictions):
+        """Build a table from scored grid_records(options) and their prediction payloads"""
+        factor_ids, factor_sets = _intern([p['risk_factors'] for p in predictions])
+        recommendation_ids, recommendation_sets = _intern([p['recommendations'] for p in predictions])
+        high_risk = np.array([p['risk_level'] == "High Risk" for p in predictions], dtype=bool)
+        return cls(
+            options, fingerprint,
+            np.asarray(raw_probability, dtype=np.float64),
+            np.asarray(adjusted_probability, dtype=np.float64),
+            np.asarray(final_probability, dtype=np.float64),
+            high_risk, factor_ids, factor_sets, recommendation_ids, recommendation_sets
+        )
+
+    def index(self, data):
+        """Return the table index for a validated scenario"""
+        return sum(positions[data[field]] for field, positions in self._positions)
+
+    def prediction(self, index):
+        """Return the prediction payload stored at a table index"""
+        return {
+            "risk_level": "High Risk" if self.high_risk[index] else "Not High Risk",
+            "probability": f"{float(self.final_probability[index]):.2%}",
+            "raw_probability": f"{float(self.raw_probability[index]):.2%}",
+            "risk_factors": list(self.factor_sets[self.factor_ids[index]]),
+            "recommendations": list(self.recommendation_sets[self.recommendation_ids[index]])
+        }
+
+    def lookup(self, data):
+        """Return the prediction payload for a validated scenario"""
+        return self.prediction(self.index(data))
+
+    def matches(self, options, fingerprint):
+        """Check the table was built for this input space, model artifact and post-processing"""
+        return (
+            self.fingerprint == fingerprint
+            and self.options == {field: list(values) for field, values in options.items()}
+        )
+
+    def is_consistent(self, predict_fn, sample_size=16, seed=0, atol=1e-6):
+        """
+        Spot-check stored results against the live model path
+        predict_fn takes a list of scenarios and returns (raw probabilities,
+        prediction payloads); both must match the stored cells
+        """
+        records = grid_records(self.options)
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(records), size=min(sample_size, len(records)), replace=False)
+        raw_probability, predictions = predict_fn([records[i] for i in sample])
+        if not np.allclose(np.asarray(raw_probability, dtype=np.float64), self.raw_probability[sample], atol=atol):
+            return False
+        return all(prediction == self.prediction(i) for i, prediction in zip(sample.tolist(), predictions))
+
+    def save(self, path):
+        """Write the table to a compressed .npz file"""
+        meta = {
+            'format_version': TABLE_FORMAT_VERSION,
+            'options': self.options,
+            'fingerprint': self.fingerprint,
+            'factor_sets': self.factor_sets,
+            'recommendation_sets': self.recommendation_sets,
+        }
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            meta=np.array(json.dumps(meta)),
+            raw_probability=self.raw_probability,
+            adjusted_probability=self.adjusted_probability,
+            final_probability=self.final_probability,
+            high_risk=self.high_risk,
+            factor_ids=self.factor_ids,
+            recommendation_ids=self.recommendation_ids,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a table written by save(), or return None if it is missing or outdated"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('format_version') != TABLE_FORMAT_VERSION:
+                return None
+            return cls(
+                meta['options'], meta['fingerprint'],
+                data['raw_probability'], data['adjusted_probability'],
+                data['final_probability'], data['high_risk'],
+                data['factor_ids'], [tuple(s) for s in meta['factor_sets']],
+                data['recommendation_ids'], [tuple(s) for s in meta['recommendation_sets']]
+            )
+
+
+if __name__ == '__main__':
+    from api import routes
+
+    if routes.registry.resolve() is None:
+        raise SystemExit("Model not loaded; cannot build prediction table")
+    table = routes.build_prediction_table()
+    table.save(routes.prediction_table_path)
+    print(f"Saved {len(table)} predictions to {routes.prediction_table_path}")
@@ -0,0 +1,211 @@
+"""
+Cache of serialized /api/predict responses
+
+Dashboards poll the same few scenarios, so a repeated request can be
+answered with the JSON bytes produced the first time, skipping validation,
+feature encoding, the model and serialization. Keys combine the model
+fingerprint with the canonical JSON of the request body (the response
+echoes the body back, so the whole body is part of the key); with the
+model registry each key carries the fingerprint of the model version that
+answered, so versions never share entries.
+
+Backends:
+- LRUBackend: in-process, bounded, optional TTL (default)
+- SharedBackend: any client with redis-style get(key) / set(key, value, ex=ttl),
+  e.g. redis.Redis.from_url(RESPONSE_CACHE_URL); LocalSharedStore is an
+  in-memory stand-in with the same interface
+
+Configured from the environment by create_cache_from_env():
+    RESPONSE_CACHE_SIZE  entries kept in-process (0 disables the cache, default 1024)
+    RESPONSE_CACHE_TTL   seconds before an entry expires (0 = never, default)
+    RESPONSE_CACHE_URL   shared backend URL (redis://..., needs the redis package;
+                         local:// uses LocalSharedStore)
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 1024
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStats:
+    """Hit/miss/eviction counters shared by all backends"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def evicted(self, n=1):
+        with self._lock:
+            self.evictions += n
+
+
+class LRUBackend:
+    """Bounded in-process store; least recently used entries are evicted first"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=None, stats=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = stats or CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                self.stats.evicted()
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats.evicted()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedBackend:
+    """Store in a shared key-value service through a redis-style client"""
+
+    def __init__(self, client, ttl=None, prefix='risk:predict:', stats=None):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = stats or CacheStats()
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value):
+        # Eviction is the service's job; it is not counted here
+        self.client.set(self.prefix + key, value, ex=max(1, round(self.ttl)) if self.ttl else None)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(self.prefix + '*'))
+
+
+class LocalSharedStore:
+    """In-memory stand-in for a redis client (get/set with ex/scan_iter/delete)"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+
+    def scan_iter(self, pattern='*'):
+        prefix = pattern.rstrip('*')
+        with self._lock:
+            keys = [key for key in self._data if key.startswith(prefix)]
+        return iter(keys)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class ResponseCache:
+    """Serialized responses keyed by model fingerprint and canonical request body"""
+
+    def __init__(self, backend, fingerprint=None):
+        self.backend = backend
+        self.fingerprint = fingerprint
+
+    @property
+    def stats(self):
+        return self.backend.stats
+
+    def key(self, data, fingerprint=None):
+        """Key for a request body answered by the model with this fingerprint (default: the cache's)"""
+        canonical = json.dumps(data, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(f"{fingerprint or self.fingerprint}\n{canonical}".encode()).hexdigest()
+
+    def get(self, key):
+        """Cached response bytes for a key from key(), or None"""
+        value = self.backend.get(key)
+        self.stats.record(value is not None)
+        return value
+
+    def put(self, key, body):
+        self.backend.set(key, body)
+
+    def snapshot(self):
+        """Counters and size, for the stats endpoint"""
+        stats = self.stats
+        lookups = stats.hits + stats.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "size": len(self.backend),
+            "hits": stats.hits,
+            "misses": stats.misses,
+            "evictions": stats.evictions,
+            "hit_rate": stats.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_cache_from_env(fingerprint=None):
+    """Build the response cache from RESPONSE_CACHE_* settings (None when disabled)"""
+    size = int(os.environ.get('RESPONSE_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+    ttl = float(os.environ.get('RESPONSE_CACHE_TTL', 0)) or None
+    url = os.environ.get('RESPONSE_CACHE_URL')
+    if size <= 0:
+        return None
+
+    if url == 'local://':
+        return ResponseCache(SharedBackend(LocalSharedStore(), ttl=ttl), fingerprint)
+    if url:
+        try:
+            import redis
+            return ResponseCache(SharedBackend(redis.Redis.from_url(url), ttl=ttl), fingerprint)
+        except ImportError:
+            logger.warning("RESPONSE_CACHE_URL is set but the redis package is not installed; "
+                           "using the in-process cache")
+    return ResponseCache(LRUBackend(size, ttl=ttl), fingerprint)
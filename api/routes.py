@@ -1,9 +1,18 @@
-from flask import Blueprint, request, jsonify
-import joblib
+from flask import Blueprint, request, jsonify, current_app, g
+import hashlib
+import json
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import StandardScaler
 import os
+import time
+from api.explanations import Explainer
+from api.model_registry import POLL_SECONDS, ModelRegistry
+from api.model_store import default_model_path
+from api.prediction_table import PredictionTable, grid_records
+from api.response_cache import create_cache_from_env
+from api.telemetry import (
+    PREDICTIONS, STAGE_SECONDS, configure_logging, log_sampled, logger, record_request
+)
+from risk_aggregation import DIMENSIONS, cube_name
 
 # Create blueprint for API routes
 api = Blueprint('api', __name__)
@@ -39,33 +48,48 @@ INPUT_VALIDATORS = {
 
 # Risk level thresholds - binary classification
 RISK_THRESHOLDS = {
-    'high': 0.70    # Threshold for high risk classification
+    'high': 0.70    # Threshold for high risk classification (artifacts without calibration)
 }
 
+# Maximum number of scenarios accepted by the batch endpoint
+MAX_BATCH_SIZE = 10000
+
+# Requests pin a registry version with this header (or ?model_version=); responses name the version used
+MODEL_VERSION_HEADER = 'X-Model-Version'
+
+# ?explain=true adds per-prediction feature contributions to /predict and /predict/batch responses
+EXPLAIN_VALUES = {'1', 'true', 'yes'}
+
+# The whole input grid in grid_records order, and its shape (one axis per field)
+GRID_OPTIONS = {field: rules['options'] for field, rules in INPUT_VALIDATORS.items()}
+GRID_SHAPE = tuple(len(options) for options in GRID_OPTIONS.values())
+
 # Get the directory containing the current file
 current_dir = os.path.dirname(os.path.abspath(__file__))
-model_path = os.path.join(os.path.dirname(current_dir), 'models', 'best_model.joblib')
+# MODEL_PATH can point at another artifact (.meta.json or .joblib), e.g. best_model_compact.joblib
+model_path = os.environ.get('MODEL_PATH') or default_model_path(os.path.dirname(current_dir))
+# Versioned artifacts (incremental.py output) served alongside the default model
+model_registry_dir = os.environ.get('MODEL_REGISTRY_DIR', os.path.join(os.path.dirname(current_dir), 'models'))
 
-# Load the model and scaler
-try:
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Model file not found at {model_path}")
-        
-    model_artifacts = joblib.load(model_path)
-    if not isinstance(model_artifacts, dict) or 'model' not in model_artifacts:
-        raise ValueError("Invalid model file format")
-        
-    model = model_artifacts['model']
-    feature_names = model_artifacts.get('feature_names', [])
-    print("Model loaded successfully")
-    print(f"Feature names: {feature_names}")
-    # Initialize a new scaler for each prediction
-    scaler = StandardScaler()
-except Exception as e:
-    print(f"Error loading model: {str(e)}")
-    model = None
-    feature_names = []
-    scaler = None
+# Table mode: serve every prediction from a precomputed table of the whole input grid
+PREDICTION_TABLE_MODE = os.environ.get('PREDICTION_TABLE_MODE', '').lower() in ('1', 'true', 'yes')
+# Compute each model's explanations when it is loaded, before it is published; EXPLAIN_WARMUP=0
+# defers them to the first ?explain=true request for the version (about 1 s on that request)
+EXPLAIN_WARMUP = os.environ.get('EXPLAIN_WARMUP', '1').lower() in EXPLAIN_VALUES
+prediction_table_path = os.environ.get(
+    'PREDICTION_TABLE_PATH',
+    os.path.join(os.path.dirname(model_path), 'prediction_table.npz')
+)
+# Scored grid and explanations of every model version, shared by the processes serving it
+grid_cache_dir = os.environ.get('GRID_CACHE_DIR', os.path.join(os.path.dirname(current_dir), '.cache', 'grid'))
+
+# Precomputed risk cubes for the dashboards, written by risk_aggregation.py
+risk_aggregates_path = os.environ.get(
+    'RISK_AGGREGATES_PATH',
+    os.path.join(os.path.dirname(current_dir), 'risk_aggregates.json')
+)
+
+configure_logging()
 
 def validate_input(data):
     """Validate input data against defined validators"""
@@ -77,99 +101,162 @@ def validate_input(data):
             errors[field] = f"Invalid value for {field}. Options are: {rules['options']}"
     return errors
 
+def _risk_factor_message(field, value):
+    """Risk factor a single input value contributes, or None"""
+    if field == 'time_of_day' and value in ['Night', 'Evening']:
+        return 'Limited visibility during night/evening hours'
+    if field == 'weather_conditions' and value != 'Fine':
+        return f"Adverse weather conditions ({value})"
+    if field == 'speed_limit' and value > 40:
+        return 'High speed zone'
+    if field == 'junction_detail' and value != 'Not at junction':
+        return f"Complex junction type ({value})"
+    # Road type risks, only for the higher-risk road types
+    if field == 'road_type':
+        return {6: 'Urban area with high traffic', 3: 'Rural road with potential hazards'}.get(value)
+    return None
+
+def _high_risk_recommendation(field, value):
+    """Recommendation a single input value contributes for a high-risk scenario, or None"""
+    if field == 'speed_limit' and value > 40:
+        return "Consider reducing speed limit in this area"
+    if field == 'junction_detail' and value != 'Not at junction':
+        return "Install traffic monitoring cameras at the junction"
+    if field == 'time_of_day' and value in ['Night', 'Evening']:
+        return "Improve street lighting conditions"
+    if field == 'weather_conditions' and value != 'Fine':
+        return f"Install weather warning signs for {value} conditions"
+    if field == 'has_risk_factors' and value:
+        return "Increase police patrols in the area"
+    return None
+
+def _other_recommendation(field, value):
+    """Recommendation a single input value contributes for other scenarios, or None"""
+    if field == 'junction_detail' and value != 'Not at junction':
+        return "Consider additional signage at the junction"
+    if field == 'weather_conditions' and value != 'Fine':
+        return "Ensure regular road maintenance"
+    if field == 'time_of_day' and value in ['Night', 'Evening']:
+        return "Consider enhanced road markings"
+    if field == 'has_risk_factors':
+        return ("Monitor conditions and maintain current safety measures" if value
+                else "Continue regular maintenance and monitoring")
+    if field == 'road_type' and value == 1:
+        return "Maintain residential area safety features"
+    if field == 'speed_limit' and value <= 30:
+        return "Current speed restrictions are appropriate"
+    return None
+
+class MessageTable:
+    """
+    Per-value messages compiled into bitmask tables
+    Each distinct message is one bit, numbered in output order, and
+    masks[field][position] holds the bits an option sets. A scenario's
+    messages are decoded from the OR of its fields' masks, so whole
+    batches are handled with array lookups and decoded once per distinct mask.
+    """
+
+    def __init__(self, message_fn, fields, options, default=()):
+        self.messages = []
+        self.masks = {}
+        # Fields in output order; a message's bit is assigned the first time it appears
+        for field in fields:
+            masks = np.zeros(len(options[field]), dtype=np.int64)
+            for position, value in enumerate(options[field]):
+                message = message_fn(field, value)
+                if message is not None:
+                    if message not in self.messages:
+                        self.messages.append(message)
+                    masks[position] = 1 << self.messages.index(message)
+            self.masks[field] = masks
+        self.default = list(default)
+        self._decoded = {}
+
+    def mask(self, indices):
+        """Combined mask for option positions per field (ints or arrays of positions)"""
+        combined = 0
+        for field, masks in self.masks.items():
+            combined = combined | masks[indices[field]]
+        return combined
+
+    def state(self):
+        """JSON-serializable messages and masks, part of the prediction table fingerprint"""
+        return {
+            'messages': self.messages,
+            'masks': {field: masks.tolist() for field, masks in self.masks.items()},
+            'default': self.default,
+        }
+
+    def decode(self, mask):
+        """Messages for a mask, in output order"""
+        mask = int(mask)
+        if mask not in self._decoded:
+            messages = tuple(message for bit, message in enumerate(self.messages) if mask >> bit & 1)
+            self._decoded[mask] = messages or tuple(self.default)
+        return list(self._decoded[mask])
+
+# Option positions per field; 'has_risk_factors' is derived from the risk factor mask
+OPTION_POSITIONS = {
+    field: {value: position for position, value in enumerate(rules['options'])}
+    for field, rules in INPUT_VALIDATORS.items()
+}
+_TABLE_OPTIONS = {
+    **{field: rules['options'] for field, rules in INPUT_VALIDATORS.items()},
+    'has_risk_factors': [False, True],
+}
+
+RISK_FACTORS = MessageTable(
+    _risk_factor_message,
+    ['time_of_day', 'weather_conditions', 'speed_limit', 'junction_detail', 'road_type'],
+    _TABLE_OPTIONS
+)
+HIGH_RISK_RECOMMENDATIONS = MessageTable(
+    _high_risk_recommendation,
+    ['speed_limit', 'junction_detail', 'time_of_day', 'weather_conditions', 'has_risk_factors'],
+    _TABLE_OPTIONS, default=["No specific recommendations needed at this time"]
+)
+OTHER_RECOMMENDATIONS = MessageTable(
+    _other_recommendation,
+    ['junction_detail', 'weather_conditions', 'time_of_day', 'has_risk_factors', 'road_type', 'speed_limit'],
+    _TABLE_OPTIONS, default=["No specific recommendations needed at this time"]
+)
+
+# Inputs that add 0.1 each to the rule-based risk score
+BASE_RISK_FLAGS = {
+    field: np.array([_risk_factor_message(field, value) is not None for value in rules['options']])
+    for field, rules in INPUT_VALIDATORS.items()
+}
+
+def option_indices(data):
+    """Position of a validated scenario's value in each field's options"""
+    return {field: positions[data[field]] for field, positions in OPTION_POSITIONS.items()}
+
+def option_index_arrays(records):
+    """option_indices for a list of validated scenarios, as one array per field"""
+    return {
+        field: np.fromiter((positions[record[field]] for record in records), dtype=np.intp, count=len(records))
+        for field, positions in OPTION_POSITIONS.items()
+    }
+
+def grid_cells(indices):
+    """Flat position in the input grid (grid_records order) of scenarios given their option_index_arrays"""
+    return np.ravel_multi_index([indices[field] for field in GRID_OPTIONS], GRID_SHAPE)
+
 def calculate_risk_factors(data):
     """Calculate additional risk factors based on conditions"""
-    risk_factors = []
-    
-    # Time-based risks
-    if data['time_of_day'] in ['Night', 'Evening']:
-        risk_factors.append('Limited visibility during night/evening hours')
-    
-    # Weather-based risks
-    if data['weather_conditions'] != 'Fine':
-        risk_factors.append(f"Adverse weather conditions ({data['weather_conditions']})")
-    
-    # Speed-based risks
-    if data['speed_limit'] > 40:
-        risk_factors.append('High speed zone')
-    
-    # Junction-based risks
-    if data['junction_detail'] != 'Not at junction':
-        risk_factors.append(f"Complex junction type ({data['junction_detail']})")
-    
-    # Road type risks with adjusted descriptions
-    road_type_desc = {
-        6: 'Urban area with high traffic',
-        3: 'Rural road with potential hazards',
-        2: 'Suburban area with moderate traffic',
-        1: 'Residential area with lower traffic'
-    }
-    if data['road_type'] in road_type_desc:
-        if data['road_type'] in [6, 3]:  # Only add as risk factor for higher-risk road types
-            risk_factors.append(road_type_desc[data['road_type']])
-    
-    return risk_factors
+    return RISK_FACTORS.decode(RISK_FACTORS.mask(option_indices(data)))
 
-def preprocess_input(data):
-    """Preprocess input data for model prediction"""
-    # Create DataFrame with input data
-    df = pd.DataFrame([data])
-    
-    # Initialize all features to 0
-    for feature in feature_names:
-        df[feature] = 0
-    
-    # Create one-hot encoded columns for road_type
-    road_type = df['road_type'].values[0]
-    df[f'road_type_{road_type}'] = 1
-    
-    # Map weather conditions to numeric codes
-    weather_map = {'Fine': 1, 'Rain': 2, 'Snow': 3, 'Fog': 4}
-    weather_code = weather_map.get(df['weather_conditions'].values[0], 1)
-    df[f'weather_conditions_{weather_code}'] = 1
-    
-    # Map time of day to light conditions
-    time_to_light = {
-        'Morning': 1,  # Daylight
-        'Afternoon': 1,  # Daylight
-        'Evening': 4,  # Darkness - lights lit
-        'Night': 4,    # Darkness - lights lit
-    }
-    light_code = time_to_light.get(df['time_of_day'].values[0], 1)
-    df[f'light_conditions_{light_code}'] = 1
-    
-    # Map junction detail
-    junction_map = {
-        'Not at junction': 0,
-        'T Junction': 1,
-        'Crossroads': 2,
-        'Roundabout': 3
-    }
-    junction_code = junction_map.get(df['junction_detail'].values[0], 0)
-    df[f'junction_detail_{junction_code}'] = 1
-    
-    # Add speed limit (normalized)
-    df['speed_limit'] = df['speed_limit'].astype(float) / 70.0  # Normalize by max speed
-    
-    # Add derived risk factors
-    df['number_of_vehicles'] = 1
-    df['number_of_casualties'] = 0
-    df['casualty_rate'] = 0
-    df['weather_risk'] = 1 if df['weather_conditions'].values[0] != 'Fine' else 0
-    df['surface_risk'] = 1 if df['weather_conditions'].values[0] in ['Rain', 'Snow'] else 0
-    df['combined_risk'] = df['weather_risk'] + df['surface_risk']
-    df['is_night'] = 1 if df['time_of_day'].values[0] in ['Night', 'Evening'] else 0
-    df['is_rush_hour'] = 1 if df['time_of_day'].values[0] in ['Morning', 'Evening'] else 0
-    df['is_weekend'] = 0
-    df['high_speed'] = 1 if df['speed_limit'].values[0] > 40 else 0
-    df['night_speed_risk'] = df['is_night'] * df['high_speed']
-    df['weather_speed_risk'] = df['weather_risk'] * df['high_speed']
-    
-    # Print preprocessed features for debugging
-    print("Preprocessed features:")
-    print(df[feature_names])
-    
-    return df[feature_names]
+def _served(served):
+    """The given ServedModel, or the registry's default one"""
+    return served if served is not None else registry.resolve()
+
+def preprocess_input(data, served=None):
+    """Encode a single validated scenario into a model feature row"""
+    return _served(served).feature_pipeline.transform_scenario(data)
+
+def preprocess_batch(records, served=None):
+    """Build the model feature matrix for a list of validated scenarios in one pass"""
+    return _served(served).feature_pipeline.transform_scenarios(records)
 
 def adjust_probability(prob):
     """Adjust probability using a more aggressive transformation"""
@@ -196,39 +283,388 @@ def adjust_probability(prob):
     
     return min(max(final_prob, 0), 1)  # Ensure probability stays between 0 and 1
 
+def adjust_probabilities(probs):
+    """Vectorized adjust_probability for an array of raw probabilities"""
+    probs = np.asarray(probs, dtype=np.float64)
+    adjusted = (probs * 0.5) / (probs * 0.5 + (1 - probs))
+
+    # Power transformation above 0.5, cube root below (same curve as adjust_probability)
+    upper = 0.2 + np.power(np.clip((adjusted - 0.5) * 2, 0, 1), 5) * 0.7
+    lower = 0.2 * np.power(adjusted * 2, 0.33)
+    final_probs = np.where(adjusted > 0.5, upper, lower)
+
+    # Risk-based adjustments with reduced impact for low probabilities
+    base_diff = np.abs(probs - 0.5)
+    final_probs += base_diff * np.where(final_probs < 0.4, 0.02, 0.05)
+
+    return np.clip(final_probs, 0, 1)
+
+def calculate_base_risk_score(data):
+    """Calculate the rule-based risk score blended with the model probability"""
+    indices = option_indices(data)
+    return sum(int(flags[indices[field]]) for field, flags in BASE_RISK_FLAGS.items()) * 0.1
+
+def calculate_base_risk_scores(records, indices=None):
+    """Vectorized calculate_base_risk_score for a list of validated scenarios"""
+    if indices is None:
+        indices = option_index_arrays(records)
+    flags = sum(flags[indices[field]].astype(np.int64) for field, flags in BASE_RISK_FLAGS.items())
+    return flags * 0.1
+
+def classify_risk(final_probabilities, served=None):
+    """High-risk flag per final probability"""
+    return np.asarray(final_probabilities) > _served(served).high_risk_threshold
+
+def blend_probabilities(adjusted_probability, base_risk_score):
+    """Blend the adjusted model probability with the rule-based risk score"""
+    return (adjusted_probability * 0.7) + (base_risk_score * 0.3)
+
+def postprocess_probability(data, raw_probability, served=None):
+    """
+    (adjusted, final) probability for one scenario
+    With a calibrated artifact both are the calibrated probability; older
+    artifacts use the hand-tuned adjustment blended with the rule-based score
+    """
+    calibrator = _served(served).calibrator
+    if calibrator is not None:
+        calibrated = float(calibrator.transform(raw_probability))
+        return calibrated, calibrated
+    adjusted_probability = adjust_probability(raw_probability)
+    return adjusted_probability, blend_probabilities(adjusted_probability, calculate_base_risk_score(data))
+
+def postprocess_probabilities(records, raw_probabilities, indices=None, served=None):
+    """Vectorized postprocess_probability; returns (adjusted, final) arrays"""
+    calibrator = _served(served).calibrator
+    if calibrator is not None:
+        calibrated = calibrator.transform(raw_probabilities)
+        return calibrated, calibrated
+    adjusted_probabilities = adjust_probabilities(raw_probabilities)
+    base_risk_scores = calculate_base_risk_scores(records, indices)
+    return adjusted_probabilities, blend_probabilities(adjusted_probabilities, base_risk_scores)
+
+def score_batch(records, indices=None, served=None):
+    """
+    Score a list of validated scenarios with a single model call
+    Returns (raw, adjusted, final) probability arrays
+    """
+    served = _served(served)
+    with STAGE_SECONDS.time('feature_encoding'):
+        X = preprocess_batch(records, served)
+    with STAGE_SECONDS.time('inference'):
+        raw_probabilities = served.model.predict_proba(X)[:, 1]
+    with STAGE_SECONDS.time('postprocessing'):
+        adjusted_probabilities, final_probabilities = postprocess_probabilities(
+            records, raw_probabilities, indices, served
+        )
+    return raw_probabilities, adjusted_probabilities, final_probabilities
+
+def explain_predictions(indices, served=None):
+    """Model feature contributions (log-odds, largest first) for scenarios given their option_index_arrays"""
+    with STAGE_SECONDS.time('explanation'):
+        return _served(served).explainer.explain(grid_cells(indices))
+
 def generate_recommendations(data, risk_level, risk_factors):
     """Generate specific recommendations based on risk factors"""
-    recommendations = []
-    
-    if risk_level == "High Risk":
-        if data['speed_limit'] > 40:
-            recommendations.append("Consider reducing speed limit in this area")
-        if data['junction_detail'] != 'Not at junction':
-            recommendations.append("Install traffic monitoring cameras at the junction")
-        if data['time_of_day'] in ['Night', 'Evening']:
-            recommendations.append("Improve street lighting conditions")
-        if data['weather_conditions'] != 'Fine':
-            recommendations.append(f"Install weather warning signs for {data['weather_conditions']} conditions")
-        if len(risk_factors) > 0:
-            recommendations.append("Increase police patrols in the area")
-    
-    else:  # Not High Risk
-        if data['junction_detail'] != 'Not at junction':
-            recommendations.append("Consider additional signage at the junction")
-        if data['weather_conditions'] != 'Fine':
-            recommendations.append("Ensure regular road maintenance")
-        if data['time_of_day'] in ['Night', 'Evening']:
-            recommendations.append("Consider enhanced road markings")
-        if len(risk_factors) > 0:
-            recommendations.append("Monitor conditions and maintain current safety measures")
-        else:
-            recommendations.append("Continue regular maintenance and monitoring")
-        if data['road_type'] == 1:
-            recommendations.append("Maintain residential area safety features")
-        if data['speed_limit'] <= 30:
-            recommendations.append("Current speed restrictions are appropriate")
-    
-    return recommendations if recommendations else ["No specific recommendations needed at this time"]
+    indices = {**option_indices(data), 'has_risk_factors': int(len(risk_factors) > 0)}
+    table = HIGH_RISK_RECOMMENDATIONS if risk_level == "High Risk" else OTHER_RECOMMENDATIONS
+    return table.decode(table.mask(indices))
+
+def build_prediction(data, final_probability, raw_probability, served=None):
+    """Build the prediction payload returned for a single scenario"""
+    # Determine risk level based on probability threshold
+    risk_level = "High Risk" if final_probability > _served(served).high_risk_threshold else "Not High Risk"
+
+    # Calculate risk factors
+    risk_factors = calculate_risk_factors(data)
+
+    # Generate recommendations
+    recommendations = generate_recommendations(data, risk_level, risk_factors)
+
+    return {
+        "risk_level": risk_level,
+        "probability": f"{final_probability:.2%}",
+        "raw_probability": f"{raw_probability:.2%}",
+        "risk_factors": risk_factors,
+        "recommendations": recommendations
+    }
+
+def risk_masks(final_probabilities, indices, served=None):
+    """
+    Vectorized risk classification for scored scenarios
+    Returns (high-risk flags, risk factor masks, recommendation masks); a
+    recommendation mask decodes with HIGH_RISK_RECOMMENDATIONS where the
+    scenario is high risk and OTHER_RECOMMENDATIONS elsewhere
+    """
+    high_risk = classify_risk(final_probabilities, served)
+    factor_masks = RISK_FACTORS.mask(indices)
+    indices = {**indices, 'has_risk_factors': (factor_masks != 0).astype(np.intp)}
+    recommendation_masks = np.where(
+        high_risk, HIGH_RISK_RECOMMENDATIONS.mask(indices), OTHER_RECOMMENDATIONS.mask(indices)
+    )
+    return high_risk, factor_masks, recommendation_masks
+
+def build_predictions(records, final_probabilities, raw_probabilities, indices=None, served=None):
+    """Vectorized build_prediction for a list of scored scenarios"""
+    if indices is None:
+        indices = option_index_arrays(records)
+    high_risk, factor_masks, recommendation_masks = risk_masks(final_probabilities, indices, served)
+
+    # Decode each distinct mask once; the high-risk flag picks the recommendation table
+    factor_ids, factor_inverse = np.unique(factor_masks, return_inverse=True)
+    factor_lists = [tuple(RISK_FACTORS.decode(mask)) for mask in factor_ids]
+    recommendation_keys = recommendation_masks * 2 + high_risk
+    recommendation_ids, recommendation_inverse = np.unique(recommendation_keys, return_inverse=True)
+    recommendation_lists = [
+        tuple((HIGH_RISK_RECOMMENDATIONS if key & 1 else OTHER_RECOMMENDATIONS).decode(key >> 1))
+        for key in recommendation_ids.tolist()
+    ]
+
+    return [
+        {
+            "risk_level": "High Risk" if high else "Not High Risk",
+            "probability": f"{final_probability:.2%}",
+            "raw_probability": f"{raw_probability:.2%}",
+            "risk_factors": list(factor_lists[factor_id]),
+            "recommendations": list(recommendation_lists[recommendation_id])
+        }
+        for high, final_probability, raw_probability, factor_id, recommendation_id in zip(
+            high_risk.tolist(), np.asarray(final_probabilities, dtype=np.float64).tolist(),
+            np.asarray(raw_probabilities, dtype=np.float64).tolist(),
+            factor_inverse.ravel().tolist(), recommendation_inverse.ravel().tolist())
+    ]
+
+def parse_batch_payload():
+    """
+    Read a batch request body as a JSON array, a {"scenarios": [...]} object
+    or NDJSON (one scenario per line)
+    NDJSON is read when the content type is application/x-ndjson, or when the
+    body is not a single JSON document and has more than one line; its lines
+    that are not valid JSON become None. Raises ValueError for any other body
+    """
+    body = request.get_data(as_text=True)
+    if not body.strip():
+        return []
+    lines = [line for line in body.splitlines() if line.strip()]
+    data = None
+    if request.mimetype != 'application/x-ndjson':
+        data = request.get_json(force=True, silent=True)
+        if data is None and len(lines) < 2:
+            raise ValueError("Request body is not valid JSON")
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        if not isinstance(data.get('scenarios'), list):
+            raise ValueError("A JSON object body must have a 'scenarios' array")
+        return data['scenarios']
+    if data is not None:
+        raise ValueError("Request body must be a JSON array of scenarios")
+
+    items = []
+    for line in lines:
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            items.append(None)
+    return items
+
+def prediction_table_fingerprint(served=None):
+    """
+    Model fingerprint plus everything the stored payloads are derived from:
+    the high-risk threshold, the calibration knots and the message tables
+    """
+    served = _served(served)
+    postprocessing = {
+        'high_risk_threshold': served.high_risk_threshold,
+        'calibration': served.calibrator.to_dict() if served.calibrator is not None else None,
+        'risk_factors': RISK_FACTORS.state(),
+        'high_risk_recommendations': HIGH_RISK_RECOMMENDATIONS.state(),
+        'other_recommendations': OTHER_RECOMMENDATIONS.state(),
+    }
+    digest = hashlib.sha256(json.dumps(postprocessing, sort_keys=True).encode()).hexdigest()
+    return f"{served.fingerprint}:postprocessing-{digest[:16]}"
+
+def predict_records(records, served=None):
+    """Raw probabilities and prediction payloads for a list of validated scenarios"""
+    indices = option_index_arrays(records)
+    raw_probabilities, _, final_probabilities = score_batch(records, indices, served)
+    return raw_probabilities, build_predictions(records, final_probabilities, raw_probabilities, indices, served)
+
+def build_prediction_table(served=None):
+    """Score every combination of INPUT_VALIDATORS options with the loaded model"""
+    served = _served(served)
+    options = {field: rules['options'] for field, rules in INPUT_VALIDATORS.items()}
+    records = grid_records(options)
+    indices = option_index_arrays(records)
+    raw_probabilities, adjusted_probabilities, final_probabilities = score_batch(records, indices, served)
+    predictions = build_predictions(records, final_probabilities, raw_probabilities, indices, served)
+    return PredictionTable.from_predictions(
+        options, prediction_table_fingerprint(served), raw_probabilities, adjusted_probabilities,
+        final_probabilities, predictions
+    )
+
+def load_prediction_table(served, path=None):
+    """
+    Load the precomputed prediction table from path, rebuilding it when it
+    was made for a different model artifact or post-processing (thresholds,
+    calibration, messages) or a sample of it disagrees with the live payloads
+    Without a path the table is built in memory
+    """
+    options = {field: rules['options'] for field, rules in INPUT_VALIDATORS.items()}
+    table = None
+    if path is not None:
+        try:
+            table = PredictionTable.load(path)
+        except Exception as e:
+            logger.warning("Error loading prediction table: %s", e)
+
+    if table is not None and table.matches(options, prediction_table_fingerprint(served)) \
+            and table.is_consistent(lambda records: predict_records(records, served)):
+        logger.info("Prediction table loaded from %s", path)
+        return table
+
+    logger.info("Building prediction table for model version %d...", served.version)
+    table = build_prediction_table(served)
+    if path is not None:
+        try:
+            table.save(path)
+            logger.info("Prediction table saved to %s", path)
+        except OSError as e:
+            logger.warning("Could not save prediction table: %s", e)
+    return table
+
+def grid_cache_path(served):
+    """Grid cache file of a model version, named by its model, post-processing and input grid"""
+    key = json.dumps([prediction_table_fingerprint(served), GRID_OPTIONS], sort_keys=True)
+    return os.path.join(grid_cache_dir, f"{hashlib.sha256(key.encode()).hexdigest()[:32]}.npz")
+
+def load_grid_cache(served):
+    """Cached grid arrays of a model version ('raw', 'final', maybe 'contributions'); {} when none"""
+    path = grid_cache_path(served)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+    except Exception as e:
+        logger.warning("Error loading grid cache %s: %s", path, e)
+        return {}
+
+def save_grid_cache(served, arrays):
+    path = grid_cache_path(served)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    try:
+        os.makedirs(grid_cache_dir, exist_ok=True)
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Could not save grid cache: %s", e)
+
+def prepare_model(served):
+    """
+    Warm up a freshly loaded model before the registry publishes it
+    Scores the whole input grid, explains it (and makes one single-row
+    call) so the first requests after a swap pay no lazy-initialization
+    cost, and rejects models whose probabilities are not finite values in
+    [0, 1]. The scored grid and its explanations are saved in
+    GRID_CACHE_DIR, so when every gunicorn worker picks up a new version
+    only the first computes them (about 1 s); the others load the arrays
+    """
+    records = grid_records(GRID_OPTIONS)
+    cached = load_grid_cache(served)
+    if 'raw' in cached:
+        raw_probabilities, final_probabilities = cached['raw'], cached['final']
+    else:
+        raw_probabilities = served.model.predict_proba(preprocess_batch(records, served))[:, 1]
+        _, final_probabilities = postprocess_probabilities(records, raw_probabilities, served=served)
+        build_predictions(records, final_probabilities, raw_probabilities, served=served)
+    if not np.all(np.isfinite(raw_probabilities)) or raw_probabilities.min() < 0 or raw_probabilities.max() > 1:
+        raise ValueError("model returned probabilities outside [0, 1] on the input grid")
+    # Kept for /api/risk-surface, which slices and averages this grid instead of scoring
+    served.grid_probabilities = {
+        'raw': np.asarray(raw_probabilities, dtype=np.float64).reshape(GRID_SHAPE),
+        'final': np.asarray(final_probabilities, dtype=np.float64).reshape(GRID_SHAPE),
+    }
+    served.model.predict_proba(preprocess_input(records[0], served))
+    # Contributions for the whole grid, computed here before the model is published (in the
+    # gunicorn master with preload_app), or by the first ?explain=true request with EXPLAIN_WARMUP=0
+    served.explainer = Explainer(served.model, served.feature_pipeline,
+                                 lambda: preprocess_batch(grid_records(GRID_OPTIONS), served),
+                                 cached.get('contributions'))
+    if EXPLAIN_WARMUP:
+        served.explainer.contributions
+    if 'raw' not in cached or (EXPLAIN_WARMUP and 'contributions' not in cached):
+        arrays = {'raw': raw_probabilities, 'final': final_probabilities}
+        if EXPLAIN_WARMUP:
+            arrays['contributions'] = served.explainer.contributions
+        save_grid_cache(served, arrays)
+    if PREDICTION_TABLE_MODE:
+        # Only the default artifact's table is kept on disk; pinned versions build theirs in memory
+        is_default = served.path == registry.default_path()
+        served.prediction_table = load_prediction_table(served, prediction_table_path if is_default else None)
+
+# Load the default model and every versioned artifact once at import; with
+# gunicorn's preload_app this happens in the master and workers fork with
+# them resident. Each process then polls for new artifacts in the background.
+registry = ModelRegistry(
+    model_path=os.environ.get('MODEL_PATH'),
+    root=os.path.dirname(current_dir),
+    directory=model_registry_dir,
+    poll_seconds=float(os.environ.get('MODEL_REGISTRY_POLL_SECONDS', POLL_SECONDS)),
+    prepare=prepare_model,
+    default_threshold=RISK_THRESHOLDS['high'],
+)
+registry.refresh()
+
+# Serialized /predict responses keyed by model fingerprint and request body (RESPONSE_CACHE_* settings)
+response_cache = create_cache_from_env()
+
+def resolve_model(version=None):
+    """
+    (ServedModel, None) for the pinned version or the default one, or
+    (None, error response) when the version is unknown or no model is loaded
+    """
+    try:
+        served = registry.resolve(version)
+    except KeyError:
+        available = sorted(registry.snapshot.versions)
+        return None, (jsonify({"error": f"Unknown model version {version!r}", "available_versions": available}), 404)
+    if served is None:
+        return None, (jsonify({"error": "Model not loaded. Please try again later."}), 500)
+    g.model_version = served.version
+    return served, None
+
+def requested_version():
+    """Model version pinned by the request, or None for the default"""
+    return request.headers.get(MODEL_VERSION_HEADER) or request.args.get('model_version')
+
+def explain_requested():
+    """Whether the request opted in to explanations with ?explain=true"""
+    return request.args.get('explain', '').lower() in EXPLAIN_VALUES
+
+@api.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    registry.start()
+
+@api.after_request
+def count_request(response):
+    if 'model_version' in g:
+        response.headers[MODEL_VERSION_HEADER] = str(g.model_version)
+    if 'request_start' in g:
+        record_request(request.endpoint, response.status_code, time.perf_counter() - g.request_start)
+    return response
+
+def count_cached_prediction(body):
+    """Count a cached /predict response in PREDICTIONS, as it was counted when first scored"""
+    PREDICTIONS.inc(json.loads(body)['prediction']['risk_level'])
+
+def cached_json_response(cache_key, payload):
+    """Serialize a successful response once, keeping the bytes for repeated requests"""
+    with STAGE_SECONDS.time('serialization'):
+        response = current_app.json.response(payload)
+    if cache_key is not None:
+        response_cache.put(cache_key, response.get_data())
+    return response
 
 @api.route('/predict', methods=['POST'])
 def predict():
@@ -237,8 +673,10 @@ def predict():
     Expects JSON data with features
     Returns prediction and probability
     """
-    if model is None:
-        return jsonify({"error": "Model not loaded. Please try again later."}), 500
+    served, error = resolve_model(requested_version())
+    if error is not None:
+        return error
+    explain = explain_requested()
 
     try:
         # Get data from request
@@ -247,61 +685,254 @@ def predict():
         # Validate input data
         if not data:
             return jsonify({"error": "No data provided"}), 400
+
+        # Repeated request: return the bytes serialized the first time,
+        # skipping validation, the model and serialization
+        cache_key = None
+        if response_cache is not None:
+            # Explained responses are cached apart from plain ones
+            cache_key = response_cache.key(data, served.fingerprint + (':explain' if explain else ''))
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                count_cached_prediction(cached)
+                return current_app.response_class(cached, status=200, mimetype='application/json')
         
-        validation_errors = validate_input(data)
+        with STAGE_SECONDS.time('validation'):
+            validation_errors = validate_input(data)
         if validation_errors:
             return jsonify({
                 "error": "Invalid input data",
                 "details": validation_errors
             }), 400
 
+        # Table mode: answer straight from the precomputed grid
+        if served.prediction_table is not None:
+            with STAGE_SECONDS.time('postprocessing'):
+                prediction = served.prediction_table.lookup(data)
+            PREDICTIONS.inc(prediction['risk_level'])
+            payload = {"prediction": prediction, "input_data": data}
+            if explain:
+                payload["explanation"] = explain_predictions(option_index_arrays([data]), served)[0]
+            return cached_json_response(cache_key, payload), 200
+
         # Preprocess input data
-        processed_data = preprocess_input(data)
+        with STAGE_SECONDS.time('feature_encoding'):
+            processed_data = preprocess_input(data, served)
         
         # Make prediction
-        raw_probability = model.predict_proba(processed_data)[0, 1]
-        print(f"Raw prediction probability: {raw_probability}")
-        
-        # Calculate base risk score from input features
-        base_risk_score = 0
-        if data['speed_limit'] > 40:
-            base_risk_score += 0.1
-        if data['time_of_day'] in ['Night', 'Evening']:
-            base_risk_score += 0.1
-        if data['weather_conditions'] != 'Fine':
-            base_risk_score += 0.1
-        if data['junction_detail'] != 'Not at junction':
-            base_risk_score += 0.1
-        if data['road_type'] in [6, 3]:
-            base_risk_score += 0.1
-        
-        # Adjust probability for model bias
-        adjusted_probability = adjust_probability(raw_probability)
-        
-        # Blend with base risk score
-        final_probability = (adjusted_probability * 0.7) + (base_risk_score * 0.3)
-        print(f"Adjusted prediction probability: {final_probability}")
-        
-        # Determine risk level based on probability threshold
-        risk_level = "High Risk" if final_probability > RISK_THRESHOLDS['high'] else "Not High Risk"
+        with STAGE_SECONDS.time('inference'):
+            raw_probability = served.model.predict_proba(processed_data)[0, 1]
         
-        # Calculate risk factors
-        risk_factors = calculate_risk_factors(data)
-        
-        # Generate recommendations
-        recommendations = generate_recommendations(data, risk_level, risk_factors)
+        with STAGE_SECONDS.time('postprocessing'):
+            # Calibrate (or adjust for model bias and blend with the base risk score)
+            _, final_probability = postprocess_probability(data, raw_probability, served)
+            prediction = build_prediction(data, final_probability, raw_probability, served)
+        log_sampled("prediction raw=%.4f final=%.4f risk_level=%s",
+                    raw_probability, final_probability, prediction['risk_level'])
+        PREDICTIONS.inc(prediction['risk_level'])
         
+        payload = {"prediction": prediction, "input_data": data}
+        if explain:
+            payload["explanation"] = explain_predictions(option_index_arrays([data]), served)[0]
+        return cached_json_response(cache_key, payload), 200
+
+    except Exception:
+        logger.exception("Prediction error")
+        return jsonify({"error": "Failed to process prediction"}), 500 
+
+@api.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Endpoint for scoring many scenarios in one request
+    Expects a JSON array (or NDJSON, one scenario per line)
+    Returns one result per scenario, in input order; invalid scenarios
+    get an error entry instead of failing the whole batch
+    """
+    served, error = resolve_model(requested_version())
+    if error is not None:
+        return error
+    explain = explain_requested()
+
+    try:
+        items = parse_batch_payload()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        if not items:
+            return jsonify({"error": "No data provided"}), 400
+        if len(items) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Batch too large. Maximum is {MAX_BATCH_SIZE} scenarios"}), 413
+
+        # Validate each scenario independently
+        results = [None] * len(items)
+        valid_positions = []
+        with STAGE_SECONDS.time('validation'):
+            for i, data in enumerate(items):
+                if not isinstance(data, dict):
+                    results[i] = {"index": i, "error": "Scenario must be a JSON object"}
+                    continue
+                validation_errors = validate_input(data)
+                if validation_errors:
+                    results[i] = {"index": i, "error": "Invalid input data", "details": validation_errors}
+                else:
+                    valid_positions.append(i)
+
+        if valid_positions:
+            records = [items[i] for i in valid_positions]
+            indices = option_index_arrays(records)
+
+            if served.prediction_table is not None:
+                with STAGE_SECONDS.time('postprocessing'):
+                    for i, data in zip(valid_positions, records):
+                        results[i] = {"index": i, "prediction": served.prediction_table.lookup(data), "input_data": data}
+            else:
+                # Score every valid scenario with a single model call
+                raw_probabilities, _, final_probabilities = score_batch(records, indices, served)
+                with STAGE_SECONDS.time('postprocessing'):
+                    predictions = build_predictions(records, final_probabilities, raw_probabilities, indices, served)
+                    for i, data, prediction in zip(valid_positions, records, predictions):
+                        results[i] = {"index": i, "prediction": prediction, "input_data": data}
+            if explain:
+                # One lookup per scenario; each distinct scenario is decoded once
+                for i, explanation in zip(valid_positions, explain_predictions(indices, served)):
+                    results[i]["explanation"] = explanation
+            risk_levels = [results[i]['prediction']['risk_level'] for i in valid_positions]
+            for risk_level in set(risk_levels):
+                PREDICTIONS.inc(risk_level, amount=risk_levels.count(risk_level))
+
+        with STAGE_SECONDS.time('serialization'):
+            response = jsonify({
+                "results": results,
+                "summary": {
+                    "total": len(items),
+                    "succeeded": len(valid_positions),
+                    "failed": len(items) - len(valid_positions)
+                }
+            })
+        return response, 200
+
+    except Exception:
+        logger.exception("Batch prediction error")
+        return jsonify({"error": "Failed to process batch prediction"}), 500
+
+@api.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters of the /predict response cache"""
+    if response_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **response_cache.snapshot()}), 200
+
+@api.route('/models', methods=['GET'])
+def list_models():
+    """Served model versions, the default one and artifacts the registry rejected"""
+    return jsonify(registry.describe()), 200
+
+# (stat signature, parsed file) of the risk aggregates last read
+_risk_aggregates = [None, None]
+
+def load_risk_aggregates():
+    """Saved risk cubes, re-read only when the file changes; None when there are none"""
+    try:
+        stat = os.stat(risk_aggregates_path)
+    except OSError:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+    if _risk_aggregates[0] != signature:
+        with open(risk_aggregates_path) as f:
+            _risk_aggregates[:] = [signature, json.load(f)]
+    return _risk_aggregates[1]
+
+@api.route('/risk-aggregates', methods=['GET'])
+def risk_aggregates():
+    """
+    Precomputed high-risk rates and counts (see risk_aggregation.py)
+    ?dims=hour,road_type returns that cube; without dims, the cubes available
+    """
+    aggregates = load_risk_aggregates()
+    if aggregates is None:
+        return jsonify({"error": "No risk aggregates. Build them with: python risk_aggregation.py"}), 404
+    dims = [dim.strip() for dim in request.args.get('dims', '').split(',') if dim.strip()]
+    if not dims:
         return jsonify({
-            "prediction": {
-                "risk_level": risk_level,
-                "probability": f"{final_probability:.2%}",
-                "raw_probability": f"{raw_probability:.2%}",
-                "risk_factors": risk_factors,
-                "recommendations": recommendations
-            },
-            "input_data": data
+            "updated": aggregates['updated'],
+            "rows": aggregates['rows'],
+            "cubes": list(aggregates['cubes']),
         }), 200
+    unknown = [dim for dim in dims if dim not in DIMENSIONS]
+    name = cube_name(dims) if not unknown else None
+    if name not in aggregates['cubes']:
+        return jsonify({"error": f"No cube over {','.join(dims)}", "dimensions": DIMENSIONS,
+                        "cubes": list(aggregates['cubes'])}), 404
+    return jsonify({"updated": aggregates['updated'], "rows": aggregates['rows'], **aggregates['cubes'][name]}), 200
 
-    except Exception as e:
-        print(f"Prediction error: {str(e)}")
-        return jsonify({"error": "Failed to process prediction"}), 500 
\ No newline at end of file
+def _option_position(field, text):
+    """Position of a query-string value among a field's options, or None"""
+    for position, option in enumerate(GRID_OPTIONS[field]):
+        if str(option) == text:
+            return position
+    return None
+
+def risk_surface(served, x, y, fixed, value='final'):
+    """
+    Probabilities over the options of fields x and y, from the model's scored grid
+    fixed maps other fields to option positions; the remaining fields are
+    averaged over their options (each option weighted equally)
+    Returns (probability, high-risk share), both shaped (len(x options), len(y options))
+    """
+    fields = list(GRID_OPTIONS)
+    grid = served.grid_probabilities[value]
+    high_risk = (served.grid_probabilities['final'] > served.high_risk_threshold).astype(np.float64)
+    selection = tuple(fixed.get(field, slice(None)) for field in fields)
+    # Fixed axes are dropped by the integer indices; average the others except x and y
+    remaining = [field for field in fields if field not in fixed]
+    averaged = tuple(axis for axis, field in enumerate(remaining) if field not in (x, y))
+    order = [remaining.index(x), remaining.index(y)]
+    order = [sorted(order).index(axis) for axis in order]
+
+    def reduce(array):
+        return array[selection].mean(axis=averaged).transpose(order)
+
+    return reduce(grid), reduce(high_risk)
+
+@api.route('/risk-surface', methods=['GET'])
+def get_risk_surface():
+    """
+    Model risk over two input fields for heatmaps, e.g.
+    ?x=road_type&y=weather_conditions&speed_limit=60
+    Other fields given in the query are fixed, the rest are averaged over
+    their options. Served from the grid each model version scores once at
+    load, so a whole heatmap is one request and no model call
+    """
+    served, error = resolve_model(requested_version())
+    if error is not None:
+        return error
+    x, y = request.args.get('x'), request.args.get('y')
+    value = request.args.get('value', 'final')
+    if x not in GRID_OPTIONS or y not in GRID_OPTIONS or x == y:
+        return jsonify({"error": "x and y must be two different fields", "fields": list(GRID_OPTIONS)}), 400
+    if value not in ('final', 'raw'):
+        return jsonify({"error": "value must be 'final' or 'raw'"}), 400
+
+    fixed, errors = {}, {}
+    for field in GRID_OPTIONS:
+        if field in request.args and field not in (x, y):
+            position = _option_position(field, request.args[field])
+            if position is None:
+                errors[field] = f"Invalid value for {field}. Options are: {GRID_OPTIONS[field]}"
+            else:
+                fixed[field] = position
+    if errors:
+        return jsonify({"error": "Invalid input data", "details": errors}), 400
+
+    probability, high_risk_share = risk_surface(served, x, y, fixed, value)
+    return jsonify({
+        "x": {"field": x, "values": GRID_OPTIONS[x]},
+        "y": {"field": y, "values": GRID_OPTIONS[y]},
+        "fixed": {field: GRID_OPTIONS[field][position] for field, position in fixed.items()},
+        "averaged": [field for field in GRID_OPTIONS if field not in fixed and field not in (x, y)],
+        "value": value,
+        "probability": np.round(probability, 6).tolist(),
+        "high_risk_share": np.round(high_risk_share, 6).tolist(),
+        "high_risk_threshold": served.high_risk_threshold,
+    }), 200
@@ -0,0 +1,173 @@
+"""
+Metrics and logging for the API hot path
+
+Metrics are kept in-process (per worker) and rendered in the Prometheus
+text format by GET /metrics:
+- risk_api_stage_seconds{stage}: histogram per pipeline stage (validation,
+  feature_encoding, inference, postprocessing, serialization)
+- risk_api_request_seconds{endpoint}: histogram of whole requests
+- risk_api_requests_total{endpoint,status}, risk_api_errors_total{endpoint,status}
+- risk_api_predictions_total{risk_level}: every /predict answer, including cached ones
+- risk_api_model_info{version,path,fingerprint,default}: models in the registry
+- risk_api_model_load_seconds: load, validation and warm-up of the latest model
+- risk_api_model_swaps_total, risk_api_model_load_errors_total{path}
+- risk_api_response_cache_*: response cache counters
+
+Logging goes through the 'api' logger:
+    LOG_LEVEL        DEBUG, INFO (default), WARNING, ERROR; WARNING silences per-request logs
+    LOG_SAMPLE_RATE  fraction of per-request debug lines that are emitted (default 0.01)
+"""
+import bisect
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from a few microseconds (table lookups) to seconds (large batches)
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+logger = logging.getLogger('api')
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))
+
+
+def configure_logging():
+    """Set the 'api' logger level from LOG_LEVEL, adding a handler unless the server configured one"""
+    logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    if not logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+        logger.addHandler(handler)
+
+
+def log_sampled(message, *args, level=logging.DEBUG):
+    """Log a per-request line for a LOG_SAMPLE_RATE fraction of calls, if the level is enabled"""
+    if logger.isEnabledFor(level) and random.random() < LOG_SAMPLE_RATE:
+        logger.log(level, message, *args)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f'{self.name}{_format_labels(self.labels, values)} {value}' for values, value in items)
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def replace(self, values):
+        """Replace every series with {label values: value}"""
+        with self._lock:
+            self._values = dict(values)
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f'# TYPE {self.name} gauge'
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # {label values: [per-bucket counts (+Inf last), sum]}
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((values, (list(counts), total)) for values, (counts, total) in self._series.items())
+        names = self.labels + ('le',)
+        for values, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(names, values + (le,))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, values)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, values)} {cumulative}')
+        return lines
+
+
+STAGE_SECONDS = Histogram('risk_api_stage_seconds', 'Time spent in each prediction stage', ['stage'])
+REQUEST_SECONDS = Histogram('risk_api_request_seconds', 'Request latency by endpoint', ['endpoint'])
+REQUESTS = Counter('risk_api_requests_total', 'Requests by endpoint and status', ['endpoint', 'status'])
+ERRORS = Counter('risk_api_errors_total', 'Requests answered with an error status', ['endpoint', 'status'])
+PREDICTIONS = Counter('risk_api_predictions_total', 'Predictions by risk level', ['risk_level'])
+MODEL_INFO = Gauge('risk_api_model_info', 'Model artifacts in the registry (value is always 1)',
+                   ['version', 'path', 'fingerprint', 'default'])
+MODEL_LOAD_SECONDS = Gauge('risk_api_model_load_seconds', 'Time taken to load, validate and warm up the latest model')
+MODEL_SWAPS = Counter('risk_api_model_swaps_total', 'Registry updates that changed the served models')
+MODEL_LOAD_ERRORS = Counter('risk_api_model_load_errors_total', 'Artifacts rejected by the registry', ['path'])
+METRICS = [STAGE_SECONDS, REQUEST_SECONDS, REQUESTS, ERRORS, PREDICTIONS, MODEL_INFO, MODEL_LOAD_SECONDS,
+           MODEL_SWAPS, MODEL_LOAD_ERRORS]
+
+
+def record_request(endpoint, status, seconds):
+    REQUESTS.inc(endpoint, status)
+    if status >= 400:
+        ERRORS.inc(endpoint, status)
+    REQUEST_SECONDS.observe(seconds, endpoint)
+
+
+def render_metrics(response_cache=None):
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    if response_cache is not None:
+        stats = response_cache.stats
+        for name, value in (('hits', stats.hits), ('misses', stats.misses), ('evictions', stats.evictions)):
+            lines.append(f'# TYPE risk_api_response_cache_{name}_total counter')
+            lines.append(f'risk_api_response_cache_{name}_total {value}')
+    return '\n'.join(lines) + '\n'
@@ -1,6 +1,8 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 from flask_cors import CORS
+from api import routes
 from api.routes import api  # Import the API blueprint
+from api.telemetry import render_metrics
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -23,5 +25,10 @@ def internal_error(error):
 def health_check():
     return jsonify({"status": "healthy"}), 200
 
+# Prometheus-style metrics for this worker
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(routes.response_cache), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
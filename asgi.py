@@ -0,0 +1,274 @@
+"""
+ASGI entry point with micro-batching of concurrent /api/predict requests
+
+Serves the same /api/predict, /health and /metrics contract as app.py, but
+concurrent predict requests are queued and scored together: the batcher
+takes whatever is waiting, and when recent batches show concurrency it
+waits up to MICROBATCH_MAX_WAIT_MS for more (up to MICROBATCH_MAX_SIZE),
+then scores them with one vectorized model call off the event loop and
+fans the responses back out. Under light load requests are scored
+immediately, so single-request latency does not pay the wait. Requests
+pinned to a model version (X-Model-Version header or ?model_version=)
+share batches with the rest and are scored per version; ?explain=true
+adds the explanation as in app.py.
+
+Run with any ASGI server, e.g.
+    uvicorn asgi:app --workers 2
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+"""
+import asyncio
+import json
+import os
+import time
+from urllib.parse import parse_qs
+
+from api import routes
+from api.telemetry import PREDICTIONS, STAGE_SECONDS, logger, record_request, render_metrics
+
+MAX_BATCH_SIZE = int(os.environ.get('MICROBATCH_MAX_SIZE', 64))
+MAX_WAIT_MS = float(os.environ.get('MICROBATCH_MAX_WAIT_MS', 2))
+
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+
+def dumps(payload):
+    """Serialize like Flask's JSON provider (sorted keys, compact, trailing newline)"""
+    return (json.dumps(payload, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+def score_predictions(items):
+    """
+    Score (served model, validated scenario, explain flag) items with one
+    model call per model version and build each response body, in input order
+    """
+    positions = {}
+    for i, (served, _, _) in enumerate(items):
+        positions.setdefault(served, []).append(i)
+
+    responses = [None] * len(items)
+    for served, group in positions.items():
+        records = [items[i][1] for i in group]
+        indices = routes.option_index_arrays(records)
+        raw_probabilities, _, final_probabilities = routes.score_batch(records, indices, served)
+        with STAGE_SECONDS.time('postprocessing'):
+            predictions = routes.build_predictions(records, final_probabilities, raw_probabilities, indices, served)
+        for prediction in predictions:
+            PREDICTIONS.inc(prediction['risk_level'])
+        payloads = [{"prediction": prediction, "input_data": data} for data, prediction in zip(records, predictions)]
+        explained = [j for j, i in enumerate(group) if items[i][2]]
+        if explained:
+            explained_indices = {field: values[explained] for field, values in indices.items()}
+            explanations = routes.explain_predictions(explained_indices, served)
+            for j, explanation in zip(explained, explanations):
+                payloads[j]["explanation"] = explanation
+        with STAGE_SECONDS.time('serialization'):
+            for i, payload in zip(group, payloads):
+                responses[i] = dumps(payload)
+    return responses
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into batches for score_fn(records) -> results
+    The wait for more requests adapts to load: it is only paid while the
+    recent average batch size shows requests actually arrive together
+    """
+
+    def __init__(self, score_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        # Moving average of recent batch sizes
+        self.load = 1.0
+        self.batches = 0
+        self.requests = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def submit(self, record):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((record, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        while len(batch) < self.max_batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+
+        if self.load > 1.5 and len(batch) < self.max_batch_size:
+            deadline = asyncio.get_running_loop().time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self.load = 0.8 * self.load + 0.2 * len(batch)
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                results = await loop.run_in_executor(None, self.score_fn, [record for record, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def respond(send, status, body, content_type=b'application/json', headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode()),
+                    *CORS_HEADERS, *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def requested_version(scope):
+    """Model version pinned by the X-Model-Version header or ?model_version=, or None"""
+    header = routes.MODEL_VERSION_HEADER.lower().encode()
+    for name, value in scope.get('headers', ()):
+        if name == header and value:
+            return value.decode('latin-1')
+    return parse_qs(scope.get('query_string', b'').decode('latin-1')).get('model_version', [None])[0]
+
+
+def explain_requested(scope):
+    """Whether the request opted in to explanations with ?explain=true"""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return query.get('explain', [''])[0].lower() in routes.EXPLAIN_VALUES
+
+
+async def predict(body, batcher, version=None, explain=False):
+    """Same responses as routes.predict; returns (status, body bytes, model version or None)"""
+    try:
+        served = routes.registry.resolve(version)
+    except KeyError:
+        available = sorted(routes.registry.snapshot.versions)
+        return 404, dumps({"error": f"Unknown model version {version!r}", "available_versions": available}), None
+    if served is None:
+        return 500, dumps({"error": "Model not loaded. Please try again later."}), None
+    status, response = await predict_with(served, body, batcher, explain)
+    return status, response, served.version
+
+
+async def predict_with(served, body, batcher, explain=False):
+    try:
+        data = json.loads(body)
+        if not data:
+            return 400, dumps({"error": "No data provided"})
+
+        cache_key = None
+        if routes.response_cache is not None:
+            cache_key = routes.response_cache.key(data, served.fingerprint + (':explain' if explain else ''))
+            cached = routes.response_cache.get(cache_key)
+            if cached is not None:
+                routes.count_cached_prediction(cached)
+                return 200, cached
+
+        with STAGE_SECONDS.time('validation'):
+            validation_errors = routes.validate_input(data)
+        if validation_errors:
+            return 400, dumps({"error": "Invalid input data", "details": validation_errors})
+
+        if served.prediction_table is not None:
+            prediction = served.prediction_table.lookup(data)
+            PREDICTIONS.inc(prediction['risk_level'])
+            payload = {"prediction": prediction, "input_data": data}
+            if explain:
+                payload["explanation"] = routes.explain_predictions(routes.option_index_arrays([data]), served)[0]
+            response = dumps(payload)
+        else:
+            response = await batcher.submit((served, data, explain))
+
+        if cache_key is not None:
+            routes.response_cache.put(cache_key, response)
+        return 200, response
+    except Exception:
+        logger.exception("Prediction error")
+        return 500, dumps({"error": "Failed to process prediction"})
+
+
+def create_app(max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+    """Build the ASGI application; each event loop gets its own batcher"""
+    batchers = {}
+
+    def get_batcher():
+        loop = asyncio.get_running_loop()
+        if loop not in batchers:
+            batchers[loop] = MicroBatcher(score_predictions, max_batch_size, max_wait_ms)
+        return batchers[loop]
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    get_batcher().start()
+                    routes.registry.start()
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await get_batcher().stop()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        path, method = scope['path'].rstrip('/') or '/', scope['method']
+        if path == '/health' and method == 'GET':
+            await respond(send, 200, dumps({"status": "healthy"}))
+        elif path == '/metrics' and method == 'GET':
+            await respond(send, 200, render_metrics(routes.response_cache).encode(),
+                          content_type=b'text/plain; version=0.0.4; charset=utf-8')
+        elif path == '/api/predict' and method == 'POST':
+            start = time.perf_counter()
+            routes.registry.start()
+            status, body, version = await predict(await read_body(receive), get_batcher(), requested_version(scope),
+                                                  explain_requested(scope))
+            headers = [(routes.MODEL_VERSION_HEADER.lower().encode(), str(version).encode())] if version else []
+            await respond(send, status, body, headers=headers)
+            record_request('api.predict', status, time.perf_counter() - start)
+        elif path == '/api/predict' and method == 'OPTIONS':
+            await respond(send, 200, b'', content_type=b'text/html; charset=utf-8', headers=[
+                (b'access-control-allow-methods', b'POST, OPTIONS'),
+                (b'access-control-allow-headers', b'content-type, ' + routes.MODEL_VERSION_HEADER.lower().encode()),
+            ])
+        else:
+            await respond(send, 404, dumps({"error": "Not found"}))
+
+    app.batchers = batchers
+    return app
+
+
+app = create_app()
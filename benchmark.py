@@ -0,0 +1,352 @@
+"""
+Benchmarks for the prediction service and the training pipeline
+
+Serving (against the API's model, or --model):
+- startup: importing api.routes (which loads the model) and load_model alone
+- single-row latency percentiles of preprocess_input, model.predict_proba,
+  adjust_probability, postprocess_probability (calibration, or the legacy
+  adjustment and blend) and the full in-process /api/predict round trip,
+  plain and with ?explain=true (after the one-off grid explanation, timed apart)
+- batch throughput of score_batch and /api/predict/batch at several batch sizes
+Training (on a synthetic dataset from synthetic_data.py):
+- stage timings for load, features, SMOTE, fit, evaluate and calibrate, as in Classification.py
+Each section runs in a fresh interpreter, so startup time and peak RSS are
+its own. Results are written as JSON; --baseline compares them with an
+earlier run and exits non-zero on regressions:
+    python benchmark.py [--rows 200000] [--output benchmark_results.json] [--baseline old.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+RESULTS_PATH = "benchmark_results.json"
+DATA_DIR = os.path.join(".cache", "benchmark")
+RESULTS_FORMAT_VERSION = 1
+SYNTHETIC_ROWS = 200_000
+SINGLE_ROW_CALLS = 2000
+BATCH_SIZES = [1, 16, 256, 4096]
+BATCH_REPEATS = 5
+# Relative change beyond which --baseline reports a regression
+REGRESSION_TOLERANCE = 0.2
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def _percentiles(timings):
+    """Latency summary of per-call timings, in microseconds"""
+    timings = np.asarray(timings) * 1e6
+    p50, p90, p99 = np.percentile(timings, [50, 90, 99])
+    return {'p50_us': float(p50), 'p90_us': float(p90), 'p99_us': float(p99), 'mean_us': float(timings.mean())}
+
+
+def _time_calls(fn, args_list):
+    """Per-call wall time of fn(*args) over args_list, after one warm-up call"""
+    fn(*args_list[0])
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _throughput(fn, batch, repeats=BATCH_REPEATS):
+    """Best-of-repeats rows per second of fn(batch)"""
+    fn(batch)
+    best = min(_time_calls(fn, [(batch,)] * repeats))
+    return {'rows_per_s': len(batch) / best, 'batch_seconds': best}
+
+
+def benchmark_serving(model_path=None, single_row_calls=SINGLE_ROW_CALLS, batch_sizes=BATCH_SIZES):
+    """Startup, single-row latency and batch throughput of the API (run in a fresh process)"""
+    # Measure the model path, not the response cache or the lookup table
+    os.environ['RESPONSE_CACHE_SIZE'] = '0'
+    os.environ['PREDICTION_TABLE_MODE'] = '0'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    # Only the default model, without the background watcher
+    os.environ['MODEL_REGISTRY_DIR'] = ''
+    os.environ['MODEL_REGISTRY_POLL_SECONDS'] = '0'
+    if model_path:
+        os.environ['MODEL_PATH'] = os.path.abspath(model_path)
+
+    start = time.perf_counter()
+    from api import routes
+    import_seconds = time.perf_counter() - start
+    served = routes.registry.resolve()
+    if served is None:
+        raise RuntimeError(f"Model could not be loaded from {routes.model_path}")
+    startup_rss_mb = _peak_rss_mb()
+
+    from api.model_store import load_model
+    from api.prediction_table import grid_records
+    from app import app
+
+    start = time.perf_counter()
+    load_model(served.path)
+    load_seconds = time.perf_counter() - start
+
+    grid = grid_records({field: rules['options'] for field, rules in routes.INPUT_VALIDATORS.items()})
+    rng = np.random.default_rng(0)
+    records = [grid[i] for i in rng.integers(0, len(grid), single_row_calls)]
+    rows = [routes.preprocess_input(record) for record in records]
+    raw = [float(p) for p in served.model.predict_proba(np.vstack(rows))[:, 1]]
+    client = app.test_client()
+
+    def round_trip(record, url='/api/predict'):
+        response = client.post(url, json=record)
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/predict returned {response.status_code}")
+
+    # A fresh explainer, since the served one was warmed up when the model was loaded
+    start = time.perf_counter()
+    routes.Explainer(served.model, served.feature_pipeline, lambda: routes.preprocess_batch(grid, served)).contributions
+    explain_grid_seconds = time.perf_counter() - start
+
+    single_row = {
+        'preprocess_input': _percentiles(_time_calls(routes.preprocess_input, [(r,) for r in records])),
+        'predict_proba': _percentiles(_time_calls(served.model.predict_proba, [(row,) for row in rows])),
+        'adjust_probability': _percentiles(_time_calls(routes.adjust_probability, [(p,) for p in raw])),
+        'postprocess_probability': _percentiles(
+            _time_calls(routes.postprocess_probability, list(zip(records, raw)))),
+        'api_predict': _percentiles(_time_calls(round_trip, [(r,) for r in records])),
+        'api_predict_explain': _percentiles(
+            _time_calls(round_trip, [(r, '/api/predict?explain=true') for r in records])),
+    }
+
+    def batch_endpoint(batch, url='/api/predict/batch'):
+        response = client.post(url, json=batch)
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/predict/batch returned {response.status_code}")
+
+    def explained_batch_endpoint(batch):
+        batch_endpoint(batch, '/api/predict/batch?explain=true')
+
+    batches = {}
+    for size in batch_sizes:
+        batch = [grid[i] for i in rng.integers(0, len(grid), size)]
+        batches[str(size)] = {
+            'score_batch': _throughput(routes.score_batch, batch),
+            'api_predict_batch': _throughput(batch_endpoint, batch),
+            'api_predict_batch_explain': _throughput(explained_batch_endpoint, batch),
+        }
+
+    return {
+        'model': {
+            'path': os.path.relpath(served.path),
+            'version': served.version,
+            'fingerprint': served.fingerprint,
+            'n_features': len(served.feature_names),
+        },
+        'startup': {
+            'import_seconds': import_seconds,
+            'model_load_seconds': load_seconds,
+            'rss_mb': startup_rss_mb,
+            'explain_grid_seconds': explain_grid_seconds,
+        },
+        'single_row': single_row,
+        'batch': batches,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def benchmark_training(data_path, test_size=0.15, random_state=42):
+    """Stage timings of the Classification.py pipeline on data_path (run in a fresh process)"""
+    import xgboost as xgb
+    from imblearn.over_sampling import SMOTE
+    from sklearn.metrics import roc_auc_score
+    from sklearn.model_selection import train_test_split
+
+    from calibration import fit_calibration
+    from data_loader import CHUNK_SIZE, read_chunks, read_labels
+    from features import FeaturePipeline
+    from model_params import BASELINE_XGB_PARAMS, SMOTE_SAMPLING_STRATEGY
+
+    stages = {}
+
+    # Parse the CSV and make the same stratified split as data_loader
+    start = time.perf_counter()
+    _, y = read_labels(data_path)
+    chunks = [chunk for _, chunk in read_chunks(data_path)]
+    main_idx, holdout_idx = train_test_split(
+        np.arange(len(y)), test_size=test_size, stratify=y, random_state=random_state
+    )
+    is_main = np.zeros(len(y), dtype=bool)
+    is_main[main_idx] = True
+    stages['load'] = time.perf_counter() - start
+
+    # Fit the pipeline on the main split and encode every row
+    start = time.perf_counter()
+    starts = np.cumsum([0] + [len(chunk) for chunk in chunks])
+    feature_pipeline = FeaturePipeline().fit_chunks(
+        chunk[is_main[offset:offset + len(chunk)]] for offset, chunk in zip(starts, chunks)
+    )
+    buffer = np.empty((CHUNK_SIZE, len(feature_pipeline.feature_names)), dtype=np.float32)
+    X = np.vstack([feature_pipeline.transform(chunk, out=buffer).copy() for chunk in chunks])
+    X_main, X_holdout = X[main_idx], X[holdout_idx]
+    stages['features'] = time.perf_counter() - start
+
+    # Class 0 is High, the high-risk class
+    y_main, y_holdout = (y[main_idx] == 0).astype(int), (y[holdout_idx] == 0).astype(int)
+
+    start = time.perf_counter()
+    X_resampled, y_resampled = SMOTE(
+        sampling_strategy=SMOTE_SAMPLING_STRATEGY, random_state=random_state
+    ).fit_resample(X_main, y_main)
+    stages['smote'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = xgb.XGBClassifier(**BASELINE_XGB_PARAMS)
+    model.fit(X_resampled, y_resampled)
+    stages['fit'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    holdout_probabilities = model.predict_proba(X_holdout)[:, 1]
+    roc_auc = roc_auc_score(y_holdout, holdout_probabilities)
+    stages['evaluate'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    calibrator = fit_calibration(holdout_probabilities, y_holdout)
+    stages['calibrate'] = time.perf_counter() - start
+
+    return {
+        'rows': len(y),
+        'resampled_rows': len(y_resampled),
+        'stage_seconds': stages,
+        'total_seconds': sum(stages.values()),
+        'holdout_roc_auc': float(roc_auc),
+        'calibration': {'method': calibrator.method, 'brier': calibrator.scores[calibrator.method]},
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def run_isolated(fn, *args):
+    """Call fn(*args) in a freshly spawned interpreter and return its result"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def synthetic_dataset(n_rows, seed=0, data_dir=DATA_DIR):
+    """Path of a synthetic CSV with n_rows rows, generated on first use"""
+    from synthetic_data import write_accident_data
+
+    path = os.path.join(data_dir, f"synthetic_{n_rows}_{seed}.csv")
+    if not os.path.exists(path):
+        print(f"Generating {n_rows} synthetic rows in {path}...")
+        os.makedirs(data_dir, exist_ok=True)
+        write_accident_data(path + '.tmp', n_rows, seed)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def _metrics(results, prefix=''):
+    """Flatten nested results into {dotted.key: value} for numeric leaves"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_metrics(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_results(baseline, current, tolerance=REGRESSION_TOLERANCE):
+    """
+    Metrics that got worse by more than tolerance (relative) since baseline
+    Latency, durations and memory should go down; throughput and ROC AUC up
+    Returns a list of (metric, baseline value, current value)
+    """
+    old, new = _metrics(baseline), _metrics(current)
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        if name.endswith(('_us', '_seconds', '_mb')) or '.stage_seconds.' in name:
+            worse = new[name] > old[name] * (1 + tolerance)
+        elif name.endswith('rows_per_s'):
+            worse = new[name] < old[name] * (1 - tolerance)
+        elif name.endswith('roc_auc'):
+            # Quality regressions are reported at a much finer grain than speed
+            worse = new[name] < old[name] - 0.01
+        else:
+            continue
+        if worse:
+            regressions.append((name, old[name], new[name]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--model', help='model artifact to serve (default: the API default)')
+    parser.add_argument('--data', help='training CSV (default: a generated synthetic dataset)')
+    parser.add_argument('--rows', type=int, default=SYNTHETIC_ROWS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--calls', type=int, default=SINGLE_ROW_CALLS)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=BATCH_SIZES)
+    parser.add_argument('--skip-serving', action='store_true')
+    parser.add_argument('--skip-training', action='store_true')
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--baseline', help='earlier results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    results = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+    }
+
+    if not args.skip_serving:
+        print("Benchmarking the prediction service...")
+        results['serving'] = run_isolated(benchmark_serving, args.model, args.calls, args.batch_sizes)
+        single_row = results['serving']['single_row']
+        for name, summary in single_row.items():
+            print(f"  {name:<24} p50 {summary['p50_us']:9.1f} us   p99 {summary['p99_us']:9.1f} us")
+        for size, timings in results['serving']['batch'].items():
+            print(f"  batch {size:>5}: score_batch {timings['score_batch']['rows_per_s']:10.0f} rows/s, "
+                  f"endpoint {timings['api_predict_batch']['rows_per_s']:10.0f} rows/s, "
+                  f"explained {timings['api_predict_batch_explain']['rows_per_s']:10.0f} rows/s")
+        print(f"  explaining the input grid once: {results['serving']['startup']['explain_grid_seconds']:.2f} s")
+
+    if not args.skip_training:
+        data_path = args.data or synthetic_dataset(args.rows, args.seed)
+        print(f"Benchmarking training on {data_path}...")
+        results['training'] = run_isolated(benchmark_training, data_path)
+        results['training']['data'] = os.path.basename(data_path)
+        for stage, seconds in results['training']['stage_seconds'].items():
+            print(f"  {stage:<10} {seconds:8.2f} s")
+        print(f"  holdout ROC AUC {results['training']['holdout_roc_auc']:.4f}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.tolerance)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:.4g} -> {new:.4g}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+Offline bulk scoring of accident records
+
+Streams a CSV or Parquet file in chunks, encodes each chunk with the
+model's fitted feature pipeline and scores the chunks across a pool of
+worker processes, writing the probabilities and risk levels to the output
+file as chunks complete (in input order):
+    python bulk_scoring.py --input accidents.csv --output scores.csv
+        [--model best_model.meta.json] [--workers 4] [--chunksize 100000] [--keep accident_index ...]
+        [--explain]
+
+Each worker loads the model once (the native .meta.json export by
+default, so workers unpickle nothing and need no xgboost) and receives
+only the columns the pipeline reads. At most two chunks per worker are in
+flight, so memory is bounded by the chunk size and the worker count, not
+by the size of the input. Output columns are the --keep columns followed
+by raw_probability, probability (calibrated when the artifact carries a
+calibration) and risk_level.
+
+risk_level is probability > the calibration's fitted threshold. Artifacts
+without a calibration (such as the shipped best_model.joblib) use raw
+probability > 0.5, the rule model.predict applies. This deliberately
+differs from /api/predict for those artifacts. The API adjusts the raw
+probability and blends in a rule-based score computed from its scenario
+fields (time of day, weather and junction labels), then cuts at 0.70.
+Dataset records carry codes and clock times rather than those fields, so
+the offline labels are the model's own. Calibrated artifacts are labelled
+identically offline and online. --explain adds the model's contribution of
+each feature column to every record's log-odds (TreeSHAP, one-hot columns
+summed per source column) plus the bias, as contribution_<column>
+columns. Parquet input or output needs pyarrow.
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from api.explanations import feature_groups, model_contributions
+from api.model_store import default_model_path, load_artifact
+from data_loader import CHUNK_SIZE, CSV_DTYPES, TRAINING_COLS
+
+# Columns the feature pipeline reads (the training columns without the label)
+SCORING_COLS = [col for col in TRAINING_COLS if col != "risk_level"]
+# Threshold on the raw probability for artifacts without a calibration, as model.predict uses;
+# not the API's blended 0.70 cut-off (see the module docstring)
+DEFAULT_THRESHOLD = 0.5
+RISK_LEVELS = np.array(["Not High Risk", "High Risk"])
+OUTPUT_COLS = ["raw_probability", "probability", "risk_level"]
+# Chunks queued per worker; bounds memory while keeping every worker busy
+CHUNKS_PER_WORKER = 2
+PROGRESS_SECONDS = 10
+
+# Per-process model state, set by _init_worker
+_scorer = None
+
+
+def _is_parquet(path):
+    return path.lower().endswith((".parquet", ".pq"))
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise ImportError("Parquet input and output need the pyarrow package (pip install pyarrow)") from None
+
+
+def read_input(path, columns, chunksize=CHUNK_SIZE):
+    """Yield DataFrame chunks of the given columns from a CSV or Parquet file"""
+    if _is_parquet(path):
+        parquet = _pyarrow().parquet.ParquetFile(path)
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    dtypes = {col: dtype for col, dtype in CSV_DTYPES.items() if col in columns}
+    yield from pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunksize)
+
+
+class OutputWriter:
+    """Append scored chunks to a CSV or Parquet file, renamed into place on close"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.parquet = _is_parquet(path)
+        self._writer = None
+        self._header = True
+
+    def write(self, frame):
+        if self.parquet:
+            pyarrow = _pyarrow()
+            table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pyarrow.parquet.ParquetWriter(self.tmp_path, table.schema)
+            self._writer.write_table(table)
+        else:
+            frame.to_csv(self.tmp_path, mode="w" if self._header else "a", header=self._header,
+                         index=False, float_format="%.6f")
+        self._header = False
+
+    def close(self, columns=()):
+        if self._header:
+            # No rows: still write the columns so the output is a valid empty file
+            self.write(pd.DataFrame(columns=list(columns)))
+        if self._writer is not None:
+            self._writer.close()
+        os.replace(self.tmp_path, self.path)
+
+
+class Scorer:
+    """Feature pipeline, model and calibration of one artifact"""
+
+    def __init__(self, model_path, explain=False):
+        artifact = load_artifact(model_path)
+        self.model = artifact["model"]
+        self.feature_pipeline = artifact["feature_pipeline"]
+        self.calibrator = artifact["calibrator"]
+        self.version = artifact["version"]
+        self.fingerprint = artifact["fingerprint"]
+        self.threshold = DEFAULT_THRESHOLD
+        if self.calibrator is not None and self.calibrator.threshold is not None:
+            self.threshold = self.calibrator.threshold
+        # Workers already run in parallel; keep XGBoost from oversubscribing the cores
+        if hasattr(self.model, "set_params"):
+            self.model.set_params(n_jobs=1)
+        self.explain = explain
+        group_names, self._groups = feature_groups(self.feature_pipeline.feature_names,
+                                                   self.feature_pipeline.categorical_cols)
+        self.contribution_cols = [f"contribution_{name}" for name in group_names] + ["contribution_bias"]
+        self._buffer = None
+
+    def score(self, chunk):
+        """
+        (raw, calibrated) high-risk probabilities for a chunk of raw records,
+        plus the (n_rows, n_columns + 1) log-odds contributions when explaining (else None)
+        """
+        if self._buffer is None or len(self._buffer) < len(chunk):
+            self._buffer = np.empty((len(chunk), len(self.feature_pipeline.feature_names)), dtype=np.float32)
+        X = self.feature_pipeline.transform(chunk, out=self._buffer[:len(chunk)])
+        raw = self.model.predict_proba(X)[:, 1].astype(np.float32)
+        probability = raw if self.calibrator is None else self.calibrator.transform(raw).astype(np.float32)
+        contributions = None
+        if self.explain:
+            phi = np.asarray(model_contributions(self.model, X), dtype=np.float64)
+            contributions = np.column_stack([phi[:, :-1] @ self._groups, phi[:, -1]]).astype(np.float32)
+        return raw, probability, contributions
+
+
+def _init_worker(model_path, explain=False):
+    global _scorer
+    _scorer = Scorer(model_path, explain)
+
+
+def _score_chunk(chunk):
+    return _scorer.score(chunk)
+
+
+def score_file(input_path, output_path, model_path=None, workers=None, chunksize=CHUNK_SIZE, keep=(),
+               explain=False):
+    """
+    Score (and with explain, explain) every record of input_path into output_path
+    workers=0 scores in this process; None uses one worker per CPU
+    Returns a summary dict (rows, high-risk rows, seconds, rows per second)
+    """
+    model_path = model_path or default_model_path(".")
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    keep = list(keep)
+    columns = list(dict.fromkeys(SCORING_COLS + keep))
+
+    # The main process needs the threshold; it also scores when there is no pool
+    _init_worker(model_path, explain)
+    scorer = _scorer
+    print(f"Scoring {input_path} with model version {scorer.version} ({os.path.basename(model_path)}) "
+          f"on {workers or 'no'} worker processes, {chunksize} rows per chunk")
+
+    writer = OutputWriter(output_path)
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_path, explain)) if workers else None
+    pending = deque()
+    rows = high_risk = 0
+    start = last_report = time.perf_counter()
+
+    def write_next():
+        nonlocal rows, high_risk, last_report
+        chunk_keep, result = pending.popleft()
+        raw, probability, contributions = result.result() if pool is not None else result
+        high = probability > scorer.threshold
+        scored = chunk_keep.assign(
+            raw_probability=raw, probability=probability, risk_level=RISK_LEVELS[high.astype(np.intp)]
+        )
+        if contributions is not None:
+            scored[scorer.contribution_cols] = contributions
+        writer.write(scored)
+        rows += len(raw)
+        high_risk += int(high.sum())
+        now = time.perf_counter()
+        if now - last_report >= PROGRESS_SECONDS:
+            print(f"  {rows:,} rows scored, {rows / (now - start):,.0f} rows/s")
+            last_report = now
+
+    try:
+        for chunk in read_input(input_path, columns, chunksize):
+            chunk_keep = chunk[keep].reset_index(drop=True)
+            features = chunk[SCORING_COLS]
+            if pool is None:
+                pending.append((chunk_keep, scorer.score(features)))
+            else:
+                pending.append((chunk_keep, pool.submit(_score_chunk, features)))
+            while len(pending) >= max(workers, 1) * CHUNKS_PER_WORKER:
+                write_next()
+        while pending:
+            write_next()
+        writer.close(keep + OUTPUT_COLS + (scorer.contribution_cols if explain else []))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if os.path.exists(writer.tmp_path):
+            os.remove(writer.tmp_path)
+
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "high_risk_rows": high_risk,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+        "model_version": scorer.version,
+        "model_fingerprint": scorer.fingerprint,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--input", required=True, help="CSV or Parquet file of accident records")
+    parser.add_argument("--output", required=True, help="CSV or Parquet file to write (by extension)")
+    parser.add_argument("--model", help="model artifact (default: best_model.meta.json, else best_model.joblib)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU, 0: none)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--keep", nargs="*", default=[], help="input columns copied to the output")
+    parser.add_argument("--explain", action="store_true", help="add per-column log-odds contributions")
+    args = parser.parse_args()
+
+    summary = score_file(args.input, args.output, args.model, args.workers, args.chunksize, args.keep,
+                         args.explain)
+    share = summary["high_risk_rows"] / summary["rows"] if summary["rows"] else 0.0
+    print(f"Scored {summary['rows']:,} rows in {summary['seconds']:.1f}s "
+          f"({summary['rows_per_second']:,.0f} rows/s); {share:.1%} high risk. Saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Probability calibration fitted offline and applied with np.interp
+
+The classifier is trained on SMOTE-resampled data with scale_pos_weight,
+so its raw probabilities overstate the high-risk rate. Classification.py
+fits a monotone map from raw to calibrated probabilities on the holdout
+split (isotonic regression or Platt scaling, whichever has the lower
+cross-validated Brier score) and stores it in the model artifact as
+sorted knot arrays. Serving applies it with a single np.interp call and
+needs neither sklearn nor per-request branching.
+"""
+import numpy as np
+
+CALIBRATION_METHODS = ('isotonic', 'platt')
+# Platt scaling is sampled at evenly spaced logits in [-LOGIT_RANGE, LOGIT_RANGE]
+PLATT_KNOTS = 129
+LOGIT_RANGE = 9.0
+
+
+def _logit(p):
+    p = np.clip(np.asarray(p, dtype=np.float64), 1e-7, 1 - 1e-7)
+    return np.log(p / (1 - p))
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class ProbabilityCalibrator:
+    """Piecewise-linear map from raw model probabilities to calibrated ones"""
+
+    def __init__(self, x, y, method, threshold=None, scores=None):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        if self.x.ndim != 1 or self.x.shape != self.y.shape or len(self.x) < 2:
+            raise ValueError("Calibration needs matching 1-d knot arrays with at least two knots")
+        if np.any(np.diff(self.x) <= 0):
+            raise ValueError("Calibration knots must be strictly increasing")
+        self.method = method
+        # Calibrated probability above which a scenario is high risk (None: the API default)
+        self.threshold = threshold
+        # Cross-validated Brier score per method when fitted by fit_calibration
+        self.scores = scores or {}
+
+    def transform(self, probabilities):
+        """Calibrated probabilities; inputs outside the knots take the end values"""
+        return np.interp(probabilities, self.x, self.y)
+
+    def to_dict(self):
+        """JSON-serializable state, stored in the model artifact and its native metadata"""
+        return {
+            'method': self.method,
+            'x': self.x.tolist(),
+            'y': self.y.tolist(),
+            'threshold': self.threshold,
+            'scores': self.scores,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state['x'], state['y'], state['method'], state.get('threshold'), state.get('scores'))
+
+
+def fit_isotonic(raw_probabilities, y):
+    """Isotonic regression; its breakpoints are the knots"""
+    from sklearn.isotonic import IsotonicRegression
+
+    isotonic = IsotonicRegression(y_min=0, y_max=1, out_of_bounds='clip').fit(raw_probabilities, y)
+    x, y_knots = isotonic.X_thresholds_, isotonic.y_thresholds_
+    if len(x) < 2:
+        # Constant fit: two knots spanning [0, 1]
+        x, y_knots = np.array([0.0, 1.0]), np.repeat(y_knots[:1], 2)
+    return ProbabilityCalibrator(x, y_knots, 'isotonic')
+
+
+def fit_platt(raw_probabilities, y, n_knots=PLATT_KNOTS):
+    """Platt scaling on the raw logit, sampled at evenly spaced logits"""
+    from sklearn.linear_model import LogisticRegression
+
+    logistic = LogisticRegression(C=1e6).fit(_logit(raw_probabilities)[:, np.newaxis], y)
+    grid = np.linspace(-LOGIT_RANGE, LOGIT_RANGE, n_knots)
+    calibrated = _sigmoid(logistic.coef_[0, 0] * grid + logistic.intercept_[0])
+    return ProbabilityCalibrator(_sigmoid(grid), calibrated, 'platt')
+
+
+FITTERS = {'isotonic': fit_isotonic, 'platt': fit_platt}
+
+
+def brier_score(probabilities, y):
+    return float(np.mean((np.asarray(probabilities) - np.asarray(y)) ** 2))
+
+
+def best_f1_threshold(probabilities, y):
+    """Probability threshold with the highest F1 score for the positive class"""
+    from sklearn.metrics import precision_recall_curve
+
+    precision, recall, thresholds = precision_recall_curve(y, probabilities)
+    f1 = 2 * precision[:-1] * recall[:-1] / np.maximum(precision[:-1] + recall[:-1], 1e-12)
+    # Scenarios strictly above the threshold are high risk, so step just below the cut
+    return float(np.nextafter(thresholds[np.argmax(f1)], 0))
+
+
+def fit_calibration(raw_probabilities, y, methods=CALIBRATION_METHODS, n_splits=5, random_state=42):
+    """
+    Pick the method with the lowest cross-validated Brier score and refit it on all rows
+    The returned calibrator carries the F1-optimal high-risk threshold and a
+    'scores' dict of cross-validated Brier scores per method (plus 'uncalibrated')
+    """
+    from sklearn.model_selection import StratifiedKFold
+
+    raw_probabilities = np.asarray(raw_probabilities, dtype=np.float64)
+    y = np.asarray(y)
+    folds = list(StratifiedKFold(n_splits, shuffle=True, random_state=random_state).split(raw_probabilities, y))
+    scores = {'uncalibrated': brier_score(raw_probabilities, y)}
+    for method in methods:
+        calibrated = np.empty_like(raw_probabilities)
+        for fit_idx, eval_idx in folds:
+            calibrator = FITTERS[method](raw_probabilities[fit_idx], y[fit_idx])
+            calibrated[eval_idx] = calibrator.transform(raw_probabilities[eval_idx])
+        scores[method] = brier_score(calibrated, y)
+
+    calibrator = FITTERS[min(methods, key=scores.get)](raw_probabilities, y)
+    calibrator.threshold = best_f1_threshold(calibrator.transform(raw_probabilities), y)
+    calibrator.scores = scores
+    return calibrator
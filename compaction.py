@@ -0,0 +1,204 @@
+"""
+Latency-aware compaction of the trained risk model
+
+Builds smaller candidates from best_model.joblib:
+- truncated ensembles (the first k trees of the booster)
+- distilled students: shallow XGBoost models trained on the full model's
+  probabilities for the main split (soft labels)
+measures holdout ROC AUC and inference cost (trees x depth: the nodes a
+row visits) for each, and keeps the cheapest candidate whose ROC AUC is
+within --tolerance of the full model. p50/p99 latency (single row and
+batch) of the API's numpy TreeEnsemble is reported alongside; it is not
+used for the choice, since timings on a shared machine are noisy. The
+chosen artifact is written next to the source as best_model_compact.joblib
+with its latency profile attached:
+    python compaction.py [--model best_model.joblib] [--tolerance 0.005]
+
+Serve it with MODEL_PATH=best_model_compact.joblib. For the API's
+closed input space, PREDICTION_TABLE_MODE (api/prediction_table.py) is
+the lookup-table alternative.
+"""
+import argparse
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import roc_auc_score
+
+from api.model_store import TreeEnsemble
+from calibration import fit_calibration
+from data_loader import DATA_PATH, load_training_data
+from features import load_feature_pipeline
+
+COMPACT_MODEL_NAME = "best_model_compact.joblib"
+AUC_TOLERANCE = 0.005
+TRUNCATION_SIZES = [10, 25, 50, 75]
+# (max_depth, n_estimators) for distilled students
+STUDENT_CONFIGS = [(2, 50), (3, 30), (3, 60), (4, 40)]
+SINGLE_ROW_CALLS = 200
+BATCH_SIZE = 256
+BATCH_CALLS = 30
+
+
+def _classifier_from_booster(booster):
+    """Wrap a Booster in an XGBClassifier so it keeps the predict_proba interface"""
+    model = xgb.XGBClassifier()
+    model.load_model(bytearray(booster.save_raw('json')))
+    return model
+
+
+def truncate(model, n_trees):
+    """Classifier using only the first n_trees boosting rounds"""
+    return _classifier_from_booster(model.get_booster()[0:n_trees])
+
+
+def distill(teacher, X, max_depth, n_estimators, learning_rate=0.3, random_state=42):
+    """Train a smaller classifier on the teacher's high-risk probabilities"""
+    soft_labels = teacher.predict_proba(X)[:, 1]
+    booster = xgb.train(
+        {
+            'objective': 'binary:logistic',
+            'max_depth': max_depth,
+            'learning_rate': learning_rate,
+            'tree_method': 'hist',
+            'seed': random_state,
+        },
+        xgb.DMatrix(X, label=soft_labels),
+        num_boost_round=n_estimators,
+    )
+    return _classifier_from_booster(booster)
+
+
+def _percentiles(timings):
+    """p50/p99 of per-call timings, in microseconds"""
+    p50, p99 = np.percentile(np.asarray(timings) * 1e6, [50, 99])
+    return {'p50_us': float(p50), 'p99_us': float(p99)}
+
+
+def serving_model(model):
+    """The model as the API evaluates it: a numpy TreeEnsemble built from the booster's JSON"""
+    return TreeEnsemble.from_json(json.loads(bytes(model.get_booster().save_raw('json'))))
+
+
+def latency_profile(model, X, single_row_calls=SINGLE_ROW_CALLS,
+                    batch_size=BATCH_SIZE, batch_calls=BATCH_CALLS):
+    """p50/p99 latency of predict_proba for one row and for a batch of rows"""
+    single, batch = [], []
+    model.predict_proba(X[:1])  # warm up
+    for i in range(single_row_calls):
+        row = X[i % len(X)][np.newaxis]
+        start = time.perf_counter()
+        model.predict_proba(row)
+        single.append(time.perf_counter() - start)
+
+    rows = X[:batch_size]
+    for _ in range(batch_calls):
+        start = time.perf_counter()
+        model.predict_proba(rows)
+        batch.append(time.perf_counter() - start)
+
+    return {
+        'single_row': _percentiles(single),
+        'batch': {'rows': len(rows), **_percentiles(batch)},
+    }
+
+
+def _tree_sizes(model):
+    """(maximum tree depth, total node count), from the booster's text dump"""
+    lines = [line for dump in model.get_booster().get_dump() for line in dump.splitlines()]
+    return max((len(line) - len(line.lstrip('\t')) for line in lines), default=0), len(lines)
+
+
+def evaluate(name, model, X_holdout, y_holdout, X_serving):
+    """Holdout ROC AUC, size, cost and TreeEnsemble latency (on the dense rows X_serving) of one candidate"""
+    proba = model.predict_proba(X_holdout)[:, 1]
+    n_trees = model.get_booster().num_boosted_rounds()
+    max_depth, n_nodes = _tree_sizes(model)
+    candidate = {
+        'name': name,
+        'n_trees': n_trees,
+        'max_depth': max_depth,
+        'n_nodes': n_nodes,
+        # Nodes a row visits at most: the deterministic per-row cost of evaluating the ensemble
+        'inference_cost': n_trees * max_depth,
+        'roc_auc': float(roc_auc_score(y_holdout, proba)),
+        'latency': latency_profile(serving_model(model), X_serving),
+    }
+    print(f"{name:>22}: {candidate['n_trees']:3d} trees, depth {candidate['max_depth']}, "
+          f"cost {candidate['inference_cost']}, ROC AUC {candidate['roc_auc']:.4f}, "
+          f"single p50/p99 {candidate['latency']['single_row']['p50_us']:.0f}/"
+          f"{candidate['latency']['single_row']['p99_us']:.0f} us, "
+          f"batch p99 {candidate['latency']['batch']['p99_us']:.0f} us")
+    return candidate
+
+
+def select_candidate(candidates, tolerance=AUC_TOLERANCE):
+    """Cheapest candidate (trees x depth, then node count) within tolerance of the full model's ROC AUC"""
+    reference = candidates[0]['roc_auc']
+    eligible = [c for c in candidates if c['roc_auc'] >= reference - tolerance]
+    return min(eligible, key=lambda c: (c['inference_cost'], c['n_nodes'], -c['roc_auc']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--model', default='best_model.joblib')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--tolerance', type=float, default=AUC_TOLERANCE)
+    args = parser.parse_args()
+
+    print("Loading model...")
+    model_artifacts = joblib.load(args.model)
+    model = model_artifacts['model']
+    feature_pipeline = load_feature_pipeline(model_artifacts)
+
+    # Encode with the model's own pipeline so legacy artifacts see their features
+    dataset = load_training_data(args.data, test_size=0.15, random_state=42,
+                                 feature_pipeline=feature_pipeline)
+    X_main, X_holdout = dataset['X_main'], dataset['X_holdout']
+    y_holdout = (dataset['y_holdout'] == 0).astype(int)  # 1 for high-risk (class 0)
+    # Latency is measured on dense rows as the API encodes them (CSR for sparse-trained pipelines)
+    X_serving = feature_pipeline.to_dense(X_holdout[:max(SINGLE_ROW_CALLS, BATCH_SIZE)])
+
+    print("\nEvaluating candidates...")
+    n_trees = model.get_booster().num_boosted_rounds()
+    candidates = [evaluate('full', model, X_holdout, y_holdout, X_serving)]
+    models = {'full': model}
+    for size in TRUNCATION_SIZES:
+        if size < n_trees:
+            name = f'truncated_{size}'
+            models[name] = truncate(model, size)
+            candidates.append(evaluate(name, models[name], X_holdout, y_holdout, X_serving))
+    for max_depth, n_estimators in STUDENT_CONFIGS:
+        name = f'distilled_d{max_depth}_n{n_estimators}'
+        models[name] = distill(model, X_main, max_depth, n_estimators)
+        candidates.append(evaluate(name, models[name], X_holdout, y_holdout, X_serving))
+
+    selected = select_candidate(candidates, args.tolerance)
+    print(f"\nSelected '{selected['name']}' "
+          f"(ROC AUC {selected['roc_auc']:.4f} vs {candidates[0]['roc_auc']:.4f} for the full model)")
+
+    # The source calibration was fitted to the full model's probabilities; refit it for the candidate
+    calibration = model_artifacts.get('calibration')
+    if calibration is not None:
+        calibration = fit_calibration(models[selected['name']].predict_proba(X_holdout)[:, 1], y_holdout).to_dict()
+
+    output_path = os.path.join(os.path.dirname(os.path.abspath(args.model)), COMPACT_MODEL_NAME)
+    joblib.dump({
+        **model_artifacts,
+        'model': models[selected['name']],
+        'calibration': calibration,
+        'latency_profile': {
+            'selected': selected['name'],
+            'tolerance': args.tolerance,
+            'source_model': os.path.basename(args.model),
+            'candidates': candidates,
+        },
+    }, output_path)
+    print(f"Compact model saved as '{output_path}'")
+
+
+if __name__ == '__main__':
+    main()
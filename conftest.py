@@ -0,0 +1,59 @@
+"""
+Shared pytest fixtures
+
+Tests run against copies of the shipped native artifact
+(best_model.meta.json / best_model.xgb.json) and small synthetic datasets
+(synthetic_data.py). The registry's background watcher is disabled so
+tests control when artifacts are reloaded.
+"""
+import json
+import os
+import shutil
+
+os.environ.setdefault('MODEL_REGISTRY_POLL_SECONDS', '0')
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _write_artifact(directory, name, version=1, **meta_changes):
+    """Copy the shipped native artifact into directory as name.meta.json / name.xgb.json"""
+    with open(os.path.join(ROOT, 'best_model.meta.json')) as f:
+        meta = json.load(f)
+    shutil.copy(os.path.join(ROOT, meta['booster']), os.path.join(directory, f'{name}.xgb.json'))
+    meta.update(booster=f'{name}.xgb.json', version=version, **meta_changes)
+    path = os.path.join(directory, f'{name}.meta.json')
+    with open(path, 'w') as f:
+        json.dump(meta, f)
+    return path
+
+
+@pytest.fixture
+def write_artifact():
+    """write_artifact(directory, name, version=1, **meta_changes): path of a copied native artifact"""
+    return _write_artifact
+
+
+@pytest.fixture
+def client():
+    from app import app
+
+    return app.test_client()
+
+
+@pytest.fixture
+def registry(tmp_path, write_artifact, monkeypatch):
+    """A registry over a copy of the shipped model in tmp_path (versions in tmp_path/models), installed as the API's"""
+    from api import routes
+    from api.model_registry import ModelRegistry
+
+    monkeypatch.setattr(routes, 'EXPLAIN_WARMUP', False)
+    monkeypatch.setattr(routes, 'grid_cache_dir', str(tmp_path / 'grid_cache'))
+    (tmp_path / 'models').mkdir()
+    write_artifact(tmp_path, 'best_model')
+    registry = ModelRegistry(root=str(tmp_path), directory=str(tmp_path / 'models'), poll_seconds=0,
+                             prepare=routes.prepare_model, default_threshold=routes.RISK_THRESHOLDS['high'])
+    registry.refresh()
+    monkeypatch.setattr(routes, 'registry', registry)
+    return registry
@@ -0,0 +1,391 @@
+"""
+Chunked, memory-bounded loading of the accident dataset for training
+
+The CSV is read in chunks with compact dtypes (int8/int16 codes and
+categoricals), feature engineering runs per chunk through the shared
+FeaturePipeline, and the encoded rows are streamed into preallocated
+(optionally memory-mapped) float32 matrices. Peak memory is bounded by
+the chunk size plus the output matrices, not by the size of the CSV.
+
+prepare_training_data caches the encoded matrices as .npy files keyed by
+a hash of the source file and the feature spec, so later runs memory-map
+them instead of re-parsing the CSV:
+    python data_loader.py [path/to/data.csv]
+
+prepare_encoded_batch does the same for a batch of new records encoded
+with an already-fitted pipeline (incremental retraining), keyed by the
+file and the pipeline's fitted state.
+
+With sparse=True (or a pipeline marked use_sparse_one_hot) the matrices
+are CSR with float32 values and int32 indices, stored as
+<name>.data/.indices/.indptr.npy, and only the set one-hot slots are kept:
+    python data_loader.py [path/to/data.csv] [--sparse]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import joblib
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import LabelEncoder
+
+from features import FeaturePipeline, CATEGORICAL_COLS, NUMERIC_COLS, FEATURE_SPEC_VERSION, parse_hours
+from fingerprints import file_fingerprint
+
+DATA_PATH = "optimized_accident_data.csv"
+CHUNK_SIZE = 100_000
+CACHE_DIR = os.environ.get("TRAINING_CACHE_DIR", os.path.join(".cache", "training"))
+CACHE_FORMAT_VERSION = 1
+CACHE_ARRAYS = ["X_main", "y_main", "X_holdout", "y_holdout", "hours_main"]
+
+# Compact dtypes; nullable Int types keep missing values without upcasting
+CSV_DTYPES = {
+    "road_type": "Int8",
+    "weather_conditions": "Int8",
+    "light_conditions": "Int8",
+    "road_surface_conditions": "Int8",
+    "junction_detail": "Int8",
+    "speed_limit": "Int16",
+    "number_of_vehicles": "Int16",
+    "number_of_casualties": "Int16",
+    "day_of_week": "category",
+    "time": "category",
+    "risk_level": "category",
+}
+
+# Only the columns the feature pipeline and labels need
+TRAINING_COLS = CATEGORICAL_COLS + [
+    "time",
+    "day_of_week",
+    "speed_limit",
+    "number_of_vehicles",
+    "number_of_casualties",
+    "risk_level",
+]
+
+
+def read_chunks(path=DATA_PATH, chunksize=CHUNK_SIZE, usecols=TRAINING_COLS):
+    """Yield (first row number, chunk) pairs from the CSV with compact dtypes"""
+    dtypes = {col: dtype for col, dtype in CSV_DTYPES.items() if col in usecols}
+    start = 0
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=dtypes, chunksize=chunksize):
+        yield start, chunk
+        start += len(chunk)
+
+
+def read_labels(path=DATA_PATH, chunksize=CHUNK_SIZE):
+    """
+    Read only the risk_level column
+    Returns (fitted LabelEncoder, encoded labels as a small int array)
+    """
+    names = {}
+    codes = []
+    for _, chunk in read_chunks(path, chunksize, usecols=["risk_level"]):
+        labels = chunk["risk_level"]
+        # Map this chunk's categories onto codes shared by all chunks (-1 stays missing)
+        lookup = np.array([names.setdefault(name, len(names)) for name in labels.cat.categories] + [-1])
+        codes.append(lookup[labels.cat.codes.to_numpy()])
+    codes = np.concatenate(codes) if codes else np.empty(0, dtype=np.int64)
+    if (codes < 0).any():
+        raise ValueError("risk_level has missing values")
+
+    label_encoder = LabelEncoder().fit(list(names))
+    remap = label_encoder.transform(list(names)).astype(np.int8)
+    return label_encoder, remap[codes]
+
+
+def _allocate(shape, mmap_dir, name, dtype=np.float32):
+    """Preallocate an array, memory-mapped to an .npy file when mmap_dir is given"""
+    if mmap_dir is None:
+        return np.empty(shape, dtype=dtype)
+    os.makedirs(mmap_dir, exist_ok=True)
+    return np.lib.format.open_memmap(os.path.join(mmap_dir, f"{name}.npy"), mode="w+",
+                                     dtype=dtype, shape=shape)
+
+
+def _assemble_csr(parts, n_rows, n_features, mmap_dir, name):
+    """
+    One CSR matrix from (positions, CSR rows) parts, each row placed at its position
+    The values and indices are written straight into their final (optionally
+    memory-mapped) arrays instead of stacking and reordering copies
+    """
+    lengths = np.zeros(n_rows, dtype=np.int64)
+    for positions, X in parts:
+        lengths[positions] = np.diff(X.indptr)
+    nnz = int(lengths.sum())
+    index_dtype = np.int32 if nnz < np.iinfo(np.int32).max else np.int64
+    indptr = _allocate((n_rows + 1,), mmap_dir, f"{name}.indptr", index_dtype)
+    indptr[0] = 0
+    np.cumsum(lengths, out=indptr[1:])
+    data = _allocate((nnz,), mmap_dir, f"{name}.data")
+    indices = _allocate((nnz,), mmap_dir, f"{name}.indices", np.int32)
+    for positions, X in parts:
+        row_starts = X.indptr[:-1].astype(np.int64)
+        targets = np.repeat(indptr[positions] - row_starts, np.diff(X.indptr)) + np.arange(X.nnz)
+        data[targets] = X.data
+        indices[targets] = X.indices
+    if mmap_dir is not None:
+        for array in (indptr, data, indices):
+            array.flush()
+    return sp.csr_matrix((data, indices, indptr), shape=(n_rows, n_features), copy=False)
+
+
+def save_matrix(directory, name, X):
+    """Save a dense matrix as <name>.npy or a CSR matrix as <name>.data/.indices/.indptr.npy"""
+    if sp.issparse(X):
+        for part in ("data", "indices", "indptr"):
+            np.save(os.path.join(directory, f"{name}.{part}.npy"), getattr(X, part))
+    else:
+        np.save(os.path.join(directory, f"{name}.npy"), X)
+
+
+def load_matrix(directory, name, n_features):
+    """Memory-map a matrix written by save_matrix or load_training_data (read-only)"""
+    path = os.path.join(directory, f"{name}.npy")
+    if os.path.exists(path):
+        return np.load(path, mmap_mode="r")
+    data, indices, indptr = (np.load(os.path.join(directory, f"{name}.{part}.npy"), mmap_mode="r")
+                             for part in ("data", "indices", "indptr"))
+    return sp.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, n_features), copy=False)
+
+
+def stack_rows(matrices):
+    """Concatenate dense or CSR matrices row-wise"""
+    if sp.issparse(matrices[0]):
+        return sp.vstack(matrices, format="csr")
+    return np.concatenate(matrices)
+
+
+def matrix_nbytes(X):
+    """Bytes held by a dense or CSR matrix"""
+    if sp.issparse(X):
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    return X.nbytes
+
+
+def encode(feature_pipeline, chunk, out=None):
+    """Encode a frame as CSR for pipelines marked sparse, otherwise dense"""
+    if feature_pipeline.sparse_one_hot:
+        return feature_pipeline.transform_sparse(chunk)
+    return feature_pipeline.transform(chunk, out=out)
+
+
+def _rows(chunks, positions):
+    """Restrict each chunk to the rows that have a position in the output"""
+    for start, chunk in chunks:
+        selected = positions[start:start + len(chunk)] >= 0
+        yield chunk[selected]
+
+
+def load_training_data(path=DATA_PATH, test_size=0.15, random_state=42,
+                       chunksize=CHUNK_SIZE, mmap_dir=None, feature_pipeline=None, sparse=False):
+    """
+    Stream the CSV into encoded main/holdout matrices
+
+    The stratified split is identical to train_test_split on the full
+    DataFrame, and rows land in the same order, so results match loading
+    everything with pd.read_csv. Three passes are made over the file:
+    labels only, fitting the pipeline on the main split, and encoding.
+    The matrices are CSR when sparse is set or the given feature_pipeline
+    is marked sparse; a newly fitted pipeline is then marked sparse.
+
+    Returns a dict with feature_pipeline, label_encoder, X_main, y_main,
+    X_holdout, y_holdout and hours_main (hour of day per main row).
+    """
+    print("Reading labels...")
+    label_encoder, y = read_labels(path, chunksize)
+    n_rows = len(y)
+
+    # Same split as train_test_split(df, stratify=df["risk_level"])
+    main_idx, holdout_idx = train_test_split(
+        np.arange(n_rows), test_size=test_size, stratify=y, random_state=random_state
+    )
+    main_pos = np.full(n_rows, -1, dtype=np.int64)
+    main_pos[main_idx] = np.arange(len(main_idx))
+    holdout_pos = np.full(n_rows, -1, dtype=np.int64)
+    holdout_pos[holdout_idx] = np.arange(len(holdout_idx))
+
+    if feature_pipeline is None:
+        print("Fitting feature pipeline on the main split...")
+        feature_pipeline = FeaturePipeline().fit_chunks(
+            _rows(read_chunks(path, chunksize), main_pos)
+        )
+        if sparse:
+            feature_pipeline.use_sparse_one_hot()
+    sparse = feature_pipeline.sparse_one_hot
+
+    print("Encoding features...")
+    n_features = len(feature_pipeline.feature_names)
+    hours_main = np.empty(len(main_idx), dtype=np.float32)
+    if sparse:
+        main_parts, holdout_parts = [], []
+        outputs = ((main_pos, main_parts), (holdout_pos, holdout_parts))
+    else:
+        X_main = _allocate((len(main_idx), n_features), mmap_dir, "X_main")
+        X_holdout = _allocate((len(holdout_idx), n_features), mmap_dir, "X_holdout")
+        outputs = ((main_pos, X_main), (holdout_pos, X_holdout))
+    buffer = None if sparse else np.empty((chunksize, n_features), dtype=np.float32)
+
+    for start, chunk in read_chunks(path, chunksize):
+        encoded = encode(feature_pipeline, chunk, out=buffer)
+        rows = slice(start, start + len(chunk))
+        for split_pos, X in outputs:
+            positions = split_pos[rows]
+            selected = positions >= 0
+            if sparse:
+                X.append((positions[selected], encoded[selected]))
+            else:
+                X[positions[selected]] = encoded[selected]
+        selected = main_pos[rows] >= 0
+        hours_main[main_pos[rows][selected]] = parse_hours(chunk["time"])[selected]
+
+    if sparse:
+        X_main = _assemble_csr(main_parts, len(main_idx), n_features, mmap_dir, "X_main")
+        X_holdout = _assemble_csr(holdout_parts, len(holdout_idx), n_features, mmap_dir, "X_holdout")
+    elif mmap_dir is not None:
+        X_main.flush()
+        X_holdout.flush()
+
+    return {
+        "feature_pipeline": feature_pipeline,
+        "label_encoder": label_encoder,
+        "X_main": X_main,
+        "y_main": y[main_idx],
+        "X_holdout": X_holdout,
+        "y_holdout": y[holdout_idx],
+        "hours_main": hours_main,
+    }
+
+
+def dataset_cache_key(path, test_size=0.15, random_state=42, sparse=False):
+    """Hash of the source file contents, feature spec, split settings and matrix layout"""
+    spec = {
+        "format": CACHE_FORMAT_VERSION,
+        "source": file_fingerprint(path),
+        "feature_spec": FEATURE_SPEC_VERSION,
+        "categorical_cols": CATEGORICAL_COLS,
+        "numeric_cols": NUMERIC_COLS,
+        "test_size": test_size,
+        "random_state": random_state,
+    }
+    if sparse:
+        spec["layout"] = "csr"
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def load_cached_training_data(cache_path):
+    """Memory-map a prepared dataset (read-only, zero-copy), or return None if incomplete"""
+    if not os.path.exists(os.path.join(cache_path, "meta.json")):
+        return None
+    dataset = joblib.load(os.path.join(cache_path, "pipeline.joblib"))
+    n_features = len(dataset["feature_pipeline"].feature_names)
+    for name in CACHE_ARRAYS:
+        dataset[name] = load_matrix(cache_path, name, n_features)
+    return dataset
+
+
+def prepare_training_data(path=DATA_PATH, test_size=0.15, random_state=42,
+                          chunksize=CHUNK_SIZE, cache_dir=CACHE_DIR, sparse=False):
+    """
+    Return the encoded training data from the on-disk cache, building it first if needed
+    Same dict as load_training_data, with the arrays memory-mapped from .npy files
+    """
+    key = dataset_cache_key(path, test_size, random_state, sparse)
+    cache_path = os.path.join(cache_dir, key)
+    dataset = load_cached_training_data(cache_path)
+    if dataset is not None:
+        print(f"Using cached training data from {cache_path}")
+        return dataset
+
+    print(f"Preparing training data cache in {cache_path}...")
+    tmp_path = f"{cache_path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    dataset = load_training_data(path, test_size, random_state, chunksize, mmap_dir=tmp_path, sparse=sparse)
+    for name in ["y_main", "y_holdout", "hours_main"]:
+        np.save(os.path.join(tmp_path, f"{name}.npy"), dataset[name])
+    joblib.dump(
+        {"feature_pipeline": dataset["feature_pipeline"], "label_encoder": dataset["label_encoder"]},
+        os.path.join(tmp_path, "pipeline.joblib")
+    )
+    # meta.json is written last: a cache directory without it is incomplete
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({
+            "source": os.path.abspath(path),
+            "rows": {name: len(dataset[name]) for name in ["y_main", "y_holdout"]},
+            "layout": "csr" if sparse else "dense",
+            "feature_names": dataset["feature_pipeline"].feature_names,
+        }, f, indent=2)
+
+    del dataset
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(tmp_path, cache_path)
+    return load_cached_training_data(cache_path)
+
+
+def encode_labeled_batch(path, feature_pipeline, label_encoder, chunksize=CHUNK_SIZE):
+    """
+    Encode a CSV with an already-fitted pipeline and label encoder
+    Returns (X float32 matrix, CSR for sparse pipelines, y label codes); rows keep the file order
+    """
+    X_parts, y_parts = [], []
+    for _, chunk in read_chunks(path, chunksize):
+        labels = chunk["risk_level"]
+        if labels.isna().any():
+            raise ValueError(f"risk_level has missing values in {path}")
+        X_parts.append(encode(feature_pipeline, chunk))
+        y_parts.append(label_encoder.transform(labels.astype(str)).astype(np.int8))
+    if not X_parts:
+        return np.empty((0, len(feature_pipeline.feature_names)), dtype=np.float32), np.empty(0, dtype=np.int8)
+    return stack_rows(X_parts), np.concatenate(y_parts)
+
+
+def encoded_batch_key(path, feature_pipeline, label_encoder):
+    """Hash of the file contents, the pipeline's fitted state and the label classes"""
+    spec = {
+        "format": CACHE_FORMAT_VERSION,
+        "source": file_fingerprint(path),
+        "feature_spec": FEATURE_SPEC_VERSION,
+        "pipeline": feature_pipeline.to_dict(),
+        "classes": [str(c) for c in label_encoder.classes_],
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def prepare_encoded_batch(path, feature_pipeline, label_encoder, cache_dir=CACHE_DIR, chunksize=CHUNK_SIZE):
+    """
+    Return (X, y) for a batch CSV from the on-disk cache, encoding it first if needed
+    The arrays are memory-mapped read-only from .npy files
+    """
+    cache_path = os.path.join(cache_dir, "batches", encoded_batch_key(path, feature_pipeline, label_encoder))
+    if not os.path.exists(os.path.join(cache_path, "meta.json")):
+        print(f"Encoding {path} into {cache_path}...")
+        X, y = encode_labeled_batch(path, feature_pipeline, label_encoder, chunksize)
+        tmp_path = f"{cache_path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        save_matrix(tmp_path, "X", X)
+        np.save(os.path.join(tmp_path, "y.npy"), y)
+        # meta.json is written last: a cache directory without it is incomplete
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"source": os.path.abspath(path), "rows": len(y)}, f, indent=2)
+        shutil.rmtree(cache_path, ignore_errors=True)
+        os.replace(tmp_path, cache_path)
+    else:
+        print(f"Using cached encoding of {path} from {cache_path}")
+    return (load_matrix(cache_path, "X", len(feature_pipeline.feature_names)),
+            np.load(os.path.join(cache_path, "y.npy"), mmap_mode="r"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prepare the encoded training data cache")
+    parser.add_argument("data", nargs="?", default=DATA_PATH)
+    parser.add_argument("--sparse", action="store_true", help="encode into CSR matrices")
+    args = parser.parse_args()
+    prepared = prepare_training_data(args.data, sparse=args.sparse)
+    for name in ["X_main", "X_holdout"]:
+        print(f"{name}: {prepared[name].shape}, {matrix_nbytes(prepared[name]) / (1 << 20):.1f} MB")
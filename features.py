@@ -0,0 +1,643 @@
+"""
+Feature engineering, encoding and scaling shared by training and serving
+
+Classification.py, road_safety_analysis.py, predict_risk.py,
+test_model_cases.py and the API all go through FeaturePipeline, so the
+derived features, column layout and dtypes are identical whether rows
+come from the accident CSV or from an /api/predict scenario. The fitted
+pipeline, including the training-set fill values and scaling statistics,
+is saved inside best_model.joblib.
+
+FeatureEncoder writes rows straight into a float32 matrix using
+precomputed column indices, instead of building a DataFrame per row.
+
+Training can also encode into CSR matrices (transform_sparse) that store
+only the set one-hot slots. XGBoost treats entries absent from a sparse
+matrix as missing rather than zero, so a pipeline used for sparse training
+is marked with use_sparse_one_hot(): its dense encodings then fill the
+unset one-hot slots with NaN and every path sees the same model inputs.
+"""
+import logging
+import threading
+
+import numpy as np
+import scipy.sparse as sp
+
+# Bump when derived features or scenario mappings change, so anything
+# cached from encoded features (e.g. the API prediction table) is rebuilt
+FEATURE_SPEC_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+# Categorical columns one-hot encoded by the training script
+CATEGORICAL_COLS = [
+    "road_type",
+    "weather_conditions",
+    "light_conditions",
+    "road_surface_conditions",
+    "junction_detail"
+]
+
+# Numeric columns, in model feature order after the one-hot columns
+NUMERIC_COLS = [
+    "speed_limit",
+    "number_of_vehicles",
+    "number_of_casualties",
+    "casualty_rate",
+    "weather_risk",
+    "surface_risk",
+    "combined_risk",
+    "night_speed_risk",
+    "weather_speed_risk",
+    "is_night",
+    "is_rush_hour",
+    "is_weekend",
+    "high_speed"
+]
+
+# Weather and road surface risk scores by dataset code
+WEATHER_RISK = {1: 0, 2: 2, 3: 4, 4: 2, 5: 4, 6: 6, 7: 5, 8: 1, 9: 3}
+SURFACE_RISK = {1: 0, 2: 2, 3: 4, 4: 5, 5: 5}
+DEFAULT_WEATHER_RISK = 3
+DEFAULT_SURFACE_RISK = 2
+
+RUSH_HOURS = [7, 8, 9, 16, 17, 18]
+HIGH_SPEED_LIMIT = 60
+
+# Encodings from API input values to the dataset codes used by the model
+WEATHER_CODES = {'Fine': 1, 'Rain': 2, 'Snow': 3, 'Fog': 7}  # 7: Fog or mist
+SURFACE_CODES = {'Fine': 1, 'Rain': 2, 'Snow': 3, 'Fog': 1}  # 1: Dry, 2: Wet, 3: Snow
+LIGHT_CODES = {
+    'Morning': 1,  # Daylight
+    'Afternoon': 1,  # Daylight
+    'Evening': 4,  # Darkness - lights lit
+    'Night': 4,    # Darkness - lights lit
+}
+JUNCTION_CODES = {
+    'Not at junction': 0,
+    'T Junction': 1,
+    'Crossroads': 2,
+    'Roundabout': 3
+}
+# Representative hour for each API time of day
+SCENARIO_HOURS = {'Morning': 8, 'Afternoon': 13, 'Evening': 18, 'Night': 23}
+
+
+def _parse_code(text):
+    """Turn the code part of a one-hot column name back into the dataset value"""
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+def _format_code(value):
+    """Dataset value as it appears in a one-hot column name (2.0 -> 2)"""
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return int(value)
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _map_codes(codes, mapping, default):
+    """Map dataset codes to scores, using default for unknown or missing codes"""
+    codes = np.asarray(codes, dtype=np.float64)
+    scores = np.full(codes.shape, default, dtype=np.float32)
+    for code, score in mapping.items():
+        scores[codes == code] = score
+    return scores
+
+
+def derive_features(columns):
+    """
+    Engineered risk features from base columns (hour, is_weekend, speed_limit,
+    vehicle/casualty counts, weather and surface codes)
+    Works on arrays for batches and on scalars for single rows
+    """
+    hour = np.asarray(columns['hour'], dtype=np.float32)
+    speed_limit = np.asarray(columns['speed_limit'], dtype=np.float32)
+    vehicles = np.asarray(columns['number_of_vehicles'], dtype=np.float32)
+    casualties = np.asarray(columns['number_of_casualties'], dtype=np.float32)
+
+    # Risk-focused features
+    is_night = ((hour >= 22) | (hour <= 5)).astype(np.float32)
+    is_rush_hour = np.isin(hour, RUSH_HOURS).astype(np.float32)
+    high_speed = (speed_limit >= HIGH_SPEED_LIMIT).astype(np.float32)
+
+    # Weather and road risk scoring
+    weather_risk = _map_codes(columns['weather_conditions'], WEATHER_RISK, DEFAULT_WEATHER_RISK)
+    surface_risk = _map_codes(columns['road_surface_conditions'], SURFACE_RISK, DEFAULT_SURFACE_RISK)
+
+    return {
+        'speed_limit': speed_limit,
+        'number_of_vehicles': vehicles,
+        'number_of_casualties': casualties,
+        'casualty_rate': casualties / np.maximum(vehicles, 1),
+        'weather_risk': weather_risk,
+        'surface_risk': surface_risk,
+        'combined_risk': weather_risk + surface_risk + is_night * 2 + high_speed * 2,
+        'night_speed_risk': is_night * high_speed,
+        'weather_speed_risk': weather_risk * high_speed,
+        'is_night': is_night,
+        'is_rush_hour': is_rush_hour,
+        'is_weekend': np.asarray(columns['is_weekend'], dtype=np.float32),
+        'high_speed': high_speed,
+    }
+
+
+def parse_hours(time):
+    """Hour of day from an 'HH:MM' Series; categorical Series parse each distinct time once"""
+    import pandas as pd
+
+    if isinstance(time.dtype, pd.CategoricalDtype):
+        hours = pd.to_datetime(time.cat.categories, format='%H:%M').hour.to_numpy(dtype=np.float32)
+        codes = time.cat.codes.to_numpy()
+        return np.where(codes >= 0, hours[codes], np.nan).astype(np.float32)
+    return pd.to_datetime(time, format='%H:%M').dt.hour.to_numpy(dtype=np.float32)
+
+
+def _code_values(series):
+    """Categorical codes as a NumPy array; nullable integer columns become float with NaN"""
+    import pandas as pd
+
+    if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(dtype=np.float32, na_value=np.nan)
+    return series.to_numpy()
+
+
+def frame_columns(df, categorical_cols=CATEGORICAL_COLS):
+    """Base columns for derive_features from a raw accident dataset frame"""
+    columns = {col: _code_values(df[col]) for col in categorical_cols}
+    columns['hour'] = parse_hours(df['time'])
+    columns['is_weekend'] = df['day_of_week'].isin(['Saturday', 'Sunday']).to_numpy(dtype=np.float32)
+    for col in ['speed_limit', 'number_of_vehicles', 'number_of_casualties']:
+        columns[col] = df[col].to_numpy(dtype=np.float32, na_value=np.nan)
+    return columns
+
+
+def scenario_features(data):
+    """Base columns for derive_features from a validated API scenario"""
+    weather = data['weather_conditions']
+    time_of_day = data['time_of_day']
+    return {
+        'road_type': data['road_type'],
+        'weather_conditions': WEATHER_CODES[weather],
+        'light_conditions': LIGHT_CODES[time_of_day],
+        'road_surface_conditions': SURFACE_CODES[weather],
+        'junction_detail': JUNCTION_CODES[data['junction_detail']],
+        'hour': SCENARIO_HOURS[time_of_day],
+        'is_weekend': 0,
+        'speed_limit': data['speed_limit'],
+        'number_of_vehicles': 1,
+        'number_of_casualties': 0,
+    }
+
+
+def scenario_columns(records):
+    """Vectorized scenario_features for a list of validated API scenarios"""
+    weathers = [record['weather_conditions'] for record in records]
+    times = [record['time_of_day'] for record in records]
+    n_rows = len(records)
+    return {
+        'road_type': np.array([record['road_type'] for record in records]),
+        'weather_conditions': np.array([WEATHER_CODES[w] for w in weathers]),
+        'light_conditions': np.array([LIGHT_CODES[t] for t in times]),
+        'road_surface_conditions': np.array([SURFACE_CODES[w] for w in weathers]),
+        'junction_detail': np.array([JUNCTION_CODES[record['junction_detail']] for record in records]),
+        'hour': np.array([SCENARIO_HOURS[t] for t in times], dtype=np.float32),
+        'is_weekend': np.zeros(n_rows, dtype=np.float32),
+        'speed_limit': np.array([record['speed_limit'] for record in records], dtype=np.float32),
+        'number_of_vehicles': np.ones(n_rows, dtype=np.float32),
+        'number_of_casualties': np.zeros(n_rows, dtype=np.float32),
+    }
+
+
+def _mode(values):
+    """Most frequent non-missing value (smallest on ties, like pandas mode()[0])"""
+    present = values[~_isnull(values)]
+    if len(present) == 0:
+        return None
+    uniques, counts = np.unique(present, return_counts=True)
+    return uniques[np.argmax(counts)]
+
+
+def _add_counts(counts, values):
+    """Accumulate value counts of an array into a {value: count} dict"""
+    if len(values) == 0:
+        return
+    uniques, freq = np.unique(values, return_counts=True)
+    for value, n in zip(uniques.tolist(), freq.tolist()):
+        counts[value] = counts.get(value, 0) + n
+
+
+def _sorted_counts(counts):
+    """Split a {value: count} dict into sorted value and count arrays"""
+    values = sorted(counts)
+    return np.array(values), np.array([counts[value] for value in values], dtype=np.int64)
+
+
+def _median_from_counts(values, freq):
+    """Median of the values a count histogram describes (0.0 when empty)"""
+    total = int(freq.sum())
+    if total == 0:
+        return 0.0
+    cumulative = np.cumsum(freq)
+    lower = values[np.searchsorted(cumulative, (total - 1) // 2, side='right')]
+    upper = values[np.searchsorted(cumulative, total // 2, side='right')]
+    return float((float(lower) + float(upper)) / 2)
+
+
+def _isnull(values):
+    if values.dtype.kind == 'f':
+        return np.isnan(values)
+    if values.dtype.kind == 'O':
+        return np.array([v is None or v != v for v in values], dtype=bool)
+    return np.zeros(values.shape, dtype=bool)
+
+
+class FeatureEncoder:
+    """
+    Encodes rows into the model's feature layout with precomputed column indices
+    One-hot columns are named '<categorical column>_<code>'; every other
+    feature name is copied as a numeric value
+    """
+
+    # Value of the one-hot slots that are not set; NaN for sparse-trained models
+    one_hot_fill = 0.0
+
+    def __init__(self, feature_names, categorical_cols=None):
+        self.feature_names = [str(name) for name in feature_names]
+        self.n_features = len(self.feature_names)
+        categorical_cols = list(categorical_cols or CATEGORICAL_COLS)
+
+        # {categorical column: {code: column index}}
+        self.one_hot = {col: {} for col in categorical_cols}
+        # {numeric feature name: column index}
+        self.numeric = {}
+        for i, name in enumerate(self.feature_names):
+            prefix = next((col for col in categorical_cols if name.startswith(col + '_')), None)
+            if prefix is None:
+                self.numeric[name] = i
+            else:
+                self.one_hot[prefix][_parse_code(name[len(prefix) + 1:])] = i
+
+        self.numeric_names = list(self.numeric)
+        self.numeric_indices = np.array(list(self.numeric.values()), dtype=np.intp)
+        self._set_one_hot_indices()
+        self._local = threading.local()
+
+    def _set_one_hot_indices(self):
+        self.one_hot_indices = np.array(
+            sorted(i for slots in self.one_hot.values() for i in slots.values()), dtype=np.intp
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'one_hot_indices' not in state:
+            self._set_one_hot_indices()
+        self._local = threading.local()
+
+    def _row_buffer(self):
+        """Preallocated single-row matrix, one per thread"""
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.zeros((1, self.n_features), dtype=np.float32)
+        return row
+
+    def _n_rows(self, columns):
+        for name in list(self.one_hot) + self.numeric_names:
+            if name in columns and np.ndim(columns[name]) > 0:
+                return len(columns[name])
+        return 0
+
+    def transform(self, columns, out=None):
+        """
+        Encode a batch of rows given as {column: values} (a dict or DataFrame)
+        Scalars are broadcast to every row; columns the encoder does not know are ignored
+        """
+        n_rows = self._n_rows(columns)
+        if out is None:
+            X = np.zeros((n_rows, self.n_features), dtype=np.float32)
+        else:
+            X = out[:n_rows]
+            X.fill(0)
+        if self.one_hot_fill != 0:
+            X[:, self.one_hot_indices] = self.one_hot_fill
+
+        for col, slots in self.one_hot.items():
+            if col not in columns:
+                continue
+            codes = np.asarray(columns[col])
+            uniques, inverse = np.unique(codes, return_inverse=True)
+            targets = np.array([slots.get(code, -1) for code in uniques.tolist()], dtype=np.intp)[inverse]
+            rows = np.nonzero(targets >= 0)[0]
+            X[rows, targets[rows]] = 1
+
+        for name, i in self.numeric.items():
+            if name in columns:
+                X[:, i] = columns[name]
+
+        return X
+
+    def transform_sparse(self, columns):
+        """
+        Encode a batch of rows into a CSR matrix with float32 values and int32 indices
+        Only the set one-hot slots are stored; numeric values are stored even when zero
+        """
+        n_rows = self._n_rows(columns)
+        slots, values = [], []
+        for col, col_slots in self.one_hot.items():
+            if col not in columns:
+                continue
+            uniques, inverse = np.unique(np.asarray(columns[col]), return_inverse=True)
+            slots.append(np.array([col_slots.get(code, -1) for code in uniques.tolist()], dtype=np.int32)[inverse])
+            values.append(np.ones(n_rows, dtype=np.float32))
+        for name, i in self.numeric.items():
+            if name in columns:
+                slots.append(np.full(n_rows, i, dtype=np.int32))
+                values.append(np.broadcast_to(np.asarray(columns[name], dtype=np.float32), (n_rows,)))
+
+        # One-hot blocks precede the numeric columns, so each row's indices come out sorted
+        slots = np.column_stack(slots) if slots else np.empty((n_rows, 0), dtype=np.int32)
+        stored = slots >= 0
+        indptr = np.zeros(n_rows + 1, dtype=np.int32)
+        np.cumsum(stored.sum(axis=1), out=indptr[1:])
+        values = np.column_stack(values)[stored] if len(values) else np.empty(0, dtype=np.float32)
+        return sp.csr_matrix((values, slots[stored], indptr), shape=(n_rows, self.n_features))
+
+    def transform_one(self, record):
+        """
+        Encode a single row given as {column: value}
+        Returns a preallocated (1, n_features) buffer that is reused by the next
+        call on the same thread, so use it before encoding another row
+        """
+        row = self._row_buffer()
+        row.fill(0)
+        if self.one_hot_fill != 0:
+            row[0, self.one_hot_indices] = self.one_hot_fill
+        for col, slots in self.one_hot.items():
+            i = slots.get(record.get(col))
+            if i is not None:
+                row[0, i] = 1
+        for name, i in self.numeric.items():
+            if name in record:
+                row[0, i] = record[name]
+        return row
+
+
+class FeaturePipeline:
+    """
+    Fitted feature engineering, imputation, one-hot encoding and scaling,
+    shared by training and serving
+    fit() learns the categories, fill values and numeric scaling statistics
+    from the training data; transform() encodes dataset frames and
+    transform_scenario(s) encodes API scenarios, both into the same scaled
+    float32 column layout
+    """
+
+    def __init__(self, categorical_cols=None, numeric_cols=None):
+        self.categorical_cols = list(categorical_cols or CATEGORICAL_COLS)
+        self.numeric_cols = list(numeric_cols or NUMERIC_COLS)
+        self.categories = None
+        self.feature_names = None
+        self.encoder = None
+        # Training-set modes (categorical) and medians (numeric)
+        self.fill_values = None
+        # StandardScaler statistics for the numeric columns
+        self.numeric_mean = None
+        self.numeric_std = None
+        # Per-feature affine transform (x * feature_scale + feature_offset), identity for one-hots
+        self.feature_scale = None
+        self.feature_offset = None
+        # Trained on CSR matrices: unset one-hot slots are missing, not zero
+        self.sparse_one_hot = False
+
+    def __setstate__(self, state):
+        # Pipelines pickled before scaling was stored have no statistics
+        self.__init__(state.get('categorical_cols'), state.get('numeric_cols'))
+        self.__dict__.update(state)
+
+    def _build(self, categories):
+        self.categories = {col: list(categories[col]) for col in self.categorical_cols}
+        self.feature_names = [
+            f'{col}_{code}' for col in self.categorical_cols for code in self.categories[col]
+        ] + self.numeric_cols
+        self.encoder = FeatureEncoder(self.feature_names, self.categorical_cols)
+        if self.sparse_one_hot:
+            self.encoder.one_hot_fill = np.nan
+        return self
+
+    def use_sparse_one_hot(self):
+        """Mark the pipeline for sparse training: dense encodings fill unset one-hot slots with NaN"""
+        self.sparse_one_hot = True
+        self.encoder.one_hot_fill = np.nan
+        return self
+
+    def _set_scaling(self, mean, std):
+        """Precompute the affine transform that standardizes the numeric columns"""
+        self.numeric_mean = np.asarray(mean, dtype=np.float64)
+        self.numeric_std = np.asarray(std, dtype=np.float64)
+        scale = 1.0 / np.where(self.numeric_std > 0, self.numeric_std, 1.0)
+        self.feature_scale = np.ones(len(self.feature_names), dtype=np.float32)
+        self.feature_offset = np.zeros(len(self.feature_names), dtype=np.float32)
+        self.feature_scale[self.numeric_indices] = scale
+        self.feature_offset[self.numeric_indices] = -self.numeric_mean * scale
+        return self
+
+    def fit(self, df):
+        """Learn categories, fill values and scaling statistics from a training frame"""
+        return self.fit_chunks([df])
+
+    def fit_chunks(self, chunks):
+        """
+        Fit from an iterable of training frames (e.g. CSV chunks)
+        Only per-value counts are kept between chunks, so memory does not grow
+        with the number of rows; the derived features are all discrete
+        """
+        counts = {col: {} for col in self.categorical_cols + self.numeric_cols}
+        n_missing = dict.fromkeys(self.numeric_cols, 0)
+        for df in chunks:
+            columns = frame_columns(df, self.categorical_cols)
+            columns.update(derive_features(columns))
+            for col, col_counts in counts.items():
+                values = columns[col]
+                missing = _isnull(values)
+                if col in n_missing:
+                    n_missing[col] += int(missing.sum())
+                _add_counts(col_counts, values[~missing])
+
+        categories = {}
+        self.fill_values = {}
+        for col in self.categorical_cols:
+            values, freq = _sorted_counts(counts[col])
+            categories[col] = sorted({_format_code(value) for value in values})
+            # Most frequent code, smallest on ties (like pandas mode()[0])
+            self.fill_values[col] = values[np.argmax(freq)] if len(values) else None
+        self._build(categories)
+
+        # Medians, then mean/std over the imputed numeric columns
+        mean = np.zeros(len(self.numeric_cols))
+        std = np.zeros(len(self.numeric_cols))
+        for i, col in enumerate(self.numeric_cols):
+            values, freq = _sorted_counts(counts[col])
+            median = _median_from_counts(values, freq)
+            self.fill_values[col] = median
+            values = np.append(values, median).astype(np.float64)
+            freq = np.append(freq, n_missing[col]).astype(np.float64)
+            total = freq.sum()
+            if total:
+                mean[i] = (values * freq).sum() / total
+                std[i] = np.sqrt((((values - mean[i]) ** 2) * freq).sum() / total)
+        return self._set_scaling(mean, std)
+
+    @classmethod
+    def from_feature_names(cls, feature_names, categorical_cols=None, numeric_cols=None):
+        """
+        Rebuild a pipeline from an artifact saved before pipelines were stored with the model
+        Such artifacts carry no fill values or scaling statistics
+        """
+        pipeline = cls(categorical_cols, numeric_cols)
+        encoder = FeatureEncoder(feature_names, pipeline.categorical_cols)
+        pipeline._build({col: list(encoder.one_hot[col]) for col in pipeline.categorical_cols})
+        if pipeline.feature_names != encoder.feature_names:
+            raise ValueError("Feature names do not match the pipeline column layout")
+        return pipeline
+
+    def to_dict(self):
+        """JSON-serializable fitted state, stored in the native model metadata file"""
+        return {
+            'categorical_cols': self.categorical_cols,
+            'numeric_cols': self.numeric_cols,
+            'categories': self.categories,
+            'fill_values': {
+                col: value.item() if isinstance(value, np.generic) else value
+                for col, value in self.fill_values.items()
+            } if self.fill_values else None,
+            'numeric_mean': self.numeric_mean.tolist() if self.is_scaled else None,
+            'numeric_std': self.numeric_std.tolist() if self.is_scaled else None,
+            'sparse_one_hot': self.sparse_one_hot,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """Rebuild a fitted pipeline from to_dict() output"""
+        pipeline = cls(state['categorical_cols'], state['numeric_cols'])._build(state['categories'])
+        pipeline.fill_values = state.get('fill_values')
+        if state.get('numeric_mean') is not None:
+            pipeline._set_scaling(state['numeric_mean'], state['numeric_std'])
+        if state.get('sparse_one_hot'):
+            pipeline.use_sparse_one_hot()
+        return pipeline
+
+    @property
+    def numeric_indices(self):
+        return self.encoder.numeric_indices
+
+    @property
+    def is_scaled(self):
+        return self.feature_scale is not None
+
+    def _fill_missing(self, columns):
+        """
+        Fill missing categorical codes with the mode and numeric values with the median
+        Uses the training-set values when fitted, otherwise the batch's own
+        """
+        for col in self.categorical_cols:
+            values = columns[col]
+            missing = _isnull(values)
+            if missing.any():
+                values = values.copy()
+                values[missing] = self.fill_values[col] if self.fill_values else _mode(values)
+                columns[col] = values
+        for col in self.numeric_cols:
+            values = columns[col]
+            missing = np.isnan(values)
+            if not missing.any():
+                continue
+            if self.fill_values:
+                columns[col] = np.where(missing, self.fill_values[col], values).astype(np.float32)
+            elif not missing.all():
+                columns[col] = np.where(missing, np.nanmedian(values), values).astype(np.float32)
+
+    def _scale(self, X):
+        """Apply the precomputed affine scaling in place"""
+        if self.feature_scale is not None:
+            X *= self.feature_scale
+            X += self.feature_offset
+        return X
+
+    def _scale_sparse(self, X):
+        """Apply the affine scaling to the stored values of a CSR matrix in place"""
+        if self.feature_scale is not None:
+            X.data *= self.feature_scale[X.indices]
+            X.data += self.feature_offset[X.indices]
+        return X
+
+    def _frame_columns(self, df):
+        columns = frame_columns(df, self.categorical_cols)
+        columns.update(derive_features(columns))
+        self._fill_missing(columns)
+        return columns
+
+    def transform(self, df, out=None):
+        """Encode a raw accident dataset frame into the model feature matrix"""
+        return self._scale(self.encoder.transform(self._frame_columns(df), out=out))
+
+    def transform_sparse(self, df):
+        """Encode a raw accident dataset frame into a CSR feature matrix"""
+        return self._scale_sparse(self.encoder.transform_sparse(self._frame_columns(df)))
+
+    def to_dense(self, X):
+        """Dense float32 copy of an encoded matrix in the layout transform() produces"""
+        if not sp.issparse(X):
+            return np.asarray(X, dtype=np.float32)
+        dense = X.toarray().astype(np.float32, copy=False)
+        if self.encoder.one_hot_fill != 0:
+            block = dense[:, self.encoder.one_hot_indices]
+            block[block == 0] = self.encoder.one_hot_fill
+            dense[:, self.encoder.one_hot_indices] = block
+        return dense
+
+    def to_sparse(self, X):
+        """CSR copy of a dense encoded matrix, keeping the set one-hot slots and every numeric value"""
+        X = np.asarray(X, dtype=np.float32)
+        stored = (X != 0) & ~np.isnan(X)
+        stored[:, self.numeric_indices] = True
+        indptr = np.zeros(len(X) + 1, dtype=np.int32)
+        np.cumsum(stored.sum(axis=1), out=indptr[1:])
+        indices = np.nonzero(stored)[1].astype(np.int32)
+        return sp.csr_matrix((X[stored], indices, indptr), shape=X.shape)
+
+    def transform_scenario(self, data):
+        """
+        Encode a single validated API scenario into a (1, n_features) row
+        The row is a reused buffer, so use it before encoding another scenario
+        """
+        record = scenario_features(data)
+        record.update(derive_features(record))
+        return self._scale(self.encoder.transform_one(record))
+
+    def transform_scenarios(self, records):
+        """Encode a list of validated API scenarios into the model feature matrix"""
+        columns = scenario_columns(records)
+        columns.update(derive_features(columns))
+        return self._scale(self.encoder.transform(columns))
+
+
+def load_feature_pipeline(model_artifacts):
+    """Return the artifact's fitted pipeline, rebuilding one for older artifacts"""
+    pipeline = model_artifacts.get('feature_pipeline')
+    if pipeline is None:
+        pipeline = FeaturePipeline.from_feature_names(
+            model_artifacts['feature_names'],
+            model_artifacts.get('categorical_cols'),
+            model_artifacts.get('numeric_cols')
+        )
+    if not pipeline.is_scaled:
+        logger.warning("Model artifact has no stored scaling statistics; "
+                       "numeric features are used unscaled. Retrain to store them.")
+    return pipeline
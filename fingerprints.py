@@ -0,0 +1,18 @@
+"""
+Content fingerprints shared by training, aggregation and the API
+
+Caches, model artifacts, prediction tables and aggregates are tied to the
+files they were built from by SHA-256, so a changed file is never mistaken
+for the one that was processed. Standard library only, so importing it
+pulls in neither the API nor pandas.
+"""
+import hashlib
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
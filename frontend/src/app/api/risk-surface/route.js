@@ -0,0 +1,35 @@
+export async function GET(request) {
+  try {
+    // Forward the heatmap query (x, y, fixed fields) unchanged
+    const { search } = new URL(request.url);
+
+    const API_URL = 'https://road-safety-app.onrender.com';
+
+    const response = await fetch(`${API_URL}/api/risk-surface${search}`, {
+      headers: {
+        'Accept': 'application/json',
+        'Origin': 'https://road-safety-app.vercel.app'
+      },
+      cache: 'no-store'
+    });
+
+    if (!response.ok) {
+      const errorText = await response.text();
+      console.error('Backend API error:', errorText);
+      return new Response(errorText, {
+        status: response.status,
+        headers: { 'Content-Type': 'application/json' }
+      });
+    }
+
+    return new Response(await response.text(), {
+      headers: { 'Content-Type': 'application/json' }
+    });
+  } catch (error) {
+    console.error('Proxy error:', error);
+    return new Response(JSON.stringify({ error: error.message }), {
+      status: 500,
+      headers: { 'Content-Type': 'application/json' }
+    });
+  }
+}
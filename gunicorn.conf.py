@@ -0,0 +1,5 @@
+"""Gunicorn settings for the API (render.yaml startCommand)"""
+
+# Import the app, and so load the model, once in the master process;
+# workers fork with the model already resident instead of each loading it
+preload_app = True
@@ -0,0 +1,200 @@
+"""
+Incremental retraining from new batches of accident records
+
+Instead of re-running Classification.py over the full history, this loads
+the existing booster and continues boosting:
+- append (default): --trees new trees fitted on the new batch only
+- window: --trees new trees fitted on a rolling window, the new batch plus
+  the --history batches (typically the last few months)
+The model's fitted feature pipeline and label encoder are reused, so the
+feature layout never changes, and every batch is encoded once and cached
+(data_loader.prepare_encoded_batch), as CSR when the model was trained
+sparse; older batches in the window are memory-mapped from the cache.
+Rebalancing (--rebalance, SMOTE by default, see rebalancing.py) runs on
+the training rows of this update only, so the cost scales with the
+batch, not the history.
+
+A stratified 15% of the new batch is held out to compare the parent and
+updated models and to refit the probability calibration. Each run writes
+a new versioned artifact with its lineage, numbered after the parent and
+every version already in the output directory:
+    python incremental.py --data new_batch.csv [--mode window --history older.csv ...]
+        [--model best_model.joblib] [--trees 20] [--rebalance smote] [--output-dir models] [--promote]
+"""
+import argparse
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from calibration import fit_calibration
+from data_loader import prepare_encoded_batch, stack_rows
+from features import load_feature_pipeline
+from fingerprints import file_fingerprint
+from rebalancing import STRATEGIES, rebalance
+from model_params import SMOTE_SAMPLING_STRATEGY
+
+MODELS_DIR = "models"
+MODEL_NAME = "best_model"
+TREES_PER_UPDATE = 20
+HOLDOUT_SIZE = 0.15
+
+
+def artifact_version(model_artifacts):
+    """Version number of an artifact; artifacts from Classification.py are version 1"""
+    return model_artifacts.get('version', 1)
+
+
+def versioned_path(output_dir, version, name=MODEL_NAME):
+    return os.path.join(output_dir, f"{name}_v{version:03d}.joblib")
+
+
+def next_version(output_dir, parent_version, name=MODEL_NAME):
+    """
+    Version for a new artifact: one more than the parent's and every
+    versioned artifact (or native export) already in output_dir, so an
+    update never reuses the number of another update of the same parent
+    """
+    pattern = re.compile(rf"^{re.escape(name)}_v(\d+)(\.joblib|\.meta\.json)$")
+    existing = [int(match.group(1)) for match in map(pattern.match, os.listdir(output_dir)) if match]
+    return max([parent_version, *existing]) + 1
+
+
+def inherited_params(model):
+    """Hyperparameters of model that the trees added by an update are fitted with"""
+    return {name: value for name, value in model.get_params().items()
+            if value is not None and name not in ('n_estimators', 'random_state')}
+
+
+def continue_boosting(model, X, y, n_trees, random_state=42, strategy='smote', feature_pipeline=None):
+    """
+    Classifier with n_trees more boosting rounds fitted on (X, y), starting from model's booster
+    The new trees use model's own hyperparameters, so a tuned model is continued as tuned
+    """
+    X_resampled, y_resampled, sample_weight = rebalance(
+        X, y, strategy, SMOTE_SAMPLING_STRATEGY, random_state, feature_pipeline
+    )
+    updated = xgb.XGBClassifier(**{**model.get_params(), 'n_estimators': n_trees, 'random_state': random_state})
+    updated.fit(X_resampled, y_resampled, sample_weight=sample_weight, xgb_model=model.get_booster())
+    return updated, len(y_resampled)
+
+
+def update_model(model_path, data_path, mode='append', history=(), n_trees=TREES_PER_UPDATE,
+                 output_dir=MODELS_DIR, random_state=42, rebalance_strategy='smote'):
+    """
+    Continue boosting the artifact at model_path on a new batch and save a new version
+    Returns (output path, training summary)
+    """
+    model_artifacts = joblib.load(model_path)
+    model = model_artifacts['model']
+    feature_pipeline = load_feature_pipeline(model_artifacts)
+    label_encoder = model_artifacts['label_encoder']
+    # High is the high-risk class
+    high_risk_code = int(label_encoder.transform(['High'])[0])
+
+    start = time.perf_counter()
+    X_new, y_new = prepare_encoded_batch(data_path, feature_pipeline, label_encoder)
+    y_new = (np.asarray(y_new) == high_risk_code).astype(int)
+    train_idx, holdout_idx = train_test_split(
+        np.arange(len(y_new)), test_size=HOLDOUT_SIZE, stratify=y_new, random_state=random_state
+    )
+    X_train, y_train = [X_new[train_idx]], [y_new[train_idx]]
+    if mode == 'window':
+        for path in history:
+            X_old, y_old = prepare_encoded_batch(path, feature_pipeline, label_encoder)
+            X_train.append(X_old)
+            y_train.append((np.asarray(y_old) == high_risk_code).astype(int))
+    X_train, y_train = stack_rows(X_train), np.concatenate(y_train)
+    X_holdout, y_holdout = X_new[holdout_idx], y_new[holdout_idx]
+    load_seconds = time.perf_counter() - start
+
+    print(f"Boosting {n_trees} more trees on {len(y_train)} rows ({mode})...")
+    start = time.perf_counter()
+    updated, resampled_rows = continue_boosting(model, X_train, y_train, n_trees, random_state,
+                                                rebalance_strategy, feature_pipeline)
+    fit_seconds = time.perf_counter() - start
+
+    parent_auc = roc_auc_score(y_holdout, model.predict_proba(X_holdout)[:, 1])
+    holdout_probabilities = updated.predict_proba(X_holdout)[:, 1]
+    updated_auc = roc_auc_score(y_holdout, holdout_probabilities)
+    print(f"Holdout ROC AUC on the new batch: parent {parent_auc:.4f}, updated {updated_auc:.4f}")
+
+    # The new trees shift the raw probabilities, so the calibration is refitted
+    calibration = model_artifacts.get('calibration')
+    if calibration is not None:
+        calibration = fit_calibration(holdout_probabilities, y_holdout).to_dict()
+
+    os.makedirs(output_dir, exist_ok=True)
+    version = next_version(output_dir, artifact_version(model_artifacts))
+    summary = {
+        'version': version,
+        'mode': mode,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'data': [{'path': os.path.basename(path), 'sha256': file_fingerprint(path)}
+                 for path in [data_path, *(history if mode == 'window' else ())]],
+        'train_rows': int(len(y_train)),
+        'rebalance': rebalance_strategy,
+        'resampled_rows': int(resampled_rows),
+        'holdout_rows': int(len(y_holdout)),
+        'trees_added': n_trees,
+        'params': inherited_params(model),
+        'total_trees': updated.get_booster().num_boosted_rounds(),
+        'parent_roc_auc': float(parent_auc),
+        'roc_auc': float(updated_auc),
+        'load_seconds': load_seconds,
+        'fit_seconds': fit_seconds,
+    }
+    output_path = versioned_path(output_dir, version)
+    if os.path.exists(output_path):
+        raise FileExistsError(f"{output_path} already exists; refusing to overwrite it")
+    joblib.dump({
+        **model_artifacts,
+        'model': updated,
+        'feature_pipeline': feature_pipeline,
+        'calibration': calibration,
+        'version': version,
+        'parent': {
+            'path': os.path.basename(model_path),
+            'sha256': file_fingerprint(model_path),
+            'version': artifact_version(model_artifacts),
+        },
+        'training_history': [*model_artifacts.get('training_history', []), summary],
+    }, output_path + '.tmp')
+    os.replace(output_path + '.tmp', output_path)
+    return output_path, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data', required=True, help='CSV of new accident records')
+    parser.add_argument('--model', default=f'{MODEL_NAME}.joblib')
+    parser.add_argument('--mode', choices=['append', 'window'], default='append')
+    parser.add_argument('--history', nargs='*', default=[], help='earlier batch CSVs in the window')
+    parser.add_argument('--trees', type=int, default=TREES_PER_UPDATE)
+    parser.add_argument('--rebalance', choices=STRATEGIES, default='smote')
+    parser.add_argument('--output-dir', default=MODELS_DIR)
+    parser.add_argument('--promote', action='store_true', help=f'also replace {MODEL_NAME}.joblib')
+    args = parser.parse_args()
+    if args.history and args.mode != 'window':
+        parser.error('--history is only used with --mode window')
+
+    output_path, summary = update_model(args.model, args.data, args.mode, args.history,
+                                        args.trees, args.output_dir, rebalance_strategy=args.rebalance)
+    print(f"Version {summary['version']} ({summary['total_trees']} trees) saved as '{output_path}' "
+          f"in {summary['load_seconds'] + summary['fit_seconds']:.1f}s")
+
+    if args.promote:
+        promoted = f'{MODEL_NAME}.joblib'
+        joblib.dump(joblib.load(output_path), promoted + '.tmp')
+        os.replace(promoted + '.tmp', promoted)
+        print(f"Promoted to '{promoted}'; re-export for the API with: python -m api.model_store {promoted}")
+
+
+if __name__ == '__main__':
+    main()
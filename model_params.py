@@ -0,0 +1,36 @@
+"""
+Baseline XGBoost configuration shared by training, tuning and retraining
+
+Classification.py, road_safety_analysis.py, incremental.py, rebalancing.py
+and tuning.py all start from these values, and Classification.py reads the
+parameters selected by a tuning run from here. Standard library only, so
+importing it pulls in neither lightgbm nor the search machinery in tuning.py.
+"""
+import json
+
+TUNING_RESULTS_PATH = "tuning_results.json"
+SMOTE_SAMPLING_STRATEGY = 0.5
+
+# Configuration Classification.py trains when no tuned parameters are given
+BASELINE_XGB_PARAMS = {
+    'objective': 'binary:logistic',
+    'max_depth': 6,
+    'learning_rate': 0.1,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'min_child_weight': 1,
+    'scale_pos_weight': 2,
+    'tree_method': 'hist',
+    'n_estimators': 100
+}
+
+
+def load_tuned_params(path=TUNING_RESULTS_PATH):
+    """XGBoost parameters selected by a previous tuning run"""
+    with open(path) as f:
+        results = json.load(f)
+    # Older results only have the overall selection
+    selected = results.get('xgboost') or results['selected']
+    if selected['model'] != 'xgboost':
+        raise ValueError(f"{path} has no XGBoost trials; Classification.py trains XGBoost")
+    return selected['params']
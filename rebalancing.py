@@ -0,0 +1,265 @@
+"""
+Class rebalancing strategies for the high-risk classifier
+
+Classification.py oversamples the high-risk class to half the size of the
+rest (sampling_strategy=0.5). The strategies trade fidelity for memory and
+time on large datasets:
+- smote: imblearn SMOTE on the full encoded matrix (the original behaviour)
+- smote_nc: SMOTE-NC on compact inputs, one integer code per categorical
+  column instead of its one-hot block, expanded back afterwards
+- approx_smote: SMOTE with approximate neighbours: minority rows are
+  ordered along random projections and neighbours are picked from a small
+  window around each row; synthetic rows are generated in chunks straight
+  into the preallocated output
+- reweight: no new rows; high-risk rows get a sample weight equal to the
+  oversampling factor, so the training matrix is used as is
+All return (X, y, sample_weight), sample_weight being None when rows were
+added. CSR inputs (data_loader's sparse layout) give CSR outputs. Compare
+them on a dataset (time, peak traced memory, output size, optionally
+holdout ROC AUC) with:
+    python rebalancing.py [--data optimized_accident_data.csv] [--sparse] [--evaluate]
+Train with one via REBALANCE=<strategy> python Classification.py
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+import scipy.sparse as sp
+
+from data_loader import matrix_nbytes
+
+SAMPLING_STRATEGY = 0.5
+STRATEGIES = ['smote', 'smote_nc', 'approx_smote', 'reweight']
+REPORT_PATH = "rebalancing_report.json"
+# Rows per step in approx_smote: neighbour search (bounds the candidate
+# distance tensor) and synthetic row generation
+NEIGHBOR_CHUNK_ROWS = 2_048
+CHUNK_ROWS = 65_536
+
+
+def _dense(X):
+    return X.toarray() if sp.issparse(X) else np.asarray(X)
+
+
+def _n_synthetic(y, sampling_strategy):
+    """Minority rows to add so minority / majority reaches sampling_strategy"""
+    n_minority = int(np.count_nonzero(y == 1))
+    return max(int(sampling_strategy * (len(y) - n_minority)) - n_minority, 0)
+
+
+def smote(X, y, sampling_strategy=SAMPLING_STRATEGY, random_state=42, **_):
+    from imblearn.over_sampling import SMOTE
+
+    X_resampled, y_resampled = SMOTE(
+        sampling_strategy=sampling_strategy, random_state=random_state
+    ).fit_resample(X, y)
+    return X_resampled, y_resampled, None
+
+
+def _compact_codes(X, feature_pipeline):
+    """Replace each one-hot block with the position of its hot column (len(block) when none is set)"""
+    blocks = [np.array(list(slots.values()), dtype=np.intp) for slots in feature_pipeline.encoder.one_hot.values()]
+    codes = np.empty((X.shape[0], len(blocks)), dtype=np.float32)
+    for j, columns in enumerate(blocks):
+        block = _dense(X[:, columns])
+        codes[:, j] = np.where(block.any(axis=1), block.argmax(axis=1), len(columns))
+    numeric = _dense(X[:, feature_pipeline.numeric_indices]).astype(np.float32)
+    return np.hstack([codes, numeric]), blocks
+
+
+def _expand_codes(compact, blocks, feature_pipeline):
+    """Inverse of _compact_codes"""
+    X = np.zeros((len(compact), len(feature_pipeline.feature_names)), dtype=np.float32)
+    rows = np.arange(len(compact))
+    for j, columns in enumerate(blocks):
+        codes = compact[:, j].astype(np.intp)
+        hot = codes < len(columns)
+        X[rows[hot], columns[codes[hot]]] = 1
+    X[:, feature_pipeline.numeric_indices] = compact[:, len(blocks):]
+    return X
+
+
+def smote_nc(X, y, sampling_strategy=SAMPLING_STRATEGY, random_state=42, feature_pipeline=None, **_):
+    from imblearn.over_sampling import SMOTENC
+
+    if feature_pipeline is None:
+        raise ValueError("smote_nc needs the fitted feature_pipeline to find the one-hot blocks")
+    compact, blocks = _compact_codes(X, feature_pipeline)
+    compact_resampled, y_resampled = SMOTENC(
+        categorical_features=list(range(len(blocks))),
+        sampling_strategy=sampling_strategy,
+        random_state=random_state,
+    ).fit_resample(compact, y)
+    X_resampled = _expand_codes(compact_resampled, blocks, feature_pipeline)
+    if sp.issparse(X):
+        X_resampled = feature_pipeline.to_sparse(X_resampled)
+    return X_resampled, y_resampled, None
+
+
+def _approximate_neighbors(X_minority, k_neighbors, n_projections, window, rng):
+    """
+    k approximate nearest neighbours of every minority row
+    Candidates are the rows within `window` positions in the ordering along
+    each random projection; the k closest candidates are kept
+    """
+    n_rows = len(X_minority)
+    offsets = np.concatenate([np.arange(-window, 0), np.arange(1, window + 1)])
+    candidates = []
+    for _ in range(n_projections):
+        order = np.argsort(X_minority @ rng.normal(size=X_minority.shape[1]).astype(np.float32))
+        rank = np.empty(n_rows, dtype=np.intp)
+        rank[order] = np.arange(n_rows)
+        candidates.append(order[np.clip(rank[:, np.newaxis] + offsets, 0, n_rows - 1)])
+    candidates = np.concatenate(candidates, axis=1)
+
+    neighbors = np.empty((n_rows, k_neighbors), dtype=np.intp)
+    for start in range(0, n_rows, NEIGHBOR_CHUNK_ROWS):
+        rows = slice(start, start + NEIGHBOR_CHUNK_ROWS)
+        distances = ((X_minority[candidates[rows]] - X_minority[rows, np.newaxis]) ** 2).sum(axis=2)
+        # Clipping at the ends of an ordering can make a row its own candidate
+        distances[candidates[rows] == np.arange(start, start + len(distances))[:, np.newaxis]] = np.inf
+        nearest = np.argpartition(distances, k_neighbors - 1, axis=1)[:, :k_neighbors]
+        neighbors[rows] = np.take_along_axis(candidates[rows], nearest, axis=1)
+    return neighbors
+
+
+def approx_smote(X, y, sampling_strategy=SAMPLING_STRATEGY, random_state=42, feature_pipeline=None,
+                 k_neighbors=5, n_projections=4, window=8, **_):
+    rng = np.random.default_rng(random_state)
+    n_new = _n_synthetic(y, sampling_strategy)
+    minority = np.flatnonzero(y == 1)
+    if n_new == 0 or len(minority) <= k_neighbors:
+        return X, y, None
+
+    X_minority = _dense(X[minority]).astype(np.float32, copy=False)
+    neighbors = _approximate_neighbors(X_minority, k_neighbors, n_projections, min(window, len(minority) - 1), rng)
+
+    n_rows = X.shape[0]
+    if sp.issparse(X):
+        # Synthetic rows are built dense one chunk at a time and stored as CSR
+        X_resampled, buffer = [X], np.empty((min(CHUNK_ROWS, n_new), X.shape[1]), dtype=np.float32)
+    else:
+        X_resampled = np.empty((n_rows + n_new, X.shape[1]), dtype=np.float32)
+        X_resampled[:n_rows] = X
+    for start in range(0, n_new, CHUNK_ROWS):
+        n = min(CHUNK_ROWS, n_new - start)
+        base = rng.integers(0, len(minority), n)
+        neighbor = neighbors[base, rng.integers(0, k_neighbors, n)]
+        out = buffer[:n] if sp.issparse(X) else X_resampled[n_rows + start:n_rows + start + n]
+        np.subtract(X_minority[neighbor], X_minority[base], out=out)
+        out *= rng.random((n, 1), dtype=np.float32)
+        out += X_minority[base]
+        if sp.issparse(X):
+            X_resampled.append(feature_pipeline.to_sparse(out) if feature_pipeline is not None else sp.csr_matrix(out))
+    if sp.issparse(X):
+        X_resampled = sp.vstack(X_resampled, format='csr')
+    y_resampled = np.concatenate([y, np.ones(n_new, dtype=y.dtype)])
+    return X_resampled, y_resampled, None
+
+
+def reweight(X, y, sampling_strategy=SAMPLING_STRATEGY, **_):
+    n_minority = int(np.count_nonzero(y == 1))
+    factor = max(sampling_strategy * (len(y) - n_minority) / max(n_minority, 1), 1.0)
+    sample_weight = np.where(y == 1, factor, 1.0).astype(np.float32)
+    return X, y, sample_weight
+
+
+REBALANCERS = {'smote': smote, 'smote_nc': smote_nc, 'approx_smote': approx_smote, 'reweight': reweight}
+
+
+def rebalance(X, y, strategy='smote', sampling_strategy=SAMPLING_STRATEGY, random_state=42, feature_pipeline=None):
+    """Rebalance (X, y) with the named strategy; returns (X, y, sample_weight or None)"""
+    if strategy not in REBALANCERS:
+        raise ValueError(f"Unknown rebalancing strategy '{strategy}'. Options are: {STRATEGIES}")
+    return REBALANCERS[strategy](X, np.asarray(y), sampling_strategy=sampling_strategy,
+                                 random_state=random_state, feature_pipeline=feature_pipeline)
+
+
+def feature_target_correlations(X, y, sample_weight=None, chunk_rows=CHUNK_ROWS):
+    """
+    (Weighted) Pearson correlation of every column of X with y
+    Accumulated over row chunks in float64, so X is never copied whole
+    """
+    y = np.asarray(y, dtype=np.float64)
+    w = np.ones(len(y)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    n_features = X.shape[1]
+    sum_x, sum_xx, sum_xy = np.zeros(n_features), np.zeros(n_features), np.zeros(n_features)
+    for start in range(0, len(y), chunk_rows):
+        chunk = _dense(X[start:start + chunk_rows]).astype(np.float64)
+        w_chunk, wy_chunk = w[start:start + chunk_rows], (w * y)[start:start + chunk_rows]
+        sum_x += w_chunk @ chunk
+        sum_xx += w_chunk @ (chunk * chunk)
+        sum_xy += wy_chunk @ chunk
+    total = w.sum()
+    mean_x, mean_y = sum_x / total, (w @ y) / total
+    cov = sum_xy / total - mean_x * mean_y
+    var_x = sum_xx / total - mean_x ** 2
+    var_y = (w @ (y * y)) / total - mean_y ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return cov / np.sqrt(np.maximum(var_x, 0) * var_y)
+
+
+def profile_rebalancing(X, y, strategy, **kwargs):
+    """Wall time (untraced run), peak traced allocations (second run) and output size of a strategy"""
+    start = time.perf_counter()
+    X_out, y_out, sample_weight = rebalance(X, y, strategy, **kwargs)
+    seconds = time.perf_counter() - start
+    output_bytes = sum(matrix_nbytes(a) for a in (X_out, y_out, sample_weight) if a is not None and a is not X)
+    del X_out, y_out, sample_weight
+
+    tracemalloc.start()
+    rebalance(X, y, strategy, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_traced_mb': peak / (1 << 20), 'output_mb': output_bytes / (1 << 20)}
+
+
+def main():
+    from data_loader import DATA_PATH, prepare_training_data
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--strategies', nargs='+', choices=STRATEGIES, default=STRATEGIES)
+    parser.add_argument('--sampling-strategy', type=float, default=SAMPLING_STRATEGY)
+    parser.add_argument('--sparse', action='store_true', help='use the CSR training matrices')
+    parser.add_argument('--evaluate', action='store_true', help='also fit the model and report holdout ROC AUC')
+    parser.add_argument('--output', default=REPORT_PATH)
+    args = parser.parse_args()
+
+    dataset = prepare_training_data(args.data, test_size=0.15, random_state=42, sparse=args.sparse)
+    X = dataset['X_main']
+    y = (dataset['y_main'] == 0).astype(int)  # 1 for high-risk (class 0)
+    print(f"{len(y)} rows, {int(y.sum())} high-risk, input {matrix_nbytes(X) / (1 << 20):.1f} MB")
+
+    report = {'rows': len(y), 'input_mb': matrix_nbytes(X) / (1 << 20), 'sparse': args.sparse,
+              'sampling_strategy': args.sampling_strategy, 'strategies': {}}
+    for strategy in args.strategies:
+        kwargs = {'sampling_strategy': args.sampling_strategy, 'feature_pipeline': dataset['feature_pipeline']}
+        result = profile_rebalancing(X, y, strategy, **kwargs)
+        if args.evaluate:
+            import xgboost as xgb
+            from sklearn.metrics import roc_auc_score
+            from model_params import BASELINE_XGB_PARAMS
+
+            X_out, y_out, sample_weight = rebalance(X, y, strategy, **kwargs)
+            model = xgb.XGBClassifier(**BASELINE_XGB_PARAMS)
+            start = time.perf_counter()
+            model.fit(X_out, y_out, sample_weight=sample_weight)
+            result['fit_seconds'] = time.perf_counter() - start
+            y_holdout = (dataset['y_holdout'] == 0).astype(int)
+            result['holdout_roc_auc'] = float(roc_auc_score(y_holdout, model.predict_proba(dataset['X_holdout'])[:, 1]))
+        report['strategies'][strategy] = result
+        print(f"{strategy:<13} {result['seconds']:7.2f}s  peak {result['peak_traced_mb']:8.1f} MB  "
+              f"output {result['output_mb']:8.1f} MB"
+              + (f"  fit {result['fit_seconds']:6.2f}s  ROC AUC {result['holdout_roc_auc']:.4f}"
+                 if args.evaluate else ''))
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
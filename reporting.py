@@ -0,0 +1,253 @@
+"""
+Analysis figures and the policy report, rendered from saved evaluation results
+
+Classification.py and test_model_cases.py save the numbers behind their
+figures to evaluation_results.json (one section per script) instead of
+plotting, so training time does not include matplotlib. This stage
+renders the outputs from those results:
+    python reporting.py [--results evaluation_results.json] [--only hourly_risk_pattern.png ...]
+        [--workers 4] [--force]
+
+Each output declares the result keys it is drawn from. The SHA-256 of
+those inputs (and the output's render version) is recorded in
+.cache/reports/manifest.json, and outputs whose inputs are unchanged and
+whose file still exists are skipped, so refreshing the report after a run
+that changed only the hourly pattern redraws only that figure. Stale
+outputs are rendered in parallel worker processes with the Agg backend.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+RESULTS_PATH = "evaluation_results.json"
+CACHE_DIR = os.environ.get("REPORT_CACHE_DIR", os.path.join(".cache", "reports"))
+# Bump to redraw every output after changing how they are drawn
+RENDER_VERSION = 1
+
+
+def _to_json(value):
+    """JSON-serializable copy of numpy arrays and scalars inside dicts and lists"""
+    if isinstance(value, dict):
+        return {str(key): _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def load_results(path=RESULTS_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_results(section, results, path=RESULTS_PATH):
+    """Replace one section of the saved evaluation results, keeping the others"""
+    saved = load_results(path)
+    saved[section] = _to_json(results)
+    with open(path + ".tmp", "w") as f:
+        json.dump(saved, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def render_confusion_matrix(inputs, path):
+    plt = _pyplot()
+    cm = np.array(inputs["confusion_matrix"])
+    plt.figure(figsize=(8, 6))
+    plt.imshow(cm, interpolation='nearest', cmap='Blues')
+    plt.title('Confusion Matrix - Holdout Set (Binary Classification)')
+    plt.colorbar()
+
+    classes = ['Non-High-Risk', 'High-Risk']
+    tick_marks = np.arange(len(classes))
+    plt.xticks(tick_marks, classes, rotation=45)
+    plt.yticks(tick_marks, classes)
+
+    # Add normalized values
+    cm_normalized = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis]
+    for i, j in np.ndindex(cm.shape):
+        plt.text(j, i, f'{cm[i, j]}\n({cm_normalized[i, j]:.2%})',
+                 ha="center", va="center", color="black")
+
+    plt.ylabel('True Label')
+    plt.xlabel('Predicted Label')
+    plt.tight_layout()
+    plt.savefig(path, dpi=300, bbox_inches='tight')
+    plt.close()
+
+
+def top_features(inputs, n=10):
+    """(names, importances) of the n most important features, most important first"""
+    importance = np.array(inputs["feature_importance"])
+    indices = np.argsort(importance)[-n:][::-1]
+    return np.array(inputs["feature_names"])[indices], importance[indices]
+
+
+def render_feature_importance(inputs, path):
+    plt = _pyplot()
+    names, importance = top_features(inputs)
+    plt.figure(figsize=(10, 6))
+    plt.title('Top 10 Most Important Features')
+    plt.bar(range(len(names)), importance)
+    plt.xticks(range(len(names)), names, rotation=45, ha='right')
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+
+
+def render_hourly_risk(inputs, path):
+    plt = _pyplot()
+    hourly = inputs["hourly_risk"]
+    plt.figure(figsize=(12, 6))
+    plt.plot(hourly["hour"], hourly["risk_probability"], marker='o')
+    plt.title('High Risk Probability by Hour of Day')
+    plt.xlabel('Hour of Day')
+    plt.ylabel('Probability of High Risk Incident')
+    plt.grid(True)
+    plt.savefig(path)
+    plt.close()
+
+
+def render_risk_heatmap(inputs, path):
+    import pandas as pd
+    import seaborn as sns
+    plt = _pyplot()
+    heatmap = inputs["risk_heatmap"]
+    pivot_table = pd.DataFrame(heatmap["values"], index=pd.Index(heatmap["index"], name='Road_Type'),
+                               columns=pd.Index(heatmap["columns"], name='Weather'), dtype=float)
+    plt.figure(figsize=(10, 6))
+    sns.heatmap(pivot_table, annot=True, cmap='RdYlGn_r', fmt='.2f')
+    plt.title('Accident Risk Heatmap by Road Type and Weather')
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+
+
+def write_policy_insights(inputs, path):
+    cm = np.array(inputs["confusion_matrix"])
+    cm_normalized = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis]
+    names, importance = top_features(inputs, 5)
+    with open(path, 'w') as f:
+        f.write("=== Road Safety Policy Insights ===\n\n")
+        f.write("Model Performance:\n")
+        f.write(f"- Can identify {cm_normalized[1,1]:.1%} of high-risk situations\n")
+        f.write(f"- Overall accuracy: {inputs['accuracy']:.1%}\n\n")
+
+        f.write("Top Risk Factors:\n")
+        for idx, (name, value) in enumerate(zip(names, importance)):
+            f.write(f"{idx+1}. {name}: {value:.3f}\n")
+
+        f.write("\nRecommended Policy Actions:\n")
+        f.write("1. Time-based interventions at peak risk hours\n")
+        f.write("2. Focus on high-impact features for immediate risk reduction\n")
+        f.write("3. Weather-speed interaction safety guidelines\n")
+        f.write("4. Targeted measures for night-time high-speed zones\n")
+
+
+# Output file: (results section, keys it is drawn from, render function)
+OUTPUTS = {
+    'confusion_matrix_binary.png': ('classification', ['confusion_matrix'], render_confusion_matrix),
+    'feature_importance_high_risk.png': ('classification', ['feature_names', 'feature_importance'],
+                                         render_feature_importance),
+    'hourly_risk_pattern.png': ('classification', ['hourly_risk'], render_hourly_risk),
+    'policy_insights.txt': ('classification', ['confusion_matrix', 'accuracy', 'feature_names', 'feature_importance'],
+                            write_policy_insights),
+    'risk_heatmap.png': ('risk_heatmap', ['risk_heatmap'], render_risk_heatmap),
+}
+
+
+def input_hash(name, inputs):
+    """SHA-256 of an output's name, render version and canonical inputs"""
+    canonical = json.dumps(inputs, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{name}\n{RENDER_VERSION}\n{canonical}".encode()).hexdigest()
+
+
+def _render(name, inputs, path):
+    OUTPUTS[name][2](inputs, path)
+    return name
+
+
+def build_reports(results_path=RESULTS_PATH, output_dir=".", only=None, workers=None, force=False,
+                  cache_dir=CACHE_DIR):
+    """
+    Render the outputs whose inputs changed since they were last rendered
+    Outputs whose results section has not been saved are left alone
+    Returns {output name: 'rendered', 'unchanged' or 'no results'}
+    """
+    results = load_results(results_path)
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+
+    status, stale = {}, {}
+    for name, (section, keys, _) in OUTPUTS.items():
+        if only is not None and name not in only:
+            continue
+        if section not in results:
+            status[name] = 'no results'
+            continue
+        inputs = {key: results[section][key] for key in keys}
+        path = os.path.join(output_dir, name)
+        digest = input_hash(name, inputs)
+        if not force and manifest.get(path) == digest and os.path.exists(path):
+            status[name] = 'unchanged'
+        else:
+            stale[name] = (inputs, path, digest)
+
+    workers = min(len(stale), os.cpu_count() or 1) if workers is None else min(workers, len(stale))
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(_render, name, inputs, path) for name, (inputs, path, _) in stale.items()]
+            rendered = [future.result() for future in futures]
+    else:
+        rendered = [_render(name, inputs, path) for name, (inputs, path, _) in stale.items()]
+
+    for name in rendered:
+        _, path, digest = stale[name]
+        manifest[path] = digest
+        status[name] = 'rendered'
+    if rendered:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--results", default=RESULTS_PATH)
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--only", nargs="*", choices=list(OUTPUTS), help="outputs to refresh (default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="redraw outputs even when their inputs are unchanged")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    status = build_reports(args.results, args.output_dir, args.only, args.workers, args.force)
+    for name, state in status.items():
+        print(f"{name}: {state}")
+    rendered = sum(state == 'rendered' for state in status.values())
+    print(f"Rendered {rendered} of {len(status)} outputs in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+High-risk rates and counts over time and road conditions
+
+Every record is reduced to integer codes per dimension (hour, weekday,
+month, road_type, weather_conditions, junction_detail; -1 when missing),
+and a RiskCube over one or more dimensions counts records and high-risk
+records per combination of levels with a single np.bincount over the
+flattened level indices: no per-group Python callbacks. Counts are
+additive, so cubes are updated chunk by chunk as the CSV streams in and
+later batches are added to the saved cubes without re-reading the history.
+
+RiskAggregator keeps the one-way cube of every dimension plus the two-way
+cross-tabs, saved as JSON for the dashboards (served by GET
+/api/risk-aggregates):
+    python risk_aggregation.py [--data optimized_accident_data.csv] [--output risk_aggregates.json]
+    python risk_aggregation.py --data new_batch.csv --update
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from fingerprints import file_fingerprint
+
+DATA_PATH = "optimized_accident_data.csv"
+OUTPUT_PATH = "risk_aggregates.json"
+DIMENSIONS = ["hour", "weekday", "month", "road_type", "weather_conditions", "junction_detail"]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+# Raw columns the dimensions and the label are read from
+SOURCE_COLS = ["date", "time", "day_of_week", "road_type", "weather_conditions", "junction_detail", "risk_level"]
+MISSING = -1
+HIGH_RISK_LABEL = "High"
+
+
+def cube_name(dims):
+    """Key of a cube in the saved aggregates, dimensions in DIMENSIONS order"""
+    return ",".join(sorted(dims, key=DIMENSIONS.index))
+
+
+def _codes(values):
+    """Float values (NaN when missing) as int16 codes with MISSING for NaN"""
+    values = np.asarray(values, dtype=np.float32)
+    return np.where(np.isnan(values), MISSING, values).astype(np.int16)
+
+
+def _category_codes(series, lookup):
+    """Codes of a categorical Series via a per-category lookup, computed once per distinct value"""
+    codes = series.cat.codes.to_numpy()
+    return np.where(codes >= 0, lookup[codes], MISSING).astype(np.int16)
+
+
+def dimension_codes(chunk):
+    """{dimension: int16 codes} for a raw accident frame read with data_loader's dtypes"""
+    import pandas as pd
+    from features import parse_hours
+
+    date = chunk["date"].astype("category")
+    months = pd.to_datetime(date.cat.categories, format="%d/%m/%Y", errors="coerce").month
+    weekday = chunk["day_of_week"].astype("category")
+    positions = {name: i for i, name in enumerate(WEEKDAYS)}
+    return {
+        "hour": _codes(parse_hours(chunk["time"])),
+        "weekday": _category_codes(weekday, np.array([positions.get(name, MISSING) for name in weekday.cat.categories])),
+        "month": _category_codes(date, _codes(months.to_numpy(dtype=np.float32, na_value=np.nan))),
+        **{col: _codes(chunk[col].to_numpy(dtype=np.float32, na_value=np.nan))
+           for col in ["road_type", "weather_conditions", "junction_detail"]},
+    }
+
+
+def level_labels(dim, levels):
+    """Readable labels for a dimension's levels (weekday names; codes as they are)"""
+    if dim == "weekday":
+        return [WEEKDAYS[level] if level != MISSING else None for level in levels]
+    return [int(level) if level != MISSING else None for level in levels]
+
+
+class RiskCube:
+    """Record and high-risk counts over the combinations of levels of some dimensions"""
+
+    def __init__(self, dims, levels=None, total=None, high=None):
+        self.dims = list(dims)
+        self.levels = [np.asarray(l, dtype=np.int16) for l in levels] if levels is not None \
+            else [np.empty(0, dtype=np.int16) for _ in self.dims]
+        shape = tuple(len(l) for l in self.levels)
+        self.total = np.asarray(total, dtype=np.int64).reshape(shape) if total is not None else np.zeros(shape, np.int64)
+        self.high = np.asarray(high, dtype=np.int64).reshape(shape) if high is not None else np.zeros(shape, np.int64)
+
+    @property
+    def rate(self):
+        """High-risk share per cell; NaN where there are no records"""
+        return np.divide(self.high, self.total, out=np.full(self.total.shape, np.nan), where=self.total > 0)
+
+    def _extend(self, new_levels):
+        """Grow the cube to include new levels, keeping the existing counts"""
+        merged = [np.union1d(old, new).astype(np.int16) for old, new in zip(self.levels, new_levels)]
+        if all(len(m) == len(old) for m, old in zip(merged, self.levels)):
+            return
+        positions = np.ix_(*[np.searchsorted(m, old) for m, old in zip(merged, self.levels)])
+        shape = tuple(len(m) for m in merged)
+        for name in ["total", "high"]:
+            grown = np.zeros(shape, dtype=np.int64)
+            grown[positions] = getattr(self, name)
+            setattr(self, name, grown)
+        self.levels = merged
+
+    def add(self, codes, high):
+        """Count records given {dimension: codes} and a high-risk flag per record"""
+        columns = [np.asarray(codes[dim]) for dim in self.dims]
+        self._extend([np.unique(column) for column in columns])
+        index = np.ravel_multi_index(
+            [np.searchsorted(levels, column) for levels, column in zip(self.levels, columns)], self.total.shape
+        )
+        size = self.total.size
+        self.total += np.bincount(index, minlength=size).reshape(self.total.shape)
+        self.high += np.bincount(index[np.asarray(high, dtype=bool)], minlength=size).reshape(self.total.shape)
+        return self
+
+    def merge(self, other):
+        """Add another cube's counts over the same dimensions"""
+        self._extend(other.levels)
+        positions = np.ix_(*[np.searchsorted(mine, theirs) for mine, theirs in zip(self.levels, other.levels)])
+        self.total[positions] += other.total
+        self.high[positions] += other.high
+        return self
+
+    def to_dict(self):
+        return {
+            "dims": self.dims,
+            "levels": [level_labels(dim, levels) for dim, levels in zip(self.dims, self.levels)],
+            "codes": [levels.tolist() for levels in self.levels],
+            "total": self.total.tolist(),
+            "high": self.high.tolist(),
+            "rate": np.round(self.rate, 6).tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state["dims"], state["codes"], state["total"], state["high"])
+
+
+class RiskAggregator:
+    """One-way cubes of every dimension plus (optionally) the two-way cross-tabs"""
+
+    def __init__(self, dims=DIMENSIONS, crosstabs=True):
+        combinations = [(dim,) for dim in dims]
+        if crosstabs:
+            combinations += list(itertools.combinations(dims, 2))
+        self.cubes = {cube_name(c): RiskCube(sorted(c, key=DIMENSIONS.index)) for c in combinations}
+        # Fingerprints of ingested files, so a batch is never counted twice
+        self.sources = []
+
+    def update(self, codes, high):
+        for cube in self.cubes.values():
+            cube.add(codes, high)
+        return self
+
+    def update_from_csv(self, path, chunksize=None):
+        """Add every record of a CSV, streamed in chunks; returns the number of rows read"""
+        from data_loader import CHUNK_SIZE, read_chunks
+
+        sha256 = file_fingerprint(path)
+        if any(source["sha256"] == sha256 for source in self.sources):
+            raise ValueError(f"{path} was already aggregated")
+        rows = 0
+        for _, chunk in read_chunks(path, chunksize or CHUNK_SIZE, usecols=SOURCE_COLS):
+            self.update(dimension_codes(chunk), (chunk["risk_level"] == HIGH_RISK_LABEL).to_numpy(dtype=bool))
+            rows += len(chunk)
+        self.sources.append({"path": os.path.basename(path), "sha256": sha256, "rows": rows})
+        return rows
+
+    def to_dict(self):
+        return {
+            "updated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "rows": sum(source["rows"] for source in self.sources),
+            "sources": self.sources,
+            "cubes": {name: cube.to_dict() for name, cube in self.cubes.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        aggregator = cls.__new__(cls)
+        aggregator.cubes = {name: RiskCube.from_dict(cube) for name, cube in state["cubes"].items()}
+        aggregator.sources = list(state.get("sources", []))
+        return aggregator
+
+    def save(self, path=OUTPUT_PATH):
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path=OUTPUT_PATH):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def hourly_risk(hours, is_high_risk):
+    """(hours, high-risk rate) for the hours that occur, from float hours with NaN when missing"""
+    cube = RiskCube(["hour"]).add({"hour": _codes(hours)}, is_high_risk)
+    present = cube.levels[0] != MISSING
+    return cube.levels[0][present], cube.rate[present]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data", nargs="+", default=[DATA_PATH], help="CSV files of accident records")
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--update", action="store_true", help="add the files to the saved aggregates")
+    parser.add_argument("--no-crosstabs", action="store_true", help="only the one-way cubes")
+    args = parser.parse_args()
+
+    if args.update and os.path.exists(args.output):
+        aggregator = RiskAggregator.load(args.output)
+    else:
+        aggregator = RiskAggregator(crosstabs=not args.no_crosstabs)
+    start = time.perf_counter()
+    for path in args.data:
+        try:
+            rows = aggregator.update_from_csv(path)
+        except ValueError as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        print(f"Aggregated {rows:,} rows from {path}")
+    aggregator.save(args.output)
+    print(f"{len(aggregator.cubes)} cubes over {sum(s['rows'] for s in aggregator.sources):,} rows "
+          f"saved to '{args.output}' in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
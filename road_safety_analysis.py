@@ -5,7 +5,7 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.model_selection import train_test_split, cross_val_score, StratifiedKFold, GridSearchCV
-from sklearn.preprocessing import StandardScaler, LabelEncoder
+from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix, roc_auc_score
 from sklearn.ensemble import RandomForestClassifier, VotingClassifier
 from sklearn.pipeline import Pipeline
@@ -17,111 +17,33 @@ import xgboost as xgb
 import lightgbm as lgb
 from datetime import datetime
 import joblib
+import os
 import warnings
+from features import CATEGORICAL_COLS, NUMERIC_COLS
+from data_loader import prepare_training_data
+from model_params import BASELINE_XGB_PARAMS
 warnings.filterwarnings('ignore', category=UserWarning)
 
 # Load and split dataset
 print("Loading data and creating holdout set...")
 file_path = "optimized_accident_data.csv"
-df = pd.read_csv(file_path)
 
-# Create initial holdout set
-df_main, df_holdout = train_test_split(df, test_size=0.15, stratify=df["risk_level"], random_state=42)
+# Stream the CSV in chunks and create the holdout split (cached after the first run)
+# SPARSE_FEATURES=1 encodes into CSR matrices that store only the set one-hot slots
+dataset = prepare_training_data(file_path, test_size=0.15, random_state=42,
+                                sparse=os.environ.get('SPARSE_FEATURES') == '1')
 
-# Feature engineering function
-def create_features(df):
-    print("Creating features focused on high-risk patterns...")
-    
-    # Core Temporal Features
-    df['date'] = pd.to_datetime(df['date'], format='%d/%m/%Y')
-    df['time'] = pd.to_datetime(df['time'], format='%H:%M')
-    df['hour'] = df['time'].dt.hour
-    df['month'] = df['date'].dt.month
-    
-    # Risk-focused Features
-    df['is_night'] = ((df['hour'] >= 22) | (df['hour'] <= 5)).astype(int)
-    df['is_rush_hour'] = df['hour'].isin([7, 8, 9, 16, 17, 18]).astype(int)
-    df['is_weekend'] = (df['day_of_week'].isin(['Saturday', 'Sunday'])).astype(int)
-    
-    # Enhanced Risk Factors
-    df['casualty_rate'] = df['number_of_casualties'] / df['number_of_vehicles'].clip(lower=1)
-    df['high_speed'] = (df['speed_limit'] >= 60).astype(int)
-    
-    # Weather and Road Risk Scoring
-    weather_risk = {1: 0, 2: 2, 3: 4, 4: 2, 5: 4, 6: 6, 7: 5, 8: 1, 9: 3}
-    surface_risk = {1: 0, 2: 2, 3: 4, 4: 5, 5: 5}
-    
-    df['weather_risk'] = df['weather_conditions'].map(weather_risk).fillna(3)
-    df['surface_risk'] = df['road_surface_conditions'].map(surface_risk).fillna(2)
-    
-    # Combined Risk Score
-    df['combined_risk'] = (
-        df['weather_risk'] + 
-        df['surface_risk'] + 
-        df['is_night'] * 2 +
-        df['high_speed'] * 2
-    )
-    
-    # High-risk Interaction Features
-    df['night_speed_risk'] = df['is_night'] * df['high_speed']
-    df['weather_speed_risk'] = df['weather_risk'] * df['high_speed']
-    
-    print("Feature engineering completed.")
-    return df
-
-# Define feature columns
-categorical_cols = [
-    "road_type", 
-    "weather_conditions",
-    "light_conditions",
-    "road_surface_conditions",
-    "junction_detail"
-]
-
-numeric_cols = [
-    "speed_limit",
-    "number_of_vehicles",
-    "number_of_casualties",
-    "casualty_rate",
-    "weather_risk",
-    "surface_risk",
-    "combined_risk",
-    "night_speed_risk",
-    "weather_speed_risk",
-    "is_night",
-    "is_rush_hour",
-    "is_weekend",
-    "high_speed"
-]
-
-# Apply feature engineering
-df_main = create_features(df_main)
-
-# Process categorical columns
-for col in categorical_cols:
-    df_main[col] = df_main[col].fillna(df_main[col].mode()[0])
-
-# Create dummy variables
-df_encoded = pd.get_dummies(df_main[categorical_cols], columns=categorical_cols)
-X_cat = df_encoded.values
-
-# Process numeric columns
-for col in numeric_cols:
-    df_main[col] = df_main[col].fillna(df_main[col].median())
-
-X_num = df_main[numeric_cols].values
-
-# Scale numeric features
-scaler = StandardScaler()
-X_num_scaled = scaler.fit_transform(X_num)
-
-# Combine features
-X = np.hstack([X_cat, X_num_scaled])
-feature_names = np.concatenate([df_encoded.columns, numeric_cols])
+# Feature engineering and encoding (shared with training and the API)
+categorical_cols = CATEGORICAL_COLS
+numeric_cols = NUMERIC_COLS
+feature_pipeline = dataset['feature_pipeline']
+X = dataset['X_main']
+feature_names = np.array(feature_pipeline.feature_names)
+print("Feature engineering completed.")
 
 # Encode target
-label_encoder = LabelEncoder()
-y = label_encoder.fit_transform(df_main["risk_level"])
+label_encoder = dataset['label_encoder']
+y = dataset['y_main']
 
 # Convert to binary classification
 print("\nConverting to binary classification (high-risk vs non-high-risk)...")
@@ -142,17 +64,7 @@ print(f"High-risk (1): {sum(y_resampled == 1)}")
 print(f"Other (0): {sum(y_resampled == 0)}")
 
 # XGBoost parameters
-xgb_params = {
-    'objective': 'binary:logistic',
-    'max_depth': 6,
-    'learning_rate': 0.1,
-    'subsample': 0.8,
-    'colsample_bytree': 0.8,
-    'min_child_weight': 1,
-    'scale_pos_weight': 2,
-    'tree_method': 'hist',
-    'n_estimators': 100
-}
+xgb_params = dict(BASELINE_XGB_PARAMS)
 
 # Train model
 print("Training binary classification model...")
@@ -161,30 +73,10 @@ model.fit(X_resampled, y_resampled)
 
 # Process holdout set
 print("\nEvaluating on holdout set...")
-df_holdout = create_features(df_holdout)
-
-# Process categorical columns
-for col in categorical_cols:
-    df_holdout[col] = df_holdout[col].fillna(df_holdout[col].mode()[0])
-
-# Create dummy variables for holdout
-holdout_encoded = pd.get_dummies(df_holdout[categorical_cols], columns=categorical_cols)
-for col in df_encoded.columns:
-    if col not in holdout_encoded.columns:
-        holdout_encoded[col] = 0
-holdout_encoded = holdout_encoded[df_encoded.columns]
-X_holdout_cat = holdout_encoded.values
-
-# Process numeric columns
-for col in numeric_cols:
-    df_holdout[col] = df_holdout[col].fillna(df_holdout[col].median())
-
-X_holdout_num = df_holdout[numeric_cols].values
-X_holdout_num_scaled = scaler.transform(X_holdout_num)
-X_holdout = np.hstack([X_holdout_cat, X_holdout_num_scaled])
+X_holdout = dataset['X_holdout']
 
 # Encode holdout targets
-y_holdout = label_encoder.transform(df_holdout["risk_level"])
+y_holdout = dataset['y_holdout']
 y_holdout_binary = (y_holdout == 0).astype(int)
 
 # Make predictions
@@ -234,21 +126,29 @@ plt.savefig('feature_importance_high_risk.png')
 plt.close()
 
 # Save model
-joblib.dump(model, 'best_model.joblib')
+model_artifacts = {
+    'model': model,
+    'feature_pipeline': feature_pipeline,
+    'feature_names': feature_names,
+    'label_encoder': label_encoder,
+    'categorical_cols': categorical_cols,
+    'numeric_cols': numeric_cols
+}
+joblib.dump(model_artifacts, 'best_model.joblib')
 print("\nModel saved as 'best_model.joblib'")
 
 # Test predictions
 test_scenarios = [
     {
         "road_type": 3,
-        "weather": "Snow",
+        "weather_conditions": "Snow",
         "speed_limit": 70,
         "time_of_day": "Night",
         "junction_detail": "Roundabout"
     },
     {
         "road_type": 1,
-        "weather": "Fine",
+        "weather_conditions": "Fine",
         "speed_limit": 20,
         "time_of_day": "Afternoon",
         "junction_detail": "Not at junction"
@@ -256,16 +156,8 @@ test_scenarios = [
 ]
 
 def process_scenario(scenario):
-    # Convert scenario to DataFrame
-    df_scenario = pd.DataFrame([scenario])
-    
-    # Apply feature engineering
-    df_scenario = create_features(df_scenario)
-    
-    # Process features similar to training data
-    # [Add processing code here]
-    
-    return df_scenario
+    # Encode and scale the scenario exactly as the API does
+    return feature_pipeline.transform_scenario(scenario)
 
 # Test each scenario
 for scenario in test_scenarios:
@@ -0,0 +1,89 @@
+"""
+Synthetic accident data with the same schema as optimized_accident_data.csv
+
+Columns, code sets and class balance (about 10% High, 30% Medium, 60% Low)
+follow the real dataset, including missing (-1) codes. risk_level depends on
+speed, weather, surface, light, junction and time of day through a noisy
+score, so models trained on it have signal to learn. Generation is
+vectorized and seeded, so the same (rows, seed) always gives the same file:
+    python synthetic_data.py [--rows 200000] [--seed 0] [--output synthetic_accident_data.csv]
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from features import SURFACE_RISK, WEATHER_RISK
+
+ROAD_TYPES = [1, 2, 3, 6, 7, 9]
+WEATHER_CONDITIONS = [1, 2, 3, 4, 5, 6, 7, 8, 9]
+SPEED_LIMITS = [20, 30, 40, 50, 60, 70]
+LIGHT_CONDITIONS = [1, 4, 5, 6, 7]
+ROAD_SURFACE_CONDITIONS = [-1, 1, 2, 3, 4, 5, 9]
+JUNCTION_DETAILS = [0, 1, 2, 3, 5, 6, 7, 8, 9, 99]
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+# Share of rows labelled High and Medium; the rest are Low
+RISK_SHARES = {'High': 0.10, 'Medium': 0.30}
+
+
+def generate_accident_data(n_rows, seed=0):
+    """DataFrame of n_rows synthetic accidents in the CSV's column order"""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2021-01-01') + pd.to_timedelta(rng.integers(0, 365, n_rows), unit='D')
+    hours = rng.integers(0, 24, n_rows)
+    minutes = rng.integers(0, 60, n_rows)
+    columns = {
+        'road_type': rng.choice(ROAD_TYPES, n_rows),
+        'weather_conditions': rng.choice(WEATHER_CONDITIONS, n_rows),
+        'speed_limit': rng.choice(SPEED_LIMITS, n_rows),
+        'number_of_vehicles': rng.integers(1, 5, n_rows),
+        'number_of_casualties': rng.integers(1, 4, n_rows),
+        'light_conditions': rng.choice(LIGHT_CONDITIONS, n_rows),
+        'road_surface_conditions': rng.choice(ROAD_SURFACE_CONDITIONS, n_rows),
+        'junction_detail': rng.choice(JUNCTION_DETAILS, n_rows),
+    }
+
+    weather_risk = pd.Series(columns['weather_conditions']).map(WEATHER_RISK).to_numpy()
+    surface_risk = pd.Series(columns['road_surface_conditions']).map(SURFACE_RISK).fillna(2).to_numpy()
+    score = (
+        columns['speed_limit'] / 20
+        + weather_risk / 2
+        + surface_risk / 2
+        + (columns['light_conditions'] != 1)
+        + (columns['junction_detail'] != 0) * 0.5
+        + ((hours >= 22) | (hours <= 5))
+        + columns['number_of_casualties'] * 0.5
+        + rng.normal(0, 1.5, n_rows)
+    )
+    high_cut, medium_cut = np.quantile(score, [1 - RISK_SHARES['High'], 1 - RISK_SHARES['High'] - RISK_SHARES['Medium']])
+    risk_level = np.where(score >= high_cut, 'High', np.where(score >= medium_cut, 'Medium', 'Low'))
+
+    return pd.DataFrame({
+        'date': dates.strftime('%d/%m/%Y'),
+        'time': [f'{h:02d}:{m:02d}' for h, m in zip(hours, minutes)],
+        'day_of_week': np.array(DAYS)[dates.dayofweek],
+        'road_type': columns['road_type'],
+        'weather_conditions': columns['weather_conditions'],
+        'speed_limit': columns['speed_limit'],
+        'number_of_vehicles': columns['number_of_vehicles'],
+        'number_of_casualties': columns['number_of_casualties'],
+        'light_conditions': columns['light_conditions'],
+        'road_surface_conditions': columns['road_surface_conditions'],
+        'junction_detail': columns['junction_detail'],
+        'risk_level': risk_level,
+    })
+
+
+def write_accident_data(path, n_rows, seed=0):
+    """Write generate_accident_data(n_rows, seed) to a CSV file and return its path"""
+    generate_accident_data(n_rows, seed).to_csv(path, index=False)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='synthetic_accident_data.csv')
+    args = parser.parse_args()
+    print(f"Wrote {args.rows} rows to {write_accident_data(args.output, args.rows, args.seed)}")
@@ -0,0 +1,77 @@
+"""
+Tests for the vectorized batch scoring path of the prediction API
+
+score_batch / build_predictions and /api/predict/batch must give exactly
+what single-row scoring gives, and batch bodies are read as a JSON array,
+a {"scenarios": [...]} object or NDJSON.
+"""
+import json
+
+import numpy as np
+import pytest
+
+from api import routes
+from api.model_registry import ServedModel
+from api.model_store import load_artifact
+from api.prediction_table import grid_records
+
+GRID = grid_records(routes.GRID_OPTIONS)
+SCENARIO = {'road_type': 6, 'weather_conditions': 'Rain', 'speed_limit': 60,
+            'time_of_day': 'Night', 'junction_detail': 'Crossroads'}
+# Knots of a calibrated artifact, so both post-processing paths are covered
+CALIBRATION = {'method': 'platt', 'x': [0.0, 0.5, 1.0], 'y': [0.05, 0.3, 0.95], 'threshold': 0.4}
+
+
+@pytest.mark.parametrize('calibration', [None, CALIBRATION])
+def test_batch_scoring_matches_single_rows(tmp_path, write_artifact, calibration):
+    path = write_artifact(tmp_path, 'best_model', calibration=calibration)
+    served = ServedModel(path, load_artifact(path), routes.RISK_THRESHOLDS['high'])
+
+    records = [GRID[i] for i in np.random.default_rng(0).choice(len(GRID), 200, replace=False)]
+    raw, _, final = routes.score_batch(records, served=served)
+    batch = routes.build_predictions(records, final, raw, served=served)
+    for i, data in enumerate(records):
+        single_raw = served.model.predict_proba(routes.preprocess_input(data, served))[0, 1]
+        _, single_final = routes.postprocess_probability(data, single_raw, served)
+        assert raw[i] == pytest.approx(single_raw, abs=1e-6)
+        assert final[i] == pytest.approx(single_final, abs=1e-6)
+        assert batch[i] == routes.build_prediction(data, single_final, single_raw, served)
+
+
+def test_batch_endpoint_matches_predict_endpoint(client):
+    records = GRID[::97]
+    batch = client.post('/api/predict/batch', json=records).get_json()
+    assert batch['summary'] == {'total': len(records), 'succeeded': len(records), 'failed': 0}
+    for data, result in zip(records, batch['results']):
+        assert result['prediction'] == client.post('/api/predict', json=data).get_json()['prediction']
+
+
+def test_batch_reports_invalid_scenarios_in_place(client):
+    items = [SCENARIO, {**SCENARIO, 'speed_limit': 55}, 'not a scenario']
+    results = client.post('/api/predict/batch', json=items).get_json()['results']
+    assert [result['index'] for result in results] == [0, 1, 2]
+    assert 'prediction' in results[0]
+    assert 'speed_limit' in results[1]['details']
+    assert results[2]['error'] == "Scenario must be a JSON object"
+
+
+def test_batch_payload_formats(client):
+    ndjson = '\n'.join(json.dumps(record) for record in GRID[:3]) + '\nnot json\n'
+    response = client.post('/api/predict/batch', data=ndjson, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.get_json()['summary'] == {'total': 4, 'succeeded': 3, 'failed': 1}
+
+    wrapped = client.post('/api/predict/batch', json={'scenarios': GRID[:2]})
+    assert wrapped.get_json()['summary']['succeeded'] == 2
+
+    # A pretty-printed object is one document, not NDJSON
+    pretty = client.post('/api/predict/batch', data=json.dumps(SCENARIO, indent=2), content_type='application/json')
+    assert pretty.status_code == 400
+    assert 'scenarios' in pretty.get_json()['error']
+    invalid = client.post('/api/predict/batch', data='{"road_type": 6', content_type='application/json')
+    assert invalid.status_code == 400
+
+
+def test_batch_size_limit(client, monkeypatch):
+    monkeypatch.setattr(routes, 'MAX_BATCH_SIZE', 2)
+    assert client.post('/api/predict/batch', json=GRID[:3]).status_code == 413
@@ -0,0 +1,126 @@
+"""
+Tests for the ASGI entry point and its micro-batcher
+
+Drives create_app() with in-memory receive/send callables: concurrent
+requests are coalesced into one scoring call, every response goes back to
+the request that sent it (per pinned model version in a mixed batch), and
+the error paths match app.py.
+"""
+import asyncio
+import json
+
+import pytest
+
+import asgi
+from api import routes
+from api.model_registry import RegistrySnapshot
+
+SCENARIO = {'road_type': 6, 'weather_conditions': 'Rain', 'speed_limit': 60,
+            'time_of_day': 'Night', 'junction_detail': 'Crossroads'}
+CALIBRATION = {'method': 'platt', 'x': [0.0, 0.5, 1.0], 'y': [0.05, 0.3, 0.95], 'threshold': 0.4}
+
+
+async def call(app, method, path, body=b'', headers=(), query=b''):
+    """(status, headers, body) of one request to an ASGI app"""
+    scope = {'type': 'http', 'method': method, 'path': path, 'headers': list(headers), 'query_string': query}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]['status'], dict(sent[0]['headers']), b''.join(m.get('body', b'') for m in sent[1:])
+
+
+def post_predict(app, data, version=None, query=b''):
+    headers = [(b'x-model-version', str(version).encode())] if version is not None else []
+    return call(app, 'POST', '/api/predict', json.dumps(data).encode(), headers, query)
+
+
+@pytest.fixture(autouse=True)
+def no_response_cache(monkeypatch):
+    monkeypatch.setattr(routes, 'response_cache', None)
+
+
+def test_concurrent_submits_are_coalesced():
+    batches = []
+
+    def score(records):
+        batches.append(list(records))
+        return [record * 10 for record in records]
+
+    async def run():
+        batcher = asgi.MicroBatcher(score, max_batch_size=8)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(20))), batcher
+
+    results, batcher = asyncio.run(run())
+    assert results == [i * 10 for i in range(20)]
+    assert [len(batch) for batch in batches] == [8, 8, 4]
+    assert (batcher.batches, batcher.requests) == (3, 20)
+
+
+def test_scoring_errors_reach_every_request():
+    def score(records):
+        raise RuntimeError("model failed")
+
+    async def run():
+        batcher = asgi.MicroBatcher(score)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert len(results) == 3
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_mixed_version_batch_matches_flask(registry, client, tmp_path, write_artifact):
+    write_artifact(tmp_path / 'models', 'best_model_v002', version=2, calibration=CALIBRATION)
+    registry.refresh()
+    requests = [(dict(SCENARIO, speed_limit=limit), version)
+                for limit in (20, 40, 70) for version in (None, 2)]
+
+    async def run():
+        app = asgi.create_app(max_batch_size=64)
+        responses = await asyncio.gather(*(post_predict(app, data, version) for data, version in requests))
+        return responses, app.batchers
+
+    responses, batchers = asyncio.run(run())
+    assert [batcher.batches for batcher in batchers.values()] == [1]
+    for (data, version), (status, headers, body) in zip(requests, responses):
+        assert status == 200
+        assert headers[b'x-model-version'] == str(version or 1).encode()
+        expected = client.post('/api/predict', json=data,
+                               headers={routes.MODEL_VERSION_HEADER: str(version or 1)}).get_json()
+        assert json.loads(body) == expected
+
+
+def test_explained_request(registry):
+    status, _, body = asyncio.run(post_predict(asgi.create_app(), SCENARIO, query=b'explain=true'))
+    assert status == 200
+    assert json.loads(body)['explanation']['contributions']
+
+
+def test_error_responses(registry, monkeypatch):
+    app = asgi.create_app()
+    status, _, body = asyncio.run(post_predict(app, SCENARIO, version=9))
+    assert status == 404 and json.loads(body)['available_versions'] == [1]
+    status, _, body = asyncio.run(post_predict(app, {**SCENARIO, 'speed_limit': 55}))
+    assert status == 400 and 'speed_limit' in json.loads(body)['details']
+    assert asyncio.run(post_predict(app, {}))[0] == 400
+    assert asyncio.run(call(app, 'GET', '/api/unknown'))[0] == 404
+
+    monkeypatch.setattr(registry, 'snapshot', RegistrySnapshot(None, {}))
+    status, _, body = asyncio.run(post_predict(app, SCENARIO))
+    assert status == 500 and 'not loaded' in json.loads(body)['error']
+
+
+def test_cors_preflight_and_health(registry):
+    app = asgi.create_app()
+    status, headers, _ = asyncio.run(call(app, 'OPTIONS', '/api/predict'))
+    assert status == 200
+    assert b'x-model-version' in headers[b'access-control-allow-headers']
+    assert headers[b'access-control-allow-origin'] == b'*'
+    assert asyncio.run(call(app, 'GET', '/health'))[2] == asgi.dumps({"status": "healthy"})
@@ -0,0 +1,102 @@
+"""
+Tests for offline bulk scoring
+
+score_file must give the same rows, in input order, whatever the chunk
+size and worker count, label them by the documented threshold rule, and
+leave no partial output behind when scoring fails.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import bulk_scoring
+from api.model_store import load_artifact
+from synthetic_data import write_accident_data
+
+CALIBRATION = {'method': 'platt', 'x': [0.0, 0.5, 1.0], 'y': [0.05, 0.3, 0.95], 'threshold': 0.4}
+
+
+@pytest.fixture
+def records(tmp_path):
+    path = str(tmp_path / 'records.csv')
+    write_accident_data(path, 2500, seed=4)
+    return path
+
+
+def reference_scores(model_path, records_path):
+    """(raw, probability) of every record scored in one call"""
+    artifact = load_artifact(model_path)
+    frame = pd.read_csv(records_path, usecols=bulk_scoring.SCORING_COLS, dtype={
+        col: dtype for col, dtype in bulk_scoring.CSV_DTYPES.items() if col in bulk_scoring.SCORING_COLS})
+    raw = artifact['model'].predict_proba(artifact['feature_pipeline'].transform(frame))[:, 1]
+    calibrator = artifact['calibrator']
+    return raw, raw if calibrator is None else calibrator.transform(raw)
+
+
+@pytest.mark.parametrize('workers, chunksize', [(0, 700), (2, 300)])
+def test_chunks_and_workers_preserve_order(tmp_path, write_artifact, records, workers, chunksize):
+    model_path = write_artifact(tmp_path, 'best_model')
+    output = str(tmp_path / 'scores.csv')
+    summary = bulk_scoring.score_file(records, output, model_path, workers=workers, chunksize=chunksize,
+                                      keep=['time'])
+    scored = pd.read_csv(output)
+    raw, _ = reference_scores(model_path, records)
+    assert list(scored.columns) == ['time'] + bulk_scoring.OUTPUT_COLS
+    assert list(scored['time']) == list(pd.read_csv(records)['time'])
+    np.testing.assert_allclose(scored['raw_probability'], raw, atol=1e-5)
+    assert summary['rows'] == len(raw) == 2500
+    assert summary['high_risk_rows'] == int((scored['risk_level'] == 'High Risk').sum())
+
+
+@pytest.mark.parametrize('calibration, threshold', [(None, bulk_scoring.DEFAULT_THRESHOLD),
+                                                    (CALIBRATION, CALIBRATION['threshold'])])
+def test_risk_level_rule(tmp_path, write_artifact, records, calibration, threshold):
+    # Uncalibrated: raw probability > 0.5 (model.predict's rule), not the API's blended 0.70 cut-off
+    model_path = write_artifact(tmp_path, 'best_model', calibration=calibration)
+    output = str(tmp_path / 'scores.csv')
+    bulk_scoring.score_file(records, output, model_path, workers=0)
+    scored = pd.read_csv(output)
+    _, probability = reference_scores(model_path, records)
+    np.testing.assert_allclose(scored['probability'], probability, atol=1e-5)
+    expected = np.where(probability > threshold, 'High Risk', 'Not High Risk')
+    # Written with 6 decimals; skip rows that sit on the threshold
+    clear = np.abs(probability - threshold) > 1e-5
+    assert (scored['risk_level'].to_numpy()[clear] == expected[clear]).all()
+
+
+def test_explain_columns_sum_to_the_margin(tmp_path, write_artifact, records):
+    model_path = write_artifact(tmp_path, 'best_model')
+    output = str(tmp_path / 'scores.csv')
+    bulk_scoring.score_file(records, output, model_path, workers=0, explain=True)
+    scored = pd.read_csv(output)
+    contributions = scored[[col for col in scored.columns if col.startswith('contribution_')]]
+    raw = scored['raw_probability'].clip(1e-6, 1 - 1e-6)
+    np.testing.assert_allclose(contributions.sum(axis=1), np.log(raw / (1 - raw)), atol=1e-3)
+
+
+def test_failure_leaves_no_partial_output(tmp_path, write_artifact, records, monkeypatch):
+    model_path = write_artifact(tmp_path, 'best_model')
+    output = tmp_path / 'scores.csv'
+    calls = []
+
+    def failing_score(self, chunk):
+        calls.append(len(chunk))
+        if len(calls) == 3:
+            raise RuntimeError("scoring failed")
+        return original(self, chunk)
+
+    original = bulk_scoring.Scorer.score
+    monkeypatch.setattr(bulk_scoring.Scorer, 'score', failing_score)
+    with pytest.raises(RuntimeError):
+        bulk_scoring.score_file(records, str(output), model_path, workers=0, chunksize=500)
+    assert not output.exists()
+    assert not (tmp_path / 'scores.csv.tmp').exists()
+
+
+def test_empty_input_writes_the_header(tmp_path, write_artifact, records):
+    model_path = write_artifact(tmp_path, 'best_model')
+    empty = tmp_path / 'empty.csv'
+    empty.write_text(open(records).readline())
+    output = tmp_path / 'scores.csv'
+    assert bulk_scoring.score_file(str(empty), str(output), model_path, workers=0)['rows'] == 0
+    assert list(pd.read_csv(output).columns) == bulk_scoring.OUTPUT_COLS
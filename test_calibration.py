@@ -0,0 +1,93 @@
+"""
+Tests for the probability calibration stored in model artifacts
+
+The knots must be monotone and np.interp over them must reproduce the
+fitted isotonic or Platt model; the fitted threshold is the one serving
+classifies with.
+"""
+import numpy as np
+import pytest
+from sklearn.isotonic import IsotonicRegression
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import f1_score
+
+from api import routes
+from api.model_registry import ServedModel
+from api.model_store import load_artifact
+from calibration import ProbabilityCalibrator, _logit, fit_calibration, fit_isotonic, fit_platt
+
+
+@pytest.fixture(scope='module')
+def holdout():
+    """Raw probabilities that overstate the positive rate, and labels drawn from the true rate"""
+    rng = np.random.default_rng(3)
+    raw = rng.beta(2, 2, 4000)
+    return raw, (rng.random(len(raw)) < raw ** 2).astype(int)
+
+
+def assert_monotone(calibrator):
+    assert np.all(np.diff(calibrator.x) > 0)
+    assert np.all(np.diff(calibrator.y) >= 0)
+    assert calibrator.y.min() >= 0 and calibrator.y.max() <= 1
+
+
+def test_isotonic_knots_reproduce_isotonic_regression(holdout):
+    raw, y = holdout
+    calibrator = fit_isotonic(raw, y)
+    assert_monotone(calibrator)
+    isotonic = IsotonicRegression(y_min=0, y_max=1, out_of_bounds='clip').fit(raw, y)
+    probe = np.concatenate([np.linspace(0, 1, 501), raw[:500]])
+    np.testing.assert_allclose(calibrator.transform(probe), isotonic.predict(probe), atol=1e-12)
+
+
+def test_platt_knots_reproduce_logistic_fit(holdout):
+    raw, y = holdout
+    calibrator = fit_platt(raw, y)
+    assert_monotone(calibrator)
+    logistic = LogisticRegression(C=1e6).fit(_logit(raw)[:, np.newaxis], y)
+    probe = np.linspace(0.01, 0.99, 500)
+    expected = logistic.predict_proba(_logit(probe)[:, np.newaxis])[:, 1]
+    # Linear interpolation between 129 knots on the logit scale
+    np.testing.assert_allclose(calibrator.transform(probe), expected, atol=2e-3)
+
+
+def test_fit_calibration_picks_lowest_brier_and_f1_threshold(holdout):
+    raw, y = holdout
+    calibrator = fit_calibration(raw, y)
+    assert set(calibrator.scores) == {'uncalibrated', 'isotonic', 'platt'}
+    assert calibrator.method == min(('isotonic', 'platt'), key=calibrator.scores.get)
+    assert calibrator.scores[calibrator.method] < calibrator.scores['uncalibrated']
+    assert_monotone(calibrator)
+
+    calibrated = calibrator.transform(raw)
+    best = f1_score(y, calibrated > calibrator.threshold)
+    for cut in np.quantile(calibrated, np.linspace(0, 1, 201)):
+        assert f1_score(y, calibrated > cut) <= best + 1e-12
+
+
+def test_knots_must_be_increasing():
+    with pytest.raises(ValueError, match='strictly increasing'):
+        ProbabilityCalibrator([0.0, 0.5, 0.5], [0.1, 0.2, 0.3], 'isotonic')
+    with pytest.raises(ValueError, match='two knots'):
+        ProbabilityCalibrator([0.5], [0.2], 'isotonic')
+
+
+def test_served_model_classifies_with_fitted_threshold(tmp_path, write_artifact, holdout):
+    raw, y = holdout
+    calibrator = fit_calibration(raw, y)
+    path = write_artifact(tmp_path, 'best_model', calibration=calibrator.to_dict())
+    served = ServedModel(path, load_artifact(path), routes.RISK_THRESHOLDS['high'])
+    assert served.high_risk_threshold == calibrator.threshold
+    np.testing.assert_array_equal(served.calibrator.x, calibrator.x)
+
+    records = [dict(zip(routes.GRID_OPTIONS, values)) for values in [
+        (6, 'Rain', 60, 'Night', 'Crossroads'), (1, 'Fine', 20, 'Morning', 'Not at junction')]]
+    raw_probabilities, _, final = routes.score_batch(records, served=served)
+    np.testing.assert_allclose(final, calibrator.transform(raw_probabilities))
+    predictions = routes.build_predictions(records, final, raw_probabilities, served=served)
+    for probability, prediction in zip(final, predictions):
+        assert (prediction['risk_level'] == 'High Risk') == (probability > calibrator.threshold)
+
+    # Without a fitted threshold the API default applies
+    path = write_artifact(tmp_path, 'uncut', calibration={**calibrator.to_dict(), 'threshold': None})
+    assert ServedModel(path, load_artifact(path), 0.7).high_risk_threshold == 0.7
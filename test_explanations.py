@@ -0,0 +1,113 @@
+"""
+Tests for ?explain=true on /api/predict and /api/predict/batch
+
+A scenario's contributions plus the bias must sum to the margin (log-odds)
+of the model version that served it, and match XGBoost's pred_contribs;
+the grid's contributions are computed at load unless EXPLAIN_WARMUP is off.
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+import xgboost as xgb
+
+from api import routes
+from api.explanations import TOP_CONTRIBUTIONS
+from api.model_registry import ServedModel
+from api.model_store import load_artifact
+from api.prediction_table import grid_records
+from conftest import ROOT
+from fingerprints import file_fingerprint
+
+GRID = grid_records(routes.GRID_OPTIONS)
+RECORDS = GRID[::151]
+
+
+@pytest.fixture
+def versions(registry, tmp_path, write_artifact):
+    """Registry serving the shipped model by default and, as version 2, one with another base score"""
+    path = write_artifact(str(tmp_path / 'models'), 'best_model_v002', version=2)
+    booster_path = os.path.join(os.path.dirname(path), 'best_model_v002.xgb.json')
+    with open(booster_path) as f:
+        booster = json.load(f)
+    booster['learner']['learner_model_param']['base_score'] = '[3E-1]'
+    with open(booster_path, 'w') as f:
+        json.dump(booster, f)
+    with open(path) as f:
+        meta = json.load(f)
+    meta['booster_sha256'] = file_fingerprint(booster_path)
+    with open(path, 'w') as f:
+        json.dump(meta, f)
+    registry.refresh()
+    assert sorted(registry.snapshot.versions) == [1, 2]
+    return registry
+
+
+def margins(served, records):
+    raw = served.model.predict_proba(routes.preprocess_batch(records, served))[:, 1].astype(np.float64)
+    return np.log(raw / (1 - raw))
+
+
+def assert_explains(explanation, served, record, margin):
+    row = served.explainer.contributions[routes.grid_cells(routes.option_index_arrays([record]))[0]]
+    assert row.sum() == pytest.approx(margin, abs=1e-4)
+    assert explanation['base_value'] == pytest.approx(row[-1], abs=1e-6)
+    top = np.argsort(-np.abs(row[:-1]), kind='stable')[:TOP_CONTRIBUTIONS]
+    assert [item['feature'] for item in explanation['contributions']] == [served.explainer.group_names[i] for i in top]
+    assert [item['value'] for item in explanation['contributions']] == pytest.approx(row[top], abs=1e-6)
+
+
+@pytest.mark.parametrize('version', [None, '2'])
+def test_predict_explanation_sums_to_served_margin(client, versions, version):
+    served = versions.resolve(version)
+    headers = {routes.MODEL_VERSION_HEADER: version} if version else {}
+    for record, margin in zip(RECORDS, margins(served, RECORDS)):
+        response = client.post('/api/predict?explain=true', json=record, headers=headers)
+        assert response.headers[routes.MODEL_VERSION_HEADER] == str(served.version)
+        assert_explains(response.get_json()['explanation'], served, record, margin)
+    assert 'explanation' not in client.post('/api/predict', json=RECORDS[0], headers=headers).get_json()
+
+
+@pytest.mark.parametrize('version', [None, '2'])
+def test_batch_explanation_sums_to_served_margin(client, versions, version):
+    served = versions.resolve(version)
+    query = '?explain=true' + (f'&model_version={version}' if version else '')
+    results = client.post('/api/predict/batch' + query, json=RECORDS).get_json()['results']
+    for record, margin, result in zip(RECORDS, margins(served, RECORDS), results):
+        assert_explains(result['explanation'], served, record, margin)
+
+
+def test_versions_explain_with_their_own_bias(versions):
+    first, second = versions.resolve('1'), versions.resolve('2')
+    shift = np.log(0.3 / 0.7) - np.log(0.5 / 0.5)
+    np.testing.assert_allclose(second.explainer.contributions[:, -1] - first.explainer.contributions[:, -1], shift,
+                               atol=1e-6)
+    np.testing.assert_allclose(second.explainer.contributions[:, :-1], first.explainer.contributions[:, :-1])
+
+
+def test_grid_contributions_match_xgboost(registry):
+    served = registry.resolve(None)
+    booster = xgb.Booster(model_file=os.path.join(ROOT, 'best_model.xgb.json'))
+    X = routes.preprocess_batch(GRID, served)
+    phi = booster.predict(xgb.DMatrix(X), pred_contribs=True)
+    grouped = np.column_stack([phi[:, :-1] @ served.explainer._groups, phi[:, -1]])
+    np.testing.assert_allclose(served.explainer.contributions, grouped, atol=1e-4)
+
+
+@pytest.mark.parametrize('warmup', [True, False])
+def test_explain_warmup(tmp_path, write_artifact, monkeypatch, warmup):
+    monkeypatch.setattr(routes, 'EXPLAIN_WARMUP', warmup)
+    monkeypatch.setattr(routes, 'grid_cache_dir', str(tmp_path / 'grid_cache'))
+    path = write_artifact(tmp_path, 'best_model')
+    served = ServedModel(path, load_artifact(path), routes.RISK_THRESHOLDS['high'])
+    routes.prepare_model(served)
+    assert (served.explainer._contributions is not None) == warmup
+    routes.explain_predictions(routes.option_index_arrays(RECORDS), served)
+    assert served.explainer._contributions is not None
+
+
+@pytest.mark.skipif('EXPLAIN_WARMUP' in os.environ, reason="EXPLAIN_WARMUP is set in the environment")
+def test_explain_warmup_is_on_by_default():
+    assert routes.EXPLAIN_WARMUP
+    assert routes.registry.resolve(None).explainer._contributions is not None
@@ -0,0 +1,63 @@
+"""
+Tests for the sparse (CSR) feature path
+
+A pipeline marked with use_sparse_one_hot() must give the model the same
+inputs whether rows are encoded densely or as CSR, and the native
+TreeEnsemble must reproduce the xgboost model trained on them.
+"""
+import json
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+import xgboost as xgb
+
+from api.model_store import TreeEnsemble
+from api.prediction_table import grid_records
+from features import FeaturePipeline
+from synthetic_data import generate_accident_data
+
+SCENARIOS = grid_records({
+    'road_type': [1, 2, 3, 6],
+    'weather_conditions': ['Fine', 'Rain', 'Snow', 'Fog'],
+    'speed_limit': [20, 40, 70],
+    'time_of_day': ['Morning', 'Night'],
+    'junction_detail': ['T Junction', 'Not at junction'],
+})
+
+
+@pytest.fixture(scope='module')
+def sparse_training():
+    """Pipeline, dense and CSR encodings of the same rows, and a model trained on the CSR matrix"""
+    df = generate_accident_data(3000, seed=1)
+    pipeline = FeaturePipeline().fit(df).use_sparse_one_hot()
+    X_dense, X_sparse = pipeline.transform(df), pipeline.transform_sparse(df)
+    y = (df['risk_level'] == 'High').astype(int).to_numpy()
+    model = xgb.XGBClassifier(n_estimators=20, max_depth=4, tree_method='hist', random_state=0)
+    model.fit(X_sparse, y)
+    return pipeline, X_dense, X_sparse, model
+
+
+def test_sparse_and_dense_encodings_agree(sparse_training):
+    pipeline, X_dense, X_sparse, _ = sparse_training
+    assert sp.isspmatrix_csr(X_sparse)
+    np.testing.assert_array_equal(pipeline.to_dense(X_sparse), X_dense)
+    np.testing.assert_array_equal(pipeline.to_sparse(X_dense).toarray(), X_sparse.toarray())
+
+
+def test_sparse_and_dense_encodings_predict_the_same(sparse_training):
+    _, X_dense, X_sparse, model = sparse_training
+    np.testing.assert_allclose(model.predict_proba(X_dense), model.predict_proba(X_sparse), atol=1e-6)
+
+
+def test_native_model_matches_xgboost_on_sparse_pipeline(sparse_training):
+    pipeline, X_dense, _, model = sparse_training
+    ensemble = TreeEnsemble.from_json(json.loads(model.get_booster().save_raw('json')))
+    np.testing.assert_allclose(ensemble.predict_proba(X_dense), model.predict_proba(X_dense), atol=1e-5)
+
+    # API scenarios go through transform_scenarios and the native model
+    X_scenarios = pipeline.transform_scenarios(SCENARIOS)
+    np.testing.assert_allclose(ensemble.predict_proba(X_scenarios)[:, 1],
+                               model.predict_proba(pipeline.to_sparse(X_scenarios))[:, 1], atol=1e-5)
+    contributions = model.get_booster().predict(xgb.DMatrix(X_scenarios), pred_contribs=True)
+    np.testing.assert_allclose(ensemble.predict_contributions(X_scenarios), contributions, atol=1e-4)
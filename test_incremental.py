@@ -0,0 +1,149 @@
+"""
+Tests for incremental retraining
+
+An update must keep the parent's trees and add --trees more, refit the
+calibration on the new batch's holdout, record its lineage, reuse cached
+batch encodings and never overwrite an existing version.
+"""
+import os
+
+import joblib
+import numpy as np
+import pytest
+import xgboost as xgb
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import LabelEncoder
+
+from calibration import fit_calibration
+from data_loader import prepare_encoded_batch
+from features import FeaturePipeline
+from fingerprints import file_fingerprint
+from incremental import HOLDOUT_SIZE, inherited_params, next_version, update_model
+from synthetic_data import generate_accident_data, write_accident_data
+
+PARENT_TREES = 8
+
+
+@pytest.fixture(scope='module')
+def batches(tmp_path_factory):
+    """A calibrated parent artifact, an uncalibrated one and three batch CSVs"""
+    directory = tmp_path_factory.mktemp('incremental')
+    df = generate_accident_data(3000, seed=7)
+    pipeline = FeaturePipeline().fit(df)
+    label_encoder = LabelEncoder().fit(df['risk_level'])
+    X = pipeline.transform(df)
+    y = (df['risk_level'] == 'High').astype(int).to_numpy()
+    model = xgb.XGBClassifier(n_estimators=PARENT_TREES, max_depth=3, learning_rate=0.3, random_state=0)
+    model.fit(X, y)
+    artifacts = {'model': model, 'feature_pipeline': pipeline, 'label_encoder': label_encoder,
+                 'feature_names': pipeline.feature_names}
+    paths = {'parent': str(directory / 'best_model.joblib'), 'uncalibrated': str(directory / 'uncalibrated.joblib')}
+    calibration = fit_calibration(model.predict_proba(X)[:, 1], y).to_dict()
+    joblib.dump({**artifacts, 'calibration': calibration}, paths['parent'])
+    joblib.dump(artifacts, paths['uncalibrated'])
+    for name, seed in [('batch', 11), ('older', 12), ('oldest', 13)]:
+        paths[name] = str(directory / f'{name}.csv')
+        write_accident_data(paths[name], 1500, seed=seed)
+    return paths
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run in tmp_path, so encoded batches are cached under tmp_path/.cache"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def holdout(artifacts, data_path):
+    """The new batch's holdout rows, split as update_model splits them"""
+    label_encoder = artifacts['label_encoder']
+    X, y = prepare_encoded_batch(data_path, artifacts['feature_pipeline'], label_encoder)
+    y = (np.asarray(y) == label_encoder.transform(['High'])[0]).astype(int)
+    _, holdout_idx = train_test_split(np.arange(len(y)), test_size=HOLDOUT_SIZE, stratify=y, random_state=42)
+    return X[holdout_idx], y[holdout_idx]
+
+
+def test_append_update_keeps_parent_trees(batches):
+    parent = joblib.load(batches['parent'])
+    output_path, summary = update_model(batches['parent'], batches['batch'], n_trees=5, output_dir='models')
+    artifact = joblib.load(output_path)
+    booster = artifact['model'].get_booster()
+
+    assert output_path == os.path.join('models', 'best_model_v002.joblib')
+    assert summary['total_trees'] == booster.num_boosted_rounds() == PARENT_TREES + summary['trees_added']
+    assert summary['trees_added'] == 5
+    assert booster.get_dump()[:PARENT_TREES] == parent['model'].get_booster().get_dump()
+    # The new trees are fitted with the parent's hyperparameters
+    assert summary['params'].keys() == inherited_params(parent['model']).keys()
+    assert summary['params']['max_depth'] == artifact['model'].get_params()['max_depth'] == 3
+    assert summary['params']['learning_rate'] == artifact['model'].get_params()['learning_rate'] == 0.3
+    assert artifact['feature_pipeline'].to_dict() == parent['feature_pipeline'].to_dict()
+
+    assert artifact['version'] == summary['version'] == 2
+    assert artifact['parent'] == {'path': 'best_model.joblib', 'sha256': file_fingerprint(batches['parent']),
+                                  'version': 1}
+    assert [(entry['version'], entry['data']) for entry in artifact['training_history']] == [(2, summary['data'])]
+    assert summary['mode'] == 'append'
+    assert summary['data'] == [{'path': 'batch.csv', 'sha256': file_fingerprint(batches['batch'])}]
+    assert summary['train_rows'] + summary['holdout_rows'] == 1500
+
+
+def test_update_refits_calibration_on_holdout(batches):
+    output_path, _ = update_model(batches['parent'], batches['batch'], n_trees=5, output_dir='models',
+                                  rebalance_strategy='reweight')
+    artifact = joblib.load(output_path)
+    X_holdout, y_holdout = holdout(artifact, batches['batch'])
+    expected = fit_calibration(artifact['model'].predict_proba(X_holdout)[:, 1], y_holdout).to_dict()
+    assert artifact['calibration'] == expected
+    assert artifact['calibration'] != joblib.load(batches['parent'])['calibration']
+
+    output_path, _ = update_model(batches['uncalibrated'], batches['batch'], n_trees=2, output_dir='models',
+                                  rebalance_strategy='reweight')
+    assert joblib.load(output_path)['calibration'] is None
+
+
+def test_window_update_trains_on_history_and_reuses_cached_batches(batches, capsys):
+    history = [batches['older'], batches['oldest']]
+    _, summary = update_model(batches['parent'], batches['batch'], 'window', history, n_trees=3,
+                              output_dir='models', rebalance_strategy='reweight')
+    assert summary['mode'] == 'window'
+    assert summary['train_rows'] == 1500 - summary['holdout_rows'] + 3000
+    assert [source['path'] for source in summary['data']] == ['batch.csv', 'older.csv', 'oldest.csv']
+    assert capsys.readouterr().out.count('Encoding ') == 3
+
+    _, repeated = update_model(batches['parent'], batches['batch'], 'window', history, n_trees=3,
+                               output_dir='models', rebalance_strategy='reweight')
+    output = capsys.readouterr().out
+    assert 'Encoding ' not in output and output.count('Using cached encoding') == 3
+    assert repeated['train_rows'] == summary['train_rows']
+
+
+def test_repeated_updates_never_overwrite_versions(batches, workdir):
+    first, _ = update_model(batches['parent'], batches['batch'], n_trees=2, output_dir='models',
+                            rebalance_strategy='reweight')
+    fingerprint = file_fingerprint(first)
+    second, summary = update_model(batches['parent'], batches['batch'], n_trees=2, output_dir='models',
+                                   rebalance_strategy='reweight')
+    assert (first, second) == (os.path.join('models', 'best_model_v002.joblib'),
+                               os.path.join('models', 'best_model_v003.joblib'))
+    assert file_fingerprint(first) == fingerprint
+    assert summary['version'] == joblib.load(second)['version'] == 3
+    assert joblib.load(second)['parent']['version'] == 1
+
+    # Updating an update continues the lineage after every existing version, native exports included
+    (workdir / 'models' / 'best_model_v005.meta.json').write_text('{}')
+    third, _ = update_model(second, batches['older'], n_trees=2, output_dir='models', rebalance_strategy='reweight')
+    artifact = joblib.load(third)
+    assert third == os.path.join('models', 'best_model_v006.joblib')
+    assert artifact['parent']['version'] == 3
+    assert [entry['version'] for entry in artifact['training_history']] == [3, 6]
+    assert artifact['model'].get_booster().num_boosted_rounds() == PARENT_TREES + 4
+
+
+def test_next_version(workdir):
+    (workdir / 'models').mkdir()
+    assert next_version('models', 1) == 2
+    for name in ['best_model_v004.joblib', 'best_model_v007.meta.json', 'best_model_v009.xgb.json', 'other_v012.joblib']:
+        (workdir / 'models' / name).write_text('')
+    assert next_version('models', 1) == 8
+    assert next_version('models', 10) == 11
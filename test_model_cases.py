@@ -1,9 +1,12 @@
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
 import joblib
-import matplotlib.pyplot as plt
-import seaborn as sns
+from features import load_feature_pipeline, WEATHER_CODES, JUNCTION_CODES
+from reporting import build_reports, save_results
+
+# Dataset codes for the readable labels used in the test cases
+LIGHT_LABEL_CODES = {'Daylight': 1, 'Dawn': 1, 'Dusk': 4, 'Darkness': 4}
+SURFACE_LABEL_CODES = {'Dry': 1, 'Wet': 2, 'Snow': 3}
 
 def create_test_cases():
     # Create comprehensive test cases based on user story requirements
@@ -37,29 +40,20 @@ def create_test_cases():
 def load_and_prepare_model():
     print("Loading pre-trained model...")
     model_artifacts = joblib.load('best_model.joblib')
-    return model_artifacts['model'], model_artifacts['feature_names']
+    return model_artifacts['model'], load_feature_pipeline(model_artifacts)
 
-def prepare_features(df, feature_names):
+def prepare_features(df, feature_pipeline):
     print("\nPreparing features...")
-    # Categorical columns
-    cat_cols = ['weather_conditions', 'day_of_week', 'light_conditions', 
-                'road_surface_conditions', 'junction_detail']
-    
-    # Create dummy variables
-    df_encoded = pd.get_dummies(df, columns=cat_cols)
-    
-    # Ensure all expected feature columns are present
-    for col in feature_names:
-        if col not in df_encoded.columns:
-            df_encoded[col] = 0
-    
-    # Numeric columns to scale
-    num_cols = ['speed_limit', 'number_of_vehicles', 'number_of_casualties']
-    scaler = StandardScaler()
-    df_encoded[num_cols] = scaler.fit_transform(df_encoded[num_cols])
+    # Map readable labels to the dataset codes the model was trained on
+    df = df.assign(
+        weather_conditions=df['weather_conditions'].map(WEATHER_CODES),
+        light_conditions=df['light_conditions'].map(LIGHT_LABEL_CODES),
+        road_surface_conditions=df['road_surface_conditions'].map(SURFACE_LABEL_CODES),
+        junction_detail=df['junction_detail'].map(JUNCTION_CODES),
+    )
     
-    # Select only the features used by the model
-    return df_encoded[feature_names]
+    # Same feature engineering, encoding and training-set scaling as training
+    return feature_pipeline.transform(df)
 
 def create_risk_heatmap(predictions, test_cases):
     print("\nGenerating risk heatmap...")
@@ -76,23 +70,23 @@ def create_risk_heatmap(predictions, test_cases):
                                index='Road_Type', columns='Weather', 
                                aggfunc='mean')
     
-    # Create heatmap
-    plt.figure(figsize=(10, 6))
-    sns.heatmap(pivot_table, annot=True, cmap='RdYlGn_r', fmt='.2f')
-    plt.title('Accident Risk Heatmap by Road Type and Weather')
-    plt.tight_layout()
-    plt.savefig('risk_heatmap.png')
-    plt.close()
+    # Save the heatmap data and render it (skipped when unchanged); see reporting.py
+    save_results('risk_heatmap', {'risk_heatmap': {
+        'index': pivot_table.index.to_numpy(),
+        'columns': pivot_table.columns.to_numpy(),
+        'values': pivot_table.to_numpy(),
+    }})
+    build_reports(only=['risk_heatmap.png'])
 
 def main():
     # Create test cases
     test_cases = create_test_cases()
     
     # Load and prepare model
-    model, feature_names = load_and_prepare_model()
+    model, feature_pipeline = load_and_prepare_model()
     
     # Prepare features
-    features = prepare_features(test_cases, feature_names)
+    features = prepare_features(test_cases, feature_pipeline)
     
     # Make predictions
     print("\nMaking predictions...")
@@ -0,0 +1,106 @@
+"""
+Tests for the versioned model registry and model preparation
+
+The registry must serve pinned versions, reject artifacts that break the
+API's contract and keep the previous default when a swap fails. Prepared
+grids and explanations are cached, so another process loading the same
+version does not score or explain the grid again.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from api import explanations, routes
+from api.model_registry import ServedModel
+from api.model_store import load_artifact
+
+SCENARIO = {'road_type': 6, 'weather_conditions': 'Rain', 'speed_limit': 60,
+            'time_of_day': 'Night', 'junction_detail': 'Crossroads'}
+CALIBRATION = {'method': 'platt', 'x': [0.0, 0.5, 1.0], 'y': [0.05, 0.3, 0.95], 'threshold': 0.4}
+
+
+def test_registry_pins_versions(registry, client, tmp_path, write_artifact):
+    write_artifact(str(tmp_path / 'models'), 'best_model_v002', version=2)
+    assert registry.refresh()
+    assert registry.resolve().version == 1
+    assert registry.resolve('v002').version == 2
+    with pytest.raises(KeyError):
+        registry.resolve('v9')
+
+    pinned = client.post('/api/predict', json=SCENARIO, headers={routes.MODEL_VERSION_HEADER: '2'})
+    assert pinned.headers[routes.MODEL_VERSION_HEADER] == '2'
+    unknown = client.post('/api/predict?model_version=9', json=SCENARIO)
+    assert unknown.status_code == 404
+    assert unknown.get_json()['available_versions'] == [1, 2]
+
+
+def test_registry_rejects_invalid_artifacts(registry, tmp_path, write_artifact):
+    path = write_artifact(str(tmp_path / 'models'), 'best_model_v003', version=3, label_classes=['Low', 'High'])
+    assert not registry.refresh()
+    assert 3 not in registry.snapshot.versions
+    assert 'label class 0' in registry.errors[path][1]
+
+
+def test_registry_keeps_previous_default_when_swap_fails(registry, tmp_path, write_artifact):
+    served = registry.resolve()
+    write_artifact(tmp_path, 'best_model', booster_sha256='0')
+    assert not registry.refresh()
+    assert registry.resolve() is served
+    assert registry.describe()['rejected']
+
+
+@pytest.fixture
+def prepared(tmp_path, write_artifact, monkeypatch):
+    """prepare(**meta_changes): a freshly loaded and prepared copy of the shipped artifact"""
+    monkeypatch.setattr(routes, 'EXPLAIN_WARMUP', True)
+    monkeypatch.setattr(routes, 'grid_cache_dir', str(tmp_path / 'grid_cache'))
+
+    def prepare(**meta_changes):
+        path = write_artifact(tmp_path, 'best_model', **meta_changes)
+        served = ServedModel(path, load_artifact(path), routes.RISK_THRESHOLDS['high'])
+        routes.prepare_model(served)
+        return served
+    return prepare
+
+
+def test_prepared_grid_is_cached_for_other_processes(prepared, monkeypatch):
+    first = prepared()
+    assert os.path.exists(routes.grid_cache_path(first))
+
+    # A second process loading the same version scores no grid and computes no explanations
+    rows = []
+    original = ServedModel.__init__
+
+    def spy(self, *args):
+        original(self, *args)
+        predict_proba = self.model.predict_proba
+        self.model.predict_proba = lambda X: rows.append(len(X)) or predict_proba(X)
+
+    def fail(*_):
+        raise AssertionError("contributions recomputed")
+
+    monkeypatch.setattr(ServedModel, '__init__', spy)
+    monkeypatch.setattr(explanations, 'model_contributions', fail)
+    second = prepared()
+    assert rows == [1]
+    for value in ('raw', 'final'):
+        np.testing.assert_allclose(second.grid_probabilities[value], first.grid_probabilities[value])
+    np.testing.assert_array_equal(second.explainer.contributions, first.explainer.contributions)
+
+
+def test_grid_cache_is_keyed_by_postprocessing(prepared):
+    plain = prepared()
+    calibrated = prepared(calibration=CALIBRATION)
+    assert routes.grid_cache_path(calibrated) != routes.grid_cache_path(plain)
+    np.testing.assert_allclose(calibrated.grid_probabilities['raw'], plain.grid_probabilities['raw'])
+    assert not np.allclose(calibrated.grid_probabilities['final'], plain.grid_probabilities['final'])
+
+
+def test_unreadable_grid_cache_is_rebuilt(prepared):
+    served = prepared()
+    with open(routes.grid_cache_path(served), 'wb') as f:
+        f.write(b'not an npz file')
+    rebuilt = prepared()
+    np.testing.assert_allclose(rebuilt.grid_probabilities['final'], served.grid_probabilities['final'])
+    assert set(routes.load_grid_cache(rebuilt)) == {'raw', 'final', 'contributions'}
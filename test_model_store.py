@@ -0,0 +1,36 @@
+"""
+Tests for the native model artifact
+
+TreeEnsemble, the numpy evaluator the API serves, must reproduce the
+xgboost model best_model.meta.json was exported from.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from api import routes
+from api.model_store import default_model_path, load_artifact
+from api.prediction_table import grid_records
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+GRID = grid_records(routes.GRID_OPTIONS)
+
+
+def test_native_model_matches_xgboost():
+    native = load_artifact(os.path.join(ROOT, 'best_model.meta.json'))
+    reference = load_artifact(os.path.join(ROOT, 'best_model.joblib'))
+    X = native['feature_pipeline'].transform_scenarios(GRID)
+    np.testing.assert_allclose(native['model'].predict_proba(X), reference['model'].predict_proba(X), atol=1e-5)
+    assert native['label_classes'] == reference['label_classes']
+
+
+def test_default_path_prefers_native_export(tmp_path, write_artifact):
+    path = write_artifact(tmp_path, 'best_model')
+    assert default_model_path(str(tmp_path)) == path
+
+
+def test_changed_booster_is_rejected(tmp_path, write_artifact):
+    path = write_artifact(tmp_path, 'best_model', booster_sha256='0')
+    with pytest.raises(ValueError, match='does not match'):
+        load_artifact(path)
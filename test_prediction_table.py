@@ -0,0 +1,57 @@
+"""
+Tests for the precomputed prediction table (table mode)
+
+Every cell must hold what the live scoring path returns, and a saved table
+must be rebuilt when the model or its post-processing changes.
+"""
+from api import routes
+from api.model_registry import ServedModel
+from api.model_store import load_artifact
+from api.prediction_table import PredictionTable, grid_records
+
+GRID = grid_records(routes.GRID_OPTIONS)
+
+
+def served_model(tmp_path, write_artifact, **meta_changes):
+    path = write_artifact(tmp_path, 'best_model', **meta_changes)
+    return ServedModel(path, load_artifact(path), routes.RISK_THRESHOLDS['high'])
+
+
+def test_table_matches_live_predictions(tmp_path, write_artifact):
+    served = served_model(tmp_path, write_artifact)
+    table = routes.build_prediction_table(served)
+    assert len(table) == len(GRID)
+    _, predictions = routes.predict_records(GRID, served)
+    assert all(table.lookup(data) == prediction for data, prediction in zip(GRID, predictions))
+
+
+def test_saved_table_round_trips(tmp_path, write_artifact):
+    served = served_model(tmp_path, write_artifact)
+    table_path = str(tmp_path / 'prediction_table.npz')
+    routes.build_prediction_table(served).save(table_path)
+    loaded = PredictionTable.load(table_path)
+    assert loaded.matches(routes.GRID_OPTIONS, routes.prediction_table_fingerprint(served))
+    assert loaded.is_consistent(lambda records: routes.predict_records(records, served))
+
+
+def test_table_rebuilds_when_postprocessing_changes(tmp_path, write_artifact):
+    served = served_model(tmp_path, write_artifact)
+    table_path = str(tmp_path / 'prediction_table.npz')
+    routes.build_prediction_table(served).save(table_path)
+    fingerprint = routes.prediction_table_fingerprint(served)
+
+    # Same model file, different threshold: the stored risk levels are stale
+    served.high_risk_threshold = 0.2
+    assert routes.prediction_table_fingerprint(served) != fingerprint
+    table = routes.load_prediction_table(served, table_path)
+    assert table.fingerprint == routes.prediction_table_fingerprint(served)
+    _, predictions = routes.predict_records(GRID, served)
+    assert all(table.lookup(data) == prediction for data, prediction in zip(GRID, predictions))
+    assert PredictionTable.load(table_path).fingerprint == table.fingerprint
+
+
+def test_stale_payloads_fail_the_consistency_check(tmp_path, write_artifact):
+    served = served_model(tmp_path, write_artifact)
+    table = routes.build_prediction_table(served)
+    table.high_risk = ~table.high_risk
+    assert not table.is_consistent(lambda records: routes.predict_records(records, served))
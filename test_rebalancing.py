@@ -0,0 +1,95 @@
+"""
+Tests for the class rebalancing strategies
+
+Every strategy must bring high-risk / other rows (or weights) to the
+sampling strategy; smote_nc rows must stay valid one-hot encodings and
+approx_smote rows must lie between minority rows.
+"""
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from features import FeaturePipeline
+from rebalancing import SAMPLING_STRATEGY, rebalance
+from synthetic_data import generate_accident_data
+
+
+@pytest.fixture(scope='module')
+def training():
+    """Fitted pipeline, encoded rows and a minority of roughly 15% high-risk labels"""
+    df = generate_accident_data(3000, seed=2)
+    pipeline = FeaturePipeline().fit(df)
+    X = pipeline.transform(df)
+    y = (np.random.default_rng(2).random(len(df)) < 0.15).astype(int)
+    return pipeline, X, y
+
+
+def one_hot_blocks(pipeline):
+    return [np.array(list(slots.values())) for slots in pipeline.encoder.one_hot.values()]
+
+
+@pytest.mark.parametrize('strategy', ['smote', 'smote_nc', 'approx_smote'])
+def test_oversampling_reaches_sampling_strategy(training, strategy):
+    pipeline, X, y = training
+    X_out, y_out, sample_weight = rebalance(X, y, strategy, feature_pipeline=pipeline)
+    n_majority = int((y == 0).sum())
+    assert sample_weight is None
+    assert X_out.shape == (len(y_out), X.shape[1])
+    assert int((y_out == 0).sum()) == n_majority
+    assert int((y_out == 1).sum()) == int(SAMPLING_STRATEGY * n_majority)
+    # The original rows come first, unchanged
+    np.testing.assert_array_equal(y_out[:len(y)], y)
+    np.testing.assert_allclose(np.asarray(X_out[:len(y)]), X, atol=1e-6)
+
+
+def test_smote_nc_rows_stay_on_the_one_hot_simplex(training):
+    pipeline, X, y = training
+    X_out, _, _ = rebalance(X, y, 'smote_nc', feature_pipeline=pipeline)
+    synthetic = X_out[len(y):]
+    for columns in one_hot_blocks(pipeline):
+        block = synthetic[:, columns]
+        assert set(np.unique(block)) <= {0.0, 1.0}
+        assert block.sum(axis=1).max() <= 1
+    numeric = synthetic[:, pipeline.numeric_indices]
+    minority = X[y == 1][:, pipeline.numeric_indices]
+    assert np.all(numeric >= minority.min(axis=0) - 1e-5) and np.all(numeric <= minority.max(axis=0) + 1e-5)
+
+
+def test_smote_nc_needs_the_pipeline(training):
+    _, X, y = training
+    with pytest.raises(ValueError, match='feature_pipeline'):
+        rebalance(X, y, 'smote_nc')
+
+
+def test_approx_smote_interpolates_minority_rows(training):
+    pipeline, X, y = training
+    X_out, y_out, _ = rebalance(X, y, 'approx_smote', feature_pipeline=pipeline)
+    synthetic, minority = X_out[len(y):], X[y == 1]
+    assert np.all(synthetic >= minority.min(axis=0) - 1e-5)
+    assert np.all(synthetic <= minority.max(axis=0) + 1e-5)
+
+    # CSR input gives the same rows as CSR
+    X_sparse, y_sparse, _ = rebalance(sp.csr_matrix(X), y, 'approx_smote', feature_pipeline=pipeline)
+    assert sp.issparse(X_sparse)
+    np.testing.assert_array_equal(y_sparse, y_out)
+    np.testing.assert_allclose(X_sparse.toarray(), X_out, atol=1e-6)
+
+
+def test_reweight_weights_minority_to_sampling_strategy(training):
+    _, X, y = training
+    X_out, y_out, sample_weight = rebalance(X, y, 'reweight')
+    assert X_out is X
+    np.testing.assert_array_equal(y_out, y)
+    assert np.all(sample_weight[y == 0] == 1)
+    assert np.unique(sample_weight[y == 1]).size == 1
+    assert sample_weight[y == 1].sum() / (y == 0).sum() == pytest.approx(SAMPLING_STRATEGY, rel=1e-5)
+
+    # A minority already above the target keeps unit weights
+    _, _, weights = rebalance(X, 1 - y, 'reweight')
+    assert np.all(weights == 1)
+
+
+def test_unknown_strategy(training):
+    _, X, y = training
+    with pytest.raises(ValueError, match='Unknown rebalancing strategy'):
+        rebalance(X, y, 'undersample')
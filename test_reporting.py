@@ -0,0 +1,90 @@
+"""
+Tests for the cached rendering of the report outputs
+
+build_reports must skip outputs whose inputs and render version are
+unchanged and whose file exists, and redraw exactly the outputs whose
+inputs changed.
+"""
+import os
+
+import pytest
+
+import reporting
+from reporting import OUTPUTS, build_reports, save_results
+
+CLASSIFICATION = {
+    'confusion_matrix': [[80, 20], [10, 40]],
+    'accuracy': 0.8,
+    'feature_names': [f'feature_{i}' for i in range(12)],
+    'feature_importance': [0.01 * i for i in range(12)],
+    'hourly_risk': {'hour': list(range(24)), 'risk_probability': [0.1 + 0.01 * h for h in range(24)]},
+}
+RISK_HEATMAP = {'risk_heatmap': {'index': [1, 2], 'columns': ['Fine', 'Rain'], 'values': [[0.2, 0.4], [0.3, None]]}}
+
+
+@pytest.fixture
+def report(tmp_path, monkeypatch):
+    """Saved results, an output directory and the list of outputs rendered so far"""
+    results_path = str(tmp_path / 'evaluation_results.json')
+    save_results('classification', CLASSIFICATION, results_path)
+    rendered = []
+
+    def spy(render):
+        def wrapper(inputs, path):
+            rendered.append(os.path.basename(path))
+            render(inputs, path)
+        return wrapper
+
+    for name, (section, keys, render) in OUTPUTS.items():
+        monkeypatch.setitem(OUTPUTS, name, (section, keys, spy(render)))
+
+    def build(**kwargs):
+        rendered.clear()
+        status = build_reports(results_path, str(tmp_path), workers=0, cache_dir=str(tmp_path / 'cache'), **kwargs)
+        return status, sorted(rendered)
+
+    return results_path, tmp_path, build
+
+
+def test_first_build_renders_outputs_with_results(report):
+    _, output_dir, build = report
+    status, rendered = build()
+    classification = sorted(name for name, (section, _, _) in OUTPUTS.items() if section == 'classification')
+    assert rendered == classification
+    assert status['risk_heatmap.png'] == 'no results'
+    for name in classification:
+        assert (output_dir / name).stat().st_size > 0
+
+
+def test_unchanged_inputs_are_skipped(report):
+    _, _, build = report
+    build()
+    status, rendered = build()
+    assert rendered == []
+    assert {state for name, state in status.items() if name != 'risk_heatmap.png'} == {'unchanged'}
+
+
+def test_changed_input_redraws_only_its_outputs(report):
+    results_path, _, build = report
+    build()
+    save_results('classification', {**CLASSIFICATION, 'accuracy': 0.9}, results_path)
+    status, rendered = build()
+    assert rendered == ['policy_insights.txt']
+    assert status['hourly_risk_pattern.png'] == 'unchanged'
+
+    save_results('risk_heatmap', RISK_HEATMAP, results_path)
+    assert build()[1] == ['risk_heatmap.png']
+
+
+def test_missing_output_or_render_version_redraws(report, monkeypatch):
+    _, output_dir, build = report
+    build()
+    os.remove(output_dir / 'confusion_matrix_binary.png')
+    assert build()[1] == ['confusion_matrix_binary.png']
+
+    monkeypatch.setattr(reporting, 'RENDER_VERSION', reporting.RENDER_VERSION + 1)
+    status, rendered = build(only=['hourly_risk_pattern.png'])
+    assert rendered == ['hourly_risk_pattern.png']
+    assert list(status) == ['hourly_risk_pattern.png']
+    assert build(force=True)[1] == sorted(name for name, (section, _, _) in OUTPUTS.items()
+                                          if section == 'classification')
@@ -0,0 +1,90 @@
+"""
+Tests for the /api/predict response cache
+
+Keys combine the model fingerprint with the canonical request body, so a
+model swap never serves the previous model's bytes; the LRU backend is
+bounded and honours its TTL.
+"""
+import pytest
+
+from api import routes
+from api.response_cache import LocalSharedStore, LRUBackend, ResponseCache, SharedBackend
+from api.telemetry import PREDICTIONS
+
+SCENARIO = {'road_type': 6, 'weather_conditions': 'Rain', 'speed_limit': 60,
+            'time_of_day': 'Night', 'junction_detail': 'Crossroads'}
+CALIBRATION = {'method': 'platt', 'x': [0.0, 0.5, 1.0], 'y': [0.05, 0.3, 0.95], 'threshold': 0.4}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ResponseCache(LRUBackend(16))
+    monkeypatch.setattr(routes, 'response_cache', cache)
+    return cache
+
+
+def test_keys_are_canonical_and_per_fingerprint():
+    cache = ResponseCache(LRUBackend(4), fingerprint='a')
+    reordered = dict(reversed(list(SCENARIO.items())))
+    assert cache.key(SCENARIO) == cache.key(reordered)
+    assert cache.key(SCENARIO) != cache.key(SCENARIO, 'b')
+    assert cache.key(SCENARIO) != cache.key({**SCENARIO, 'speed_limit': 70})
+
+
+def test_lru_backend_evicts_and_expires(monkeypatch):
+    backend = LRUBackend(2)
+    backend.set('a', b'1')
+    backend.set('b', b'2')
+    backend.get('a')
+    backend.set('c', b'3')
+    assert (backend.get('a'), backend.get('b'), backend.get('c')) == (b'1', None, b'3')
+    assert backend.stats.evictions == 1
+
+    now = [100.0]
+    monkeypatch.setattr('api.response_cache.time.monotonic', lambda: now[0])
+    backend = LRUBackend(2, ttl=5)
+    backend.set('a', b'1')
+    now[0] += 6
+    assert backend.get('a') is None
+
+
+def test_shared_backend_round_trip():
+    cache = ResponseCache(SharedBackend(LocalSharedStore(), ttl=60), fingerprint='a')
+    key = cache.key(SCENARIO)
+    assert cache.get(key) is None
+    cache.put(key, b'{}')
+    assert cache.get(key) == b'{}'
+    assert cache.snapshot()['size'] == 1
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_cache_hits_then_misses_after_model_swap(registry, client, cache, tmp_path, write_artifact):
+    first = client.post('/api/predict', json=SCENARIO)
+    second = client.post('/api/predict', json=SCENARIO)
+    assert (cache.stats.misses, cache.stats.hits) == (1, 1)
+    assert second.get_data() == first.get_data()
+
+    # Re-exported default: new fingerprint, so the same body is scored again
+    previous = registry.resolve().fingerprint
+    write_artifact(tmp_path, 'best_model', calibration=CALIBRATION)
+    assert registry.refresh()
+    assert registry.resolve().fingerprint != previous
+    swapped = client.post('/api/predict', json=SCENARIO)
+    assert swapped.status_code == 200
+    assert (cache.stats.misses, cache.stats.hits) == (2, 1)
+    assert swapped.get_json()['prediction'] != first.get_json()['prediction']
+
+
+def test_explained_responses_are_cached_separately(registry, client, cache):
+    plain = client.post('/api/predict', json=SCENARIO).get_json()
+    explained = client.post('/api/predict?explain=true', json=SCENARIO).get_json()
+    assert cache.stats.misses == 2
+    assert 'explanation' not in plain and 'explanation' in explained
+
+
+def test_cached_responses_are_counted_as_predictions(registry, client, cache):
+    risk_level = client.post('/api/predict', json=SCENARIO).get_json()['prediction']['risk_level']
+    before = PREDICTIONS._values.get((risk_level,), 0)
+    client.post('/api/predict', json=SCENARIO)
+    assert cache.stats.hits == 1
+    assert PREDICTIONS._values[(risk_level,)] == before + 1
@@ -0,0 +1,99 @@
+"""
+Tests for the bincount-based risk cubes
+
+Counts and high-risk rates must equal a pandas groupby over the same
+records, with missing values and -1 codes both counted under -1, whether
+the CSV is read in one chunk or many and whether batches are merged.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_aggregation import MISSING, WEEKDAYS, RiskAggregator, RiskCube, cube_name, hourly_risk
+from synthetic_data import generate_accident_data
+
+
+@pytest.fixture(scope='module')
+def accidents(tmp_path_factory):
+    """Path of a synthetic CSV with blanks and -1 codes, and its frame"""
+    df = generate_accident_data(4000, seed=5)
+    rng = np.random.default_rng(5)
+    df['road_type'] = df['road_type'].astype(object)
+    df.loc[rng.random(len(df)) < 0.05, 'road_type'] = np.nan
+    df.loc[rng.random(len(df)) < 0.05, 'junction_detail'] = -1
+    df.loc[rng.random(len(df)) < 0.05, 'time'] = np.nan
+    df.loc[rng.random(len(df)) < 0.02, 'date'] = np.nan
+    path = tmp_path_factory.mktemp('aggregation') / 'accidents.csv'
+    df.to_csv(path, index=False)
+    return str(path), pd.read_csv(path)
+
+
+def reference_dimensions(df):
+    """The cube dimensions computed independently with pandas, -1 where missing"""
+    dates = pd.to_datetime(df['date'], format='%d/%m/%Y', errors='coerce')
+    hours = pd.to_datetime(df['time'], format='%H:%M', errors='coerce').dt.hour
+    return pd.DataFrame({
+        'hour': hours.fillna(MISSING).astype(int),
+        'weekday': df['day_of_week'].map({name: i for i, name in enumerate(WEEKDAYS)}).fillna(MISSING).astype(int),
+        'month': dates.dt.month.fillna(MISSING).astype(int),
+        **{col: df[col].fillna(MISSING).astype(int) for col in ['road_type', 'weather_conditions', 'junction_detail']},
+        'high': df['risk_level'] == 'High',
+    })
+
+
+def assert_cube_matches_groupby(cube, reference):
+    expected = reference.groupby(cube.dims)['high'].agg(['size', 'sum'])
+    assert int(cube.total.sum()) == len(reference)
+    cells = np.argwhere(cube.total > 0)
+    assert len(cells) == len(expected)
+    for cell in cells:
+        key = tuple(int(levels[i]) for levels, i in zip(cube.levels, cell))
+        row = expected.loc[key if len(key) > 1 else key[0]]
+        assert cube.total[tuple(cell)] == row['size']
+        assert cube.high[tuple(cell)] == row['sum']
+        assert cube.rate[tuple(cell)] == pytest.approx(row['sum'] / row['size'])
+
+
+@pytest.mark.parametrize('chunksize', [None, 777])
+def test_cubes_match_pandas_groupby(accidents, chunksize):
+    path, df = accidents
+    reference = reference_dimensions(df)
+    assert (reference['road_type'] == MISSING).any() and (reference['junction_detail'] == MISSING).any()
+    aggregator = RiskAggregator()
+    assert aggregator.update_from_csv(path, chunksize) == len(df)
+    for dims in [('hour',), ('weekday',), ('month',), ('road_type',), ('hour', 'road_type'),
+                 ('weather_conditions', 'junction_detail'), ('weekday', 'month')]:
+        assert_cube_matches_groupby(aggregator.cubes[cube_name(dims)], reference)
+
+
+def test_merged_batches_equal_one_pass(accidents):
+    _, df = accidents
+    reference = reference_dimensions(df)
+    codes = {dim: reference[dim].to_numpy(dtype=np.int16) for dim in ['hour', 'road_type']}
+    whole = RiskCube(['hour', 'road_type']).add(codes, reference['high'])
+    half = len(df) // 2
+    first = RiskCube(['hour', 'road_type']).add({dim: c[:half] for dim, c in codes.items()}, reference['high'][:half])
+    second = RiskCube(['hour', 'road_type']).add({dim: c[half:] for dim, c in codes.items()}, reference['high'][half:])
+    merged = first.merge(second)
+    assert [l.tolist() for l in merged.levels] == [l.tolist() for l in whole.levels]
+    np.testing.assert_array_equal(merged.total, whole.total)
+    np.testing.assert_array_equal(merged.high, whole.high)
+
+
+def test_saved_aggregates_round_trip_and_reject_repeats(accidents, tmp_path):
+    path, _ = accidents
+    aggregator = RiskAggregator(crosstabs=False)
+    aggregator.update_from_csv(path)
+    output = str(tmp_path / 'risk_aggregates.json')
+    aggregator.save(output)
+    loaded = RiskAggregator.load(output)
+    for name, cube in aggregator.cubes.items():
+        np.testing.assert_array_equal(loaded.cubes[name].total, cube.total)
+    with pytest.raises(ValueError, match='already aggregated'):
+        loaded.update_from_csv(path)
+
+
+def test_hourly_risk_skips_missing_hours():
+    hours, rates = hourly_risk(np.array([0, 0, 5, np.nan]), np.array([True, False, True, True]))
+    assert hours.tolist() == [0, 5]
+    assert rates.tolist() == [0.5, 1.0]
@@ -0,0 +1,73 @@
+"""
+Tests for /api/risk-surface
+
+Every cell must equal the average over the matching input-grid scenarios,
+scored directly, with the fixed fields held and the others marginalized.
+"""
+import numpy as np
+import pytest
+
+from api import routes
+from api.prediction_table import grid_records
+
+GRID = grid_records(routes.GRID_OPTIONS)
+
+
+@pytest.fixture(scope='module')
+def scored_grid():
+    served = routes.registry.resolve(None)
+    raw, _, final = routes.score_batch(GRID, served=served)
+    return served, {'raw': np.asarray(raw), 'final': np.asarray(final)}
+
+
+def brute_force_surface(scored, threshold, x, y, fixed, value):
+    """(probability, high-risk share) per (x option, y option), averaged scenario by scenario"""
+    probability = np.zeros((len(routes.GRID_OPTIONS[x]), len(routes.GRID_OPTIONS[y])))
+    share = np.zeros_like(probability)
+    for i, x_option in enumerate(routes.GRID_OPTIONS[x]):
+        for j, y_option in enumerate(routes.GRID_OPTIONS[y]):
+            rows = [k for k, record in enumerate(GRID) if record[x] == x_option and record[y] == y_option
+                    and all(str(record[field]) == text for field, text in fixed.items())]
+            probability[i, j] = scored[value][rows].mean()
+            share[i, j] = (scored['final'][rows] > threshold).mean()
+    return probability, share
+
+
+@pytest.mark.parametrize('x, y, fixed, value', [
+    ('road_type', 'weather_conditions', {}, 'final'),
+    # y before x in the grid's field order: the axes must still come out as (x, y)
+    ('junction_detail', 'speed_limit', {'weather_conditions': 'Rain'}, 'final'),
+    ('time_of_day', 'road_type', {'speed_limit': '60', 'junction_detail': 'Crossroads'}, 'raw'),
+])
+def test_surface_matches_brute_force_average(client, scored_grid, x, y, fixed, value):
+    served, scored = scored_grid
+    response = client.get('/api/risk-surface', query_string={'x': x, 'y': y, 'value': value, **fixed})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['x'] == {'field': x, 'values': routes.GRID_OPTIONS[x]}
+    assert body['y'] == {'field': y, 'values': routes.GRID_OPTIONS[y]}
+    assert set(body['fixed']) == set(fixed)
+    assert body['averaged'] == [field for field in routes.GRID_OPTIONS if field not in fixed and field not in (x, y)]
+
+    probability, share = brute_force_surface(scored, served.high_risk_threshold, x, y, fixed, value)
+    np.testing.assert_allclose(body['probability'], probability, atol=1e-5)
+    np.testing.assert_allclose(body['high_risk_share'], share, atol=1e-6)
+
+
+@pytest.mark.parametrize('query', [
+    {'x': 'road_type', 'y': 'lighting'},
+    {'x': 'road_type', 'y': 'road_type'},
+    {'x': 'road_type'},
+    {'x': 'road_type', 'y': 'speed_limit', 'weather_conditions': 'Hail'},
+    {'x': 'road_type', 'y': 'speed_limit', 'value': 'adjusted'},
+])
+def test_surface_rejects_invalid_queries(client, query):
+    response = client.get('/api/risk-surface', query_string=query)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_surface_unknown_version(client):
+    response = client.get('/api/risk-surface', query_string={'x': 'road_type', 'y': 'speed_limit',
+                                                             'model_version': '999'})
+    assert response.status_code == 404
@@ -0,0 +1,73 @@
+"""
+Tests for the Prometheus /metrics endpoint
+
+Checks the text exposition format of each metric type and that a
+/api/predict request updates the request, stage and prediction series.
+"""
+import re
+
+from api import routes
+from api.response_cache import LRUBackend, ResponseCache
+from api.telemetry import Counter, Histogram, render_metrics
+
+SCENARIO = {'road_type': 6, 'weather_conditions': 'Rain', 'speed_limit': 60,
+            'time_of_day': 'Night', 'junction_detail': 'Crossroads'}
+# name{labels} value, as in the exposition format
+SAMPLE = re.compile(r'^[a-z_]+(\{([a-z_]+="[^"]*",?)+\})? -?[0-9.e+-]+$')
+
+
+def series(text, name, **labels):
+    """Value of one sample in rendered metrics, or 0 when absent"""
+    wanted = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    for line in text.splitlines():
+        if line.startswith(f'{name}{{{wanted}}} ' if labels else f'{name} '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+def test_counter_and_histogram_format():
+    counter = Counter('test_total', 'A counter', ['kind'])
+    counter.inc('a"b')
+    counter.inc('a"b', amount=2)
+    assert counter.render() == ['# HELP test_total A counter', '# TYPE test_total counter',
+                                'test_total{kind="a\\"b"} 3']
+
+    histogram = Histogram('test_seconds', 'A histogram', ['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, 'fit')
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{stage="fit",le="0.1"} 1',
+        'test_seconds_bucket{stage="fit",le="1.0"} 2',
+        'test_seconds_bucket{stage="fit",le="+Inf"} 3',
+        'test_seconds_sum{stage="fit"} 5.55',
+        'test_seconds_count{stage="fit"} 3',
+    ]
+
+
+def test_metrics_after_a_prediction(client, monkeypatch):
+    # Uncached, so every stage runs
+    monkeypatch.setattr(routes, 'response_cache', None)
+    before = client.get('/metrics').get_data(as_text=True)
+    risk_level = client.post('/api/predict', json=SCENARIO).get_json()['prediction']['risk_level']
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+
+    for line in text.splitlines():
+        assert line.startswith('# ') or SAMPLE.match(line), line
+    assert series(text, 'risk_api_requests_total', endpoint='api.predict', status=200) == \
+        series(before, 'risk_api_requests_total', endpoint='api.predict', status=200) + 1
+    assert series(text, 'risk_api_predictions_total', risk_level=risk_level) == \
+        series(before, 'risk_api_predictions_total', risk_level=risk_level) + 1
+    assert series(text, 'risk_api_request_seconds_count', endpoint='api.predict') == \
+        series(before, 'risk_api_request_seconds_count', endpoint='api.predict') + 1
+    assert series(text, 'risk_api_stage_seconds_count', stage='inference') == \
+        series(before, 'risk_api_stage_seconds_count', stage='inference') + 1
+
+
+def test_response_cache_counters():
+    cache = ResponseCache(LRUBackend(4), fingerprint='a')
+    cache.get(cache.key(SCENARIO))
+    text = render_metrics(cache)
+    assert series(text, 'risk_api_response_cache_misses_total') == 1
+    assert '# TYPE risk_api_response_cache_hits_total counter' in text
@@ -0,0 +1,231 @@
+"""
+Parallel hyperparameter search for the XGBoost and LightGBM risk models
+
+Runs a successive-halving random search (HalvingRandomSearchCV) per model
+family across a process pool. SMOTE sits inside the CV folds so validation
+folds are never oversampled. Workers share the memory-mapped training matrix
+from the dataset cache (data_loader.prepare_training_data) instead of copies.
+
+Among the final-round candidates, the cheapest to evaluate (tree count x
+depth) whose ROC AUC is within AUC_TOLERANCE of the best is selected, then
+compared with the default configuration on the holdout set. The same rule
+applied to the XGBoost trials alone picks the parameters Classification.py
+trains with, recorded separately when another family wins overall. Results
+for every trial are written to tuning_results.json:
+    python tuning.py [--models xgboost lightgbm] [--candidates 64] [--n-jobs -1]
+
+Train with the selected XGBoost parameters via
+    TUNED_PARAMS=tuning_results.json python Classification.py
+"""
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+import xgboost as xgb
+import lightgbm as lgb
+from scipy.stats import loguniform, randint, uniform
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingRandomSearchCV, StratifiedKFold
+from sklearn.metrics import roc_auc_score
+from imblearn.over_sampling import SMOTE
+from imblearn.pipeline import Pipeline as ImbPipeline
+
+from data_loader import DATA_PATH, prepare_training_data
+from model_params import BASELINE_XGB_PARAMS, SMOTE_SAMPLING_STRATEGY, TUNING_RESULTS_PATH
+
+RESULTS_PATH = TUNING_RESULTS_PATH
+AUC_TOLERANCE = 0.002
+
+# Each worker process fits one model at a time (n_jobs=1) to avoid oversubscription
+MODELS = {
+    'xgboost': (
+        lambda: xgb.XGBClassifier(objective='binary:logistic', tree_method='hist', n_jobs=1),
+        {
+            'n_estimators': randint(20, 201),
+            'max_depth': randint(2, 7),
+            'learning_rate': loguniform(0.03, 0.3),
+            'subsample': uniform(0.6, 0.4),
+            'colsample_bytree': uniform(0.6, 0.4),
+            'min_child_weight': randint(1, 10),
+            'scale_pos_weight': [1, 2],
+        },
+    ),
+    'lightgbm': (
+        lambda: lgb.LGBMClassifier(subsample_freq=1, n_jobs=1, verbose=-1),
+        {
+            'n_estimators': randint(20, 201),
+            'num_leaves': randint(4, 64),
+            'learning_rate': loguniform(0.03, 0.3),
+            'subsample': uniform(0.6, 0.4),
+            'colsample_bytree': uniform(0.6, 0.4),
+            'min_child_samples': randint(10, 100),
+            'scale_pos_weight': [1, 2],
+        },
+    ),
+}
+
+
+def inference_cost(model_name, params):
+    """Approximate per-row prediction cost: trees x nodes visited per tree"""
+    if model_name == 'lightgbm':
+        depth = math.ceil(math.log2(params['num_leaves']))
+    else:
+        depth = params['max_depth']
+    return params['n_estimators'] * depth
+
+
+def build_pipeline(model, random_state=42):
+    """SMOTE followed by the classifier, so oversampling only sees training folds"""
+    return ImbPipeline([
+        ('smote', SMOTE(sampling_strategy=SMOTE_SAMPLING_STRATEGY, random_state=random_state)),
+        ('model', model),
+    ])
+
+
+def _to_json(value):
+    """Convert numpy scalars in search results to plain Python values"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def search_model(model_name, X, y, n_candidates=64, cv=3, n_jobs=-1, random_state=42):
+    """
+    Successive-halving search for one model family
+    Returns the per-trial records (one per candidate and halving round)
+    """
+    make_model, space = MODELS[model_name]
+    search = HalvingRandomSearchCV(
+        build_pipeline(make_model(), random_state),
+        {f'model__{name}': dist for name, dist in space.items()},
+        n_candidates=n_candidates,
+        factor=3,
+        resource='n_samples',
+        min_resources='exhaust',
+        scoring='roc_auc',
+        cv=StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state),
+        refit=False,
+        n_jobs=n_jobs,
+        random_state=random_state,
+    )
+    start = time.perf_counter()
+    search.fit(X, y)
+    print(f"{model_name}: {len(search.cv_results_['params'])} trials "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    results = search.cv_results_
+    trials = []
+    for i, params in enumerate(results['params']):
+        params = {name.replace('model__', ''): _to_json(value) for name, value in params.items()}
+        trials.append({
+            'model': model_name,
+            'round': int(results['iter'][i]),
+            'n_samples': int(results['n_resources'][i]),
+            'params': params,
+            'roc_auc': float(results['mean_test_score'][i]),
+            'roc_auc_std': float(results['std_test_score'][i]),
+            'fit_time_s': float(results['mean_fit_time'][i]),
+            'score_time_s': float(results['mean_score_time'][i]),
+            'wall_time_s': float((results['mean_fit_time'][i] + results['mean_score_time'][i]) * cv),
+            'inference_cost': inference_cost(model_name, params),
+        })
+    return trials
+
+
+def select_trial(trials, tolerance=AUC_TOLERANCE, model=None):
+    """Cheapest final-round trial (of one model family, if given) whose ROC AUC is within tolerance of the best"""
+    if model is not None:
+        trials = [trial for trial in trials if trial['model'] == model]
+    final = []
+    for model_name in {trial['model'] for trial in trials}:
+        rounds = [trial for trial in trials if trial['model'] == model_name]
+        last_round = max(trial['round'] for trial in rounds)
+        final.extend(trial for trial in rounds if trial['round'] == last_round)
+    best_auc = max(trial['roc_auc'] for trial in final)
+    eligible = [trial for trial in final if trial['roc_auc'] >= best_auc - tolerance]
+    return min(eligible, key=lambda trial: (trial['inference_cost'], -trial['roc_auc']))
+
+
+def evaluate(model, X, y, X_holdout, y_holdout, random_state=42):
+    """Fit with SMOTE on the main split, then report holdout ROC AUC and prediction time"""
+    pipeline = build_pipeline(model, random_state)
+    start = time.perf_counter()
+    pipeline.fit(X, y)
+    fit_time = time.perf_counter() - start
+
+    fitted = pipeline.named_steps['model']
+    start = time.perf_counter()
+    proba = fitted.predict_proba(X_holdout)[:, 1]
+    predict_time = time.perf_counter() - start
+    return {
+        'roc_auc': float(roc_auc_score(y_holdout, proba)),
+        'fit_time_s': fit_time,
+        'predict_us_per_row': predict_time / max(len(X_holdout), 1) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--models', nargs='+', choices=sorted(MODELS), default=sorted(MODELS))
+    parser.add_argument('--candidates', type=int, default=64)
+    parser.add_argument('--cv', type=int, default=3)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--output', default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    print("Loading training data...")
+    dataset = prepare_training_data(args.data, test_size=0.15, random_state=42)
+    X, X_holdout = dataset['X_main'], dataset['X_holdout']
+    y = (dataset['y_main'] == 0).astype(int)  # 1 for high-risk (class 0)
+    y_holdout = (dataset['y_holdout'] == 0).astype(int)
+
+    start = time.perf_counter()
+    trials = []
+    for model_name in args.models:
+        print(f"\nSearching {model_name} parameters...")
+        trials.extend(search_model(model_name, X, y, args.candidates, args.cv, args.n_jobs))
+    search_time = time.perf_counter() - start
+
+    selected = select_trial(trials)
+    print(f"\nSelected {selected['model']} (CV ROC AUC {selected['roc_auc']:.4f}, "
+          f"cost {selected['inference_cost']}): {selected['params']}")
+    # Classification.py trains XGBoost, so keep the best XGBoost trial even when another family wins
+    selected_xgboost = None
+    if selected['model'] != 'xgboost' and 'xgboost' in args.models:
+        selected_xgboost = select_trial(trials, model='xgboost')
+        print(f"Selected XGBoost for Classification.py (CV ROC AUC {selected_xgboost['roc_auc']:.4f}, "
+              f"cost {selected_xgboost['inference_cost']}): {selected_xgboost['params']}")
+
+    print("\nComparing with the default configuration on the holdout set...")
+    make_model, _ = MODELS[selected['model']]
+    selected_holdout = evaluate(make_model().set_params(**selected['params']), X, y, X_holdout, y_holdout)
+    baseline_holdout = evaluate(xgb.XGBClassifier(**BASELINE_XGB_PARAMS), X, y, X_holdout, y_holdout)
+    baseline_cost = inference_cost('xgboost', BASELINE_XGB_PARAMS)
+    compared = [('Baseline', baseline_cost, baseline_holdout), ('Selected', selected['inference_cost'], selected_holdout)]
+    if selected_xgboost is not None:
+        xgboost_holdout = evaluate(MODELS['xgboost'][0]().set_params(**selected_xgboost['params']),
+                                   X, y, X_holdout, y_holdout)
+        selected_xgboost = {**selected_xgboost, 'holdout': xgboost_holdout}
+        compared.append(('XGBoost', selected_xgboost['inference_cost'], xgboost_holdout))
+    for name, cost, result in compared:
+        print(f"{name}: ROC AUC {result['roc_auc']:.4f}, cost {cost}, "
+              f"{result['predict_us_per_row']:.2f} us/row")
+    selected = {**selected, 'holdout': selected_holdout}
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'search_wall_time_s': search_time,
+            'n_trials': len(trials),
+            'selected': selected,
+            'xgboost': selected if selected['model'] == 'xgboost' else selected_xgboost,
+            'baseline': {'model': 'xgboost', 'params': BASELINE_XGB_PARAMS,
+                         'inference_cost': baseline_cost, 'holdout': baseline_holdout},
+            'trials': trials,
+        }, f, indent=2)
+    print(f"\nTuning results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()